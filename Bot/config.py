@@ -24,6 +24,42 @@ class Config:
     # Bot Settings
     PORT = int(os.environ.get("PORT", "8080"))
     MAX_FILE_SIZE = 2000 * 1024 * 1024  # 2GB for normal, 4GB+ with premium session
+    MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", "4"))  # Rename jobs running at once
+    SCRATCH_DIR = os.environ.get("SCRATCH_DIR", "downloads")  # Temp file volume; point at tmpfs/NVMe if available
+    MEMORY_FILE_THRESHOLD = int(os.environ.get("MEMORY_FILE_THRESHOLD", str(20 * 1024 * 1024)))  # Files up to this size skip the disk
+    MEMORY_BUDGET_MB = int(os.environ.get("MEMORY_BUDGET_MB", "256"))  # Total RAM for in-memory files
+    SCRATCH_QUOTA_MB = int(os.environ.get("SCRATCH_QUOTA_MB", "0"))  # Scratch size the janitor trims orphans to, 0 = no quota
+    JANITOR_INTERVAL = int(os.environ.get("JANITOR_INTERVAL", "600"))  # Seconds between orphan sweeps
+    JANITOR_GRACE = int(os.environ.get("JANITOR_GRACE", "1800"))  # Orphans younger than this are kept
+    PARTIAL_KEEP_HOURS = int(os.environ.get("PARTIAL_KEEP_HOURS", "24"))  # Incomplete downloads kept for resuming
+    DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", "5"))  # Attempts without progress before a download fails
+    UPLOAD_RETRIES = int(os.environ.get("UPLOAD_RETRIES", "5"))  # Attempts per upload part (and per send) before giving up
+    UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", "4"))  # Parts of one upload in flight at once
+    FS_WORKERS = int(os.environ.get("FS_WORKERS", "4"))  # Threads for blocking filesystem calls
+    FS_SLOW_SECONDS = float(os.environ.get("FS_SLOW_SECONDS", "1"))  # Filesystem calls slower than this are logged
+    BACKGROUND_DELETE_SIZE = int(os.environ.get("BACKGROUND_DELETE_SIZE", str(256 * 1024 * 1024)))  # Files this big are deleted in the background
+    DISK_FREE_MARGIN_MB = int(os.environ.get("DISK_FREE_MARGIN_MB", "512"))  # Scratch space never handed to jobs
+    DISK_STAGE_MULTIPLIER = float(os.environ.get("DISK_STAGE_MULTIPLIER", "2"))  # Copies of a file alive at once (original + .processed)
+    
+    # FFmpeg Sandbox (0 disables a limit)
+    FFMPEG_TIMEOUT = int(os.environ.get("FFMPEG_TIMEOUT", "3600"))  # Wall-clock seconds per ffmpeg run
+    FFPROBE_TIMEOUT = int(os.environ.get("FFPROBE_TIMEOUT", "60"))  # Wall-clock seconds per ffprobe run
+    THUMBNAIL_TIMEOUT = int(os.environ.get("THUMBNAIL_TIMEOUT", "300"))  # Wall-clock seconds per thumbnail grab
+    FFMPEG_MAX_MEMORY_MB = int(os.environ.get("FFMPEG_MAX_MEMORY_MB", "4096"))  # Peak RSS per child (address space for ffprobe)
+    FFMPEG_MAX_CPU_SECONDS = int(os.environ.get("FFMPEG_MAX_CPU_SECONDS", "7200"))  # RLIMIT_CPU per child
+    
+    # Media Tools
+    SCREENSHOT_COUNT = int(os.environ.get("SCREENSHOT_COUNT", "6"))  # Default frames for /screenshots
+    SCREENSHOT_CONCURRENCY = int(os.environ.get("SCREENSHOT_CONCURRENCY", str(os.cpu_count() or 2)))
+    SAMPLE_DURATION = int(os.environ.get("SAMPLE_DURATION", "30"))  # Default /sample length in seconds
+    AUTO_THUMBNAIL = os.environ.get("AUTO_THUMBNAIL", "True").lower() == "true"  # Frame thumb when none set
+    MEDIA_CACHE_SIZE = int(os.environ.get("MEDIA_CACHE_SIZE", "2048"))  # In-process probe cache entries
+    MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", "100"))  # Files accepted by one /batch run
+    SPLIT_SIZE = int(os.environ.get("SPLIT_SIZE", str(1950 * 1024 * 1024)))  # Part size when splitting large files
+    ARCHIVE_WORKERS = int(os.environ.get("ARCHIVE_WORKERS", "2"))  # Threads compressing/extracting archives
+    TRANSCODE_WORKERS = int(os.environ.get("TRANSCODE_WORKERS", "0"))  # Encoder processes, 0 = all cores
+    TRANSCODE_PRESET = os.environ.get("TRANSCODE_PRESET", "veryfast")  # x264/x265 speed preset
+    TRANSCODE_MIN_SEGMENT = int(os.environ.get("TRANSCODE_MIN_SEGMENT", "20"))  # Seconds per encode segment
     
     # Customization
     BOT_PIC = os.environ.get("BOT_PIC", "")  # Optional bot picture URL
@@ -28,6 +28,7 @@ Send me any file and I'll guide you through renaming it beautifully.
 • Send any document, video, or audio file
 • Reply with your desired filename
 • Choose upload format (document/video/audio)
+• Albums get one prompt: reply with a template and they come back as an album
 
 **Caption Management:**
 • `/set_caption` - Create custom caption templates
@@ -50,6 +51,18 @@ Send me any file and I'll guide you through renaming it beautifully.
 • `/metadata` - Configure file metadata
 • Add author and title information
 • Enable/disable metadata embedding
+• `/tracks` - Keep only chosen audio/subtitle languages
+• `/autorename` - Rename files from a template without the prompt
+• `/batch` - Rename many files (or a channel range) with one template
+• `/archive` - Pack many files into one zip/tar
+• `/merge` - Join split parts into one video without re-encoding
+
+**Media Tools:**
+• `/screenshots [count]` - Reply to a video for screenshots and a contact sheet
+• `/sample [seconds]` - Reply to a video for a short preview clip
+• `/compress [size_mb] [h264|hevc]` - Reply to a video to re-encode it
+• `/extractaudio` - Reply to a video to pull out its audio track
+• `/extract` - Reply to a zip/tar to unpack it
 
 **General Commands:**
 • `/settings` - View all your settings
@@ -93,7 +106,7 @@ Made with dedication for file organization enthusiasts."""
 **Current Details:**
 • **Name:** `{filename}`
 • **Size:** `{filesize}`
-• **Type:** {filetype}
+• **Type:** {filetype}{media_details}
 
 **Instructions:**
 Reply to this message with your desired filename. I'll handle the rest with artistic precision.
@@ -128,7 +141,7 @@ I encountered an issue while downloading your file:
 
 *"Sometimes even the best plans encounter obstacles."*
 
-Please try again or contact support if the issue persists."""
+Send the file again to retry — what was already downloaded is kept, so it picks up where it stopped."""
 
     ERROR_UPLOAD_FAILED = """❌ **Upload Failed**
 
@@ -235,7 +248,7 @@ Metadata adds information directly into your files that can be read by media pla
 • **Enable/Disable** - Toggle metadata embedding
 
 **Supported Files:**
-Video and audio files support metadata embedding.
+Video, audio and PDF files support metadata embedding.
 
 **Usage:**
 Use `/metadata` command to access the configuration menu.
@@ -4,6 +4,11 @@ import logging
 from pyrogram import Client, __version__
 from pyrogram.raw.all import layer
 from Bot.config import Config
+from utils.transcode import shutdown_pool
+from utils.janitor import janitor
+from utils.uploads import ResumableUploadMixin
+from utils.journal import job_journal
+from plugins.rename import resume_interrupted_jobs
 from datetime import datetime
 import pytz
 
@@ -19,7 +24,7 @@ logging.basicConfig(
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-class DazaiRenameBot(Client):
+class DazaiRenameBot(ResumableUploadMixin, Client):
     def __init__(self):
         super().__init__(
             name="DazaiRenameBot",
@@ -77,12 +82,28 @@ class DazaiRenameBot(Client):
             except:
                 logger.warning("Could not send to log channel")
         
+        # Pick up rename jobs a crash or deploy cut short; this claims their
+        # files before the scratch sweep below could remove them
+        resumed = await resume_interrupted_jobs(self)
+        if resumed:
+            logger.info(f"Resumed {resumed} interrupted rename jobs")
+        
+        # Clear scratch files left by a previous run, then keep sweeping
+        janitor.start(self)
+        
         logger.info(f"🎭 {me.first_name} is ready for double suicide... I mean, renaming files!")
         
     async def stop(self, *args):
+        # Jobs torn down from here on keep their journal entry and files
+        job_journal.suspend()
+        
         if hasattr(self, 'premium_client') and self.premium_client:
             await self.premium_client.stop()
         
+        # Stop idle encoder processes
+        shutdown_pool()
+        janitor.stop()
+        
         if Config.ADMIN_ID:
             try:
                 await self.send_message(
@@ -5,7 +5,7 @@ from pyrogram.enums import ParseMode
 from Bot.config import Config, set_env_var, get_env_var, list_env_keys
 from Bot.messages import Messages
 from utils.database import db
-from utils.helpers import humanbytes, get_random_quote
+from utils.helpers import humanbytes, get_random_quote, fs_stats_summary
 import time
 import psutil
 import logging
@@ -334,6 +334,9 @@ async def admin_stats_command(client: Client, message: Message):
    └ `{humanbytes(disk.used)} / {humanbytes(disk.total)}`
 🖥️ **System Uptime:** `{str(system_uptime).split('.')[0]}`
 
+**🗂 Filesystem Calls:**
+{fs_stats_summary(limit=5)}
+
 *"{get_random_quote('success')}"*"""
 
         keyboard = [
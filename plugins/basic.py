@@ -405,7 +405,7 @@ async def broadcast_command(client: Client, message: Message):
     broadcast_msg = message.reply_to_message
     
     try:
-        users = await db.get_all_users()
+        users = db.get_all_users()
         total_users = await db.total_users_count()
         
         success = 0
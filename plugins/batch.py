@@ -0,0 +1,645 @@
+# plugins/batch.py - Pipelined Batch Renaming with Dazai Theme
+from pyrogram import Client, filters, StopTransmission
+from pyrogram.types import Message
+from pyrogram.enums import ParseMode
+import asyncio
+import os
+import re
+import time
+import logging
+from typing import List, Optional
+from utils.database import db
+from utils.helpers import (
+    add_prefix_suffix,
+    sanitize_filename,
+    get_random_quote,
+    progress_for_pyrogram,
+    ffmpeg_progress,
+    humanbytes,
+    remove_path,
+    get_file_size
+)
+from utils.autorename import compile_rename_template, render_auto_name, RenameTemplateError
+from utils.pipeline import OrderedPipeline, PIPELINE_STAGES
+from utils.media_cache import media_cache
+from utils.jobs import job_registry, JobCancelled
+from utils.splitter import PartUploader, stream_chunks, part_name
+from utils.archives import ArchiveBuilder, PartWriter, should_compress
+from utils.ffmpeg import ffmpeg_handler
+from utils.scratch import job_workspace
+from plugins.rename import RenameSession, process_file_rename, pick_upload_format
+from Bot.config import Config
+from Bot.messages import Messages
+
+logger = logging.getLogger(__name__)
+
+# t.me/c/<internal id>/<message id> or t.me/<username>/<message id>
+MESSAGE_LINK = re.compile(r'(?:https?://)?t\.me/(?:c/(?P<chat_id>\d+)|(?P<username>[A-Za-z0-9_]{4,}))/(?P<message_id>\d+)')
+
+# Telegram returns at most this many messages per get_messages call
+GET_MESSAGES_LIMIT = 200
+
+# Room left per archive entry for headers when predicting a single-part archive
+ARCHIVE_ENTRY_OVERHEAD = 64 * 1024
+
+class BatchSession:
+    """Files collected for one /batch, /archive or /merge run (``mode`` is the command name)"""
+    def __init__(self, user_id: int, chat_id: int, template: Optional[str], status_msg: Message,
+                 mode: str = "batch", output_name: Optional[str] = None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.template = template
+        self.status_msg = status_msg
+        self.mode = mode
+        self.output_name = output_name
+        self.messages: List[Message] = []
+        self.running = False
+        self.cancelled = False
+
+# Open and running batches keyed by "<chat_id>_<user_id>"
+batch_sessions = {}
+
+def batch_media(message: Message):
+    return message.document or message.video or message.audio
+
+async def resolve_template(user_id: int, template: str) -> Optional[str]:
+    """Batch template from the command, else the user's auto-rename template"""
+    if template:
+        compile_rename_template(template)
+        return template
+    auto = await db.get_auto_rename(user_id)
+    return auto["template"] or None
+
+async def fetch_message_range(client: Client, first_link: str, last_link: str) -> List[Message]:
+    """Media messages between two links of the same channel, oldest first"""
+    first, last = MESSAGE_LINK.search(first_link), MESSAGE_LINK.search(last_link)
+    if not first or not last:
+        raise ValueError("Send two message links like `https://t.me/c/123456/10`")
+
+    def chat_of(match):
+        return int(f"-100{match.group('chat_id')}") if match.group('chat_id') else match.group('username')
+
+    chat = chat_of(first)
+    if chat != chat_of(last):
+        raise ValueError("Both links must point to the same channel")
+
+    start, end = sorted((int(first.group('message_id')), int(last.group('message_id'))))
+    if end - start + 1 > Config.MAX_BATCH_FILES * 2:
+        raise ValueError(f"That range is too large, batches hold up to {Config.MAX_BATCH_FILES} files")
+
+    messages = []
+    ids = list(range(start, end + 1))
+    for offset in range(0, len(ids), GET_MESSAGES_LIMIT):
+        fetched = await client.get_messages(chat, ids[offset:offset + GET_MESSAGES_LIMIT])
+        messages.extend(msg for msg in fetched if msg and not msg.empty and batch_media(msg))
+
+    return messages[:Config.MAX_BATCH_FILES]
+
+async def update_status(batch: BatchSession, text: str):
+    try:
+        await batch.status_msg.edit_text(text, parse_mode=ParseMode.MARKDOWN)
+    except Exception as e:
+        logger.debug(f"Batch status update failed: {e}")
+
+async def run_batch(client: Client, batch: BatchSession):
+    """
+    Rename every collected file as one pipeline
+
+    Each stage (download, process, upload) holds one file at a time, so
+    up to three files are in flight and the total time approaches that of
+    the slowest stage. Uploads keep the order the files were given in.
+    """
+    batch.running = True
+    # Forwarded files can arrive out of order; uploads follow the original order
+    batch.messages.sort(key=lambda msg: (msg.chat.id, msg.id))
+    total = len(batch.messages)
+    user_data = await db.get_user_data(batch.user_id)
+    auto = await db.get_auto_rename(batch.user_id)
+
+    pipeline = OrderedPipeline()
+    window = asyncio.Semaphore(len(PIPELINE_STAGES))
+    results = {"done": 0, "failed": 0, "unmatched": 0}
+
+    async def rename_one(index: int, message: Message, ticket):
+        try:
+            file = batch_media(message)
+            original_name = file.file_name or f"file_{index}"
+            new_name = render_auto_name(batch.template, original_name, await media_cache.lookup(file), index)
+            if not new_name:
+                results["unmatched"] += 1
+                new_name = original_name
+
+            session = RenameSession(batch.user_id, message, batch.chat_id)
+            session.new_filename = add_prefix_suffix(
+                sanitize_filename(new_name), user_data.get("prefix", ""), user_data.get("suffix", "")
+            )
+            session.status = "processing"
+
+            progress_msg = await client.send_message(
+                batch.chat_id,
+                f"📦 **Batch File {index}/{total}**\n\n`{session.new_filename}`\n\n"
+                f"*\"{get_random_quote('waiting')}\"*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+
+            success = await process_file_rename(
+                client, session, pick_upload_format(message, auto["format"]), progress_msg, ticket
+            )
+            if success:
+                results["done"] += 1
+                try:
+                    await progress_msg.delete()
+                except Exception:
+                    pass
+            else:
+                results["failed"] += 1
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {e}")
+            results["failed"] += 1
+        finally:
+            ticket.finish()
+            window.release()
+
+        await update_status(
+            batch,
+            f"📦 **Batch Running**\n\n"
+            f"**Done:** `{results['done']}/{total}`\n"
+            f"**Failed:** `{results['failed']}`"
+        )
+
+    tasks = []
+    for index, message in enumerate(batch.messages, 1):
+        # Only as many files as there are stages are in flight at once
+        await window.acquire()
+        if batch.cancelled:
+            window.release()
+            break
+        tasks.append(asyncio.create_task(rename_one(index, message, pipeline.ticket())))
+
+    await asyncio.gather(*tasks)
+    batch_sessions.pop(f"{batch.chat_id}_{batch.user_id}", None)
+
+    skipped = total - len(tasks)
+    summary = (
+        f"{'🛑 **Batch Cancelled**' if batch.cancelled else '✅ **Batch Complete**'}\n\n"
+        f"**Renamed:** `{results['done']}/{total}`\n"
+        f"**Failed:** `{results['failed']}`\n"
+    )
+    if skipped:
+        summary += f"**Skipped:** `{skipped}`\n"
+    if results["unmatched"]:
+        summary += f"**Kept original name (template did not match):** `{results['unmatched']}`\n"
+    summary += f"\n*\"{get_random_quote('success' if not results['failed'] else 'error')}\"*"
+    await update_status(batch, summary)
+
+async def cancel_batch(message: Message, key: str):
+    """Discard a collecting batch or stop a running one"""
+    batch = batch_sessions.get(key)
+    if not batch:
+        return await message.reply_text("❌ **No Active Batch**", parse_mode=ParseMode.MARKDOWN)
+
+    batch.cancelled = True
+    if batch.running:
+        for job in job_registry.user_jobs(batch.user_id):
+            if job.chat_id == batch.chat_id:
+                job_registry.cancel(job)
+    else:
+        batch_sessions.pop(key, None)
+    await message.reply_text(
+        "🛑 **Batch Cancelled**\n\n"
+        f"*\"{get_random_quote('error')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def end_batch(client: Client, message: Message, batch: BatchSession):
+    """Run the collected files as a rename batch, an archive or a merge"""
+    if not batch.messages:
+        return await message.reply_text(
+            f"❌ **No Files Collected**\n\nSend or forward files first, or `/{batch.mode} cancel`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    if batch.mode == "archive":
+        return await run_archive(client, batch)
+    if batch.mode == "merge":
+        return await run_merge(client, batch)
+    return await run_batch(client, batch)
+
+@Client.on_message(filters.command("batch") & (filters.private | filters.group))
+async def batch_command(client: Client, message: Message):
+    user_id = message.from_user.id
+
+    # Check group mention
+    if message.chat.type.name != "PRIVATE":
+        bot_me = await client.get_me()
+        if not (f"@{bot_me.username}" in (message.text or "") or
+                (message.reply_to_message and message.reply_to_message.from_user.is_self)):
+            return
+
+    key = f"{message.chat.id}_{user_id}"
+    args = message.command[1:]
+    option = args[0].lower() if args else ""
+    batch = batch_sessions.get(key)
+
+    if not args:
+        return await message.reply_text(
+            "📦 **Batch Rename**\n\n"
+            "Rename many files with one template. Files are downloaded, processed "
+            "and uploaded as a pipeline and arrive in the order they were sent.\n\n"
+            "**Usage:**\n"
+            "• `/batch start [template]` - Start collecting files (send or forward them)\n"
+            "• `/batch end` - Rename the collected files\n"
+            "• `/batch <first link> <last link>` - Rename a range of channel posts\n"
+            "• `/batch cancel` - Discard or stop the batch\n\n"
+            "Without a template your `/autorename` template is used.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    if option == "cancel":
+        return await cancel_batch(message, key)
+
+    if batch:
+        if option == "end" and not batch.running:
+            return await end_batch(client, message, batch)
+        return await message.reply_text(
+            "⏳ **A Batch Is Already Open**\n\nFinish it with `/batch end` or `/batch cancel`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    if option == "end":
+        return await message.reply_text("❌ **No Active Batch**", parse_mode=ParseMode.MARKDOWN)
+
+    link_range = option != "start"
+    template_text = ""
+    if not link_range and len(args) > 1:
+        template_text = message.text.split(None, 2)[2].strip()
+    try:
+        template = await resolve_template(user_id, template_text)
+    except RenameTemplateError as e:
+        return await message.reply_text(
+            f"❌ **Invalid Template**\n\n{e}\n\nSend `/autorename` to see the available fields.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    if not template:
+        return await message.reply_text(
+            "❌ **No Template**\n\nUse `/batch start <template>` or set one with `/autorename`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    if not link_range:
+        status_msg = await message.reply_text(
+            f"📦 **Batch Started**\n\n"
+            f"**Template:** `{template}`\n\n"
+            f"Send or forward up to {Config.MAX_BATCH_FILES} files, then `/batch end`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        batch_sessions[key] = BatchSession(user_id, message.chat.id, template, status_msg)
+        return
+
+    if len(args) < 2:
+        return await message.reply_text(
+            "❌ **Two Links Needed**\n\nSend the links of the first and last post of the range.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    status_msg = await message.reply_text("🔎 **Fetching Posts...**", parse_mode=ParseMode.MARKDOWN)
+    try:
+        messages = await fetch_message_range(client, args[0], args[1])
+    except ValueError as e:
+        return await status_msg.edit_text(f"❌ **Invalid Range**\n\n{e}", parse_mode=ParseMode.MARKDOWN)
+    except Exception as e:
+        logger.error(f"Batch range fetch failed: {e}")
+        return await status_msg.edit_text(
+            "❌ **Cannot Read That Channel**\n\nMake sure I am a member of it.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    if not messages:
+        return await status_msg.edit_text("❌ **No Files In That Range**", parse_mode=ParseMode.MARKDOWN)
+
+    batch = BatchSession(user_id, message.chat.id, template, status_msg)
+    batch.messages = messages
+    batch_sessions[key] = batch
+    await update_status(batch, f"📦 **Batch Running**\n\n**Files:** `{len(messages)}`")
+    await run_batch(client, batch)
+
+# Archives
+async def run_archive(client: Client, batch: BatchSession):
+    """
+    Stream every collected file into one zip/tar and upload it
+
+    Entries are written straight from the download into archive parts on
+    the archive thread pool; each part uploads as soon as it is full, so
+    there is never a full intermediate copy of the files or the archive.
+    """
+    batch.running = True
+    batch.messages.sort(key=lambda msg: (msg.chat.id, msg.id))
+    total = len(batch.messages)
+    kind = "tar" if batch.output_name.lower().endswith(".tar") else "zip"
+
+    user_data = await db.get_user_data(batch.user_id)
+    auto = await db.get_auto_rename(batch.user_id)
+    template = auto["template"] if auto["enabled"] else None
+
+    total_size = sum(batch_media(msg).file_size for msg in batch.messages)
+    single_part = total_size * 1.01 + ARCHIVE_ENTRY_OVERHEAD * total < Config.SPLIT_SIZE
+
+    job = job_registry.create(client, batch.user_id, batch.chat_id, batch.status_msg)
+    uploader = None
+    upload_msg = None
+
+    try:
+        work_dir = await job_workspace(job)
+        # At most three parts exist at once: written, queued and uploading
+        await job_registry.acquire(job, min(int(total_size * 1.01), Config.SPLIT_SIZE * 3))
+
+        upload_msg = await client.send_message(
+            batch.chat_id, "📤 **The archive uploads here as it is written**", parse_mode=ParseMode.MARKDOWN
+        )
+        # Its progress carries a Cancel button too
+        job_registry.bind_message(job, upload_msg)
+
+        async def upload_part(path: str, index: int):
+            name = batch.output_name if single_part else part_name(batch.output_name, index)
+            await client.send_document(
+                batch.chat_id, path, file_name=name, caption=f"**{name}**",
+                progress=progress_for_pyrogram,
+                progress_args=(f"Uploading {name}", upload_msg, time.time(), job)
+            )
+            job.token.raise_if_cancelled()
+
+        uploader = PartUploader(upload_part, max_pending=1)
+        builder = ArchiveBuilder(
+            kind, PartWriter(work_dir, Config.SPLIT_SIZE, uploader.put, asyncio.get_event_loop())
+        )
+
+        job.set_stage("downloading")
+        try:
+            for index, message in enumerate(batch.messages, 1):
+                file = batch_media(message)
+                original_name = file.file_name or f"file_{index}"
+                new_name = None
+                if template:
+                    new_name = render_auto_name(template, original_name, await media_cache.lookup(file), index)
+                entry_name = add_prefix_suffix(
+                    sanitize_filename(new_name or original_name), user_data.get("prefix", ""), user_data.get("suffix", "")
+                )
+
+                chunks = stream_chunks(
+                    client, message, progress_for_pyrogram,
+                    (f"Adding {index}/{total} to {batch.output_name}", batch.status_msg, time.time(), job)
+                )
+                await job.run(builder.add(entry_name, file.file_size, chunks, should_compress(file.mime_type)))
+
+            job.set_stage("uploading")
+            await job.run(builder.close())
+            parts = await job.run(uploader.close())
+        except StopTransmission:
+            raise JobCancelled()
+
+        job.set_stage("done")
+        await update_status(
+            batch,
+            f"✅ **Archive Complete**\n\n"
+            f"**Archive:** `{batch.output_name}`\n"
+            f"**Files:** `{total}` ({humanbytes(total_size)})\n"
+            f"**Parts:** `{parts}`\n\n"
+            f"*\"{get_random_quote('success')}\"*"
+        )
+
+    except JobCancelled:
+        await update_status(batch, f"🛑 **Archive Cancelled**\n\n*\"{get_random_quote('error')}\"*")
+
+    except Exception as e:
+        logger.error(f"Archive creation failed: {e}")
+        await update_status(
+            batch,
+            f"❌ **Archive Failed**\n\n`{e}`\n\n*\"{get_random_quote('error')}\"*"
+        )
+
+    finally:
+        if uploader:
+            uploader.cancel()
+        if upload_msg:
+            try:
+                await upload_msg.delete()
+            except Exception:
+                pass
+        await job_registry.finish(job)
+        batch_sessions.pop(f"{batch.chat_id}_{batch.user_id}", None)
+
+# Merging
+async def run_merge(client: Client, batch: BatchSession):
+    """
+    Join the collected videos end to end without re-encoding
+
+    Parts are checked for matching tracks and codec parameters first, since
+    the concat demuxer only stream-copies files that agree; the join itself
+    is a remux, so the job is bound by the transfers rather than the CPU.
+    """
+    batch.running = True
+    batch.messages.sort(key=lambda msg: (msg.chat.id, msg.id))
+    total = len(batch.messages)
+    total_size = sum(batch_media(msg).file_size for msg in batch.messages)
+
+    first_name = batch_media(batch.messages[0]).file_name or "video.mkv"
+    output_name = batch.output_name or os.path.splitext(first_name)[0]
+    if not os.path.splitext(output_name)[1]:
+        output_name += os.path.splitext(first_name)[1] or ".mkv"
+
+    job = job_registry.create(client, batch.user_id, batch.chat_id, batch.status_msg)
+
+    try:
+        if total < 2:
+            raise ValueError("Send at least two files to merge")
+        if total_size > Config.MAX_FILE_SIZE:
+            raise ValueError(f"The merged file would be {humanbytes(total_size)}, over the upload limit")
+        if not ffmpeg_handler.is_available():
+            raise ValueError("FFmpeg is not available")
+
+        work_dir = await job_workspace(job)
+        # Every part plus the joined file
+        await job_registry.acquire(job, total_size * 2)
+
+        job.set_stage("downloading")
+        paths = []
+        for index, message in enumerate(batch.messages, 1):
+            name = batch_media(message).file_name or f"part{index}.mkv"
+            path = os.path.join(work_dir, f"{index:03d}{os.path.splitext(name)[1]}")
+            downloaded = await client.download_media(
+                message,
+                file_name=path,
+                progress=progress_for_pyrogram,
+                progress_args=(f"📥 **Downloading Part {index}/{total}**", batch.status_msg, time.time(), job)
+            )
+            job.token.raise_if_cancelled()
+            if not downloaded:
+                raise RuntimeError(f"Downloading part {index} failed")
+            paths.append(path)
+
+        job.set_stage("processing")
+        mismatch = await job.run(ffmpeg_handler.check_concat(paths))
+        if mismatch:
+            raise ValueError(f"{mismatch}. Only files from the same source can be merged without re-encoding")
+
+        output_path = os.path.join(work_dir, f"merged{os.path.splitext(output_name)[1]}")
+        if not await job.run(ffmpeg_handler.concat(
+            paths, output_path, ffmpeg_progress(Messages.PROCESSING_PROGRESS, batch.status_msg, total_size, job)
+        )):
+            raise RuntimeError("FFmpeg could not join the files")
+
+        # Parts are no longer needed once joined
+        await remove_path(*paths)
+        output_size = await get_file_size(output_path)
+        job_registry.release_disk(job, keep=output_size)
+
+        job.set_stage("uploading")
+        info = await ffmpeg_handler.get_media_info(output_path)
+        progress_args = (Messages.UPLOAD_PROGRESS, batch.status_msg, time.time(), job)
+        caption = f"**{output_name}**"
+        if info.get('has_video'):
+            await client.send_video(
+                batch.chat_id, output_path, file_name=output_name, caption=caption,
+                duration=int(info.get('duration', 0)), width=info.get('width', 0), height=info.get('height', 0),
+                supports_streaming=True, progress=progress_for_pyrogram, progress_args=progress_args
+            )
+        else:
+            await client.send_document(
+                batch.chat_id, output_path, file_name=output_name, caption=caption,
+                progress=progress_for_pyrogram, progress_args=progress_args
+            )
+        # A cancelled transfer returns None instead of raising
+        job.token.raise_if_cancelled()
+
+        job.set_stage("done")
+        await update_status(
+            batch,
+            f"✅ **Merge Complete**\n\n"
+            f"**File:** `{output_name}`\n"
+            f"**Parts:** `{total}`\n"
+            f"**Size:** `{humanbytes(output_size)}`\n\n"
+            f"*\"{get_random_quote('success')}\"*"
+        )
+
+    except JobCancelled:
+        await update_status(batch, f"🛑 **Merge Cancelled**\n\n*\"{get_random_quote('error')}\"*")
+
+    except Exception as e:
+        if job.cancelled:
+            await update_status(batch, f"🛑 **Merge Cancelled**\n\n*\"{get_random_quote('error')}\"*")
+        else:
+            logger.error(f"Merge failed: {e}")
+            await update_status(
+                batch,
+                f"❌ **Merge Failed**\n\n`{e}`\n\n*\"{get_random_quote('error')}\"*"
+            )
+
+    finally:
+        await job_registry.finish(job)
+        batch_sessions.pop(f"{batch.chat_id}_{batch.user_id}", None)
+
+COLLECT_USAGE = {
+    "archive": (
+        "🗜 **Archive Files**\n\n"
+        "Pack many files into one zip or tar, streamed straight from Telegram "
+        "and uploaded in parts if it grows past the upload limit.\n\n"
+        "**Usage:**\n"
+        "• `/archive start [name.zip|name.tar]` - Start collecting files\n"
+        "• `/archive end` - Build and upload the archive\n"
+        "• `/archive cancel` - Discard or stop it\n\n"
+        "Reply `/extract` to a zip or tar to unpack it."
+    ),
+    "merge": (
+        "🔗 **Merge Videos**\n\n"
+        "Join split episodes or parts into one file without re-encoding. "
+        "The parts must come from the same source (same codecs and resolution).\n\n"
+        "**Usage:**\n"
+        "• `/merge start [name]` - Start collecting parts, in playback order\n"
+        "• `/merge end` - Join and upload them\n"
+        "• `/merge cancel` - Discard or stop it"
+    )
+}
+
+def collect_output_name(mode: str, text: str) -> Optional[str]:
+    """Output name given to /archive or /merge start, normalised for the mode"""
+    name = sanitize_filename(text) if text else None
+    if mode == "archive":
+        name = name or "files.zip"
+        if not name.lower().endswith((".zip", ".tar")):
+            name += ".zip"
+    return name
+
+@Client.on_message(filters.command(["archive", "merge"]) & (filters.private | filters.group))
+async def collect_command(client: Client, message: Message):
+    user_id = message.from_user.id
+
+    # Check group mention
+    if message.chat.type.name != "PRIVATE":
+        bot_me = await client.get_me()
+        if not (f"@{bot_me.username}" in (message.text or "") or
+                (message.reply_to_message and message.reply_to_message.from_user.is_self)):
+            return
+
+    mode = message.command[0].lower()
+    key = f"{message.chat.id}_{user_id}"
+    args = message.command[1:]
+    option = args[0].lower() if args else ""
+    batch = batch_sessions.get(key)
+
+    if option == "cancel":
+        return await cancel_batch(message, key)
+
+    if option == "end":
+        if not batch or batch.running:
+            return await message.reply_text("❌ **Nothing Is Being Collected**", parse_mode=ParseMode.MARKDOWN)
+        return await end_batch(client, message, batch)
+
+    if option != "start":
+        return await message.reply_text(COLLECT_USAGE[mode], parse_mode=ParseMode.MARKDOWN)
+
+    if batch:
+        return await message.reply_text(
+            f"⏳ **A Batch Is Already Open**\n\nFinish it with `/{batch.mode} end` or `/{batch.mode} cancel`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    output_name = collect_output_name(mode, message.text.split(None, 2)[2].strip() if len(args) > 1 else "")
+    label = "Archive" if mode == "archive" else "Merge"
+    status_msg = await message.reply_text(
+        f"📦 **{label} Started**\n\n"
+        f"**Output:** `{output_name or 'named after the first part'}`\n\n"
+        f"Send or forward up to {Config.MAX_BATCH_FILES} files, then `/{mode} end`.",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    batch_sessions[key] = BatchSession(user_id, message.chat.id, None, status_msg, mode, output_name)
+
+# Runs before the rename prompt handler so collected files are not prompted for
+@Client.on_message((filters.document | filters.video | filters.audio), group=-1)
+async def batch_collect(client: Client, message: Message):
+    if not message.from_user:
+        return
+
+    batch = batch_sessions.get(f"{message.chat.id}_{message.from_user.id}")
+    if not batch or batch.running:
+        return
+
+    command = f"/{batch.mode}"
+    if len(batch.messages) < Config.MAX_BATCH_FILES:
+        batch.messages.append(message)
+        if batch.mode == "batch":
+            target = f"**Template:** `{batch.template}`"
+        else:
+            target = f"**Output:** `{batch.output_name or 'named after the first part'}`"
+        await update_status(
+            batch,
+            f"📦 **Batch Collecting**\n\n"
+            f"{target}\n"
+            f"**Files:** `{len(batch.messages)}`\n\n"
+            f"Send `{command} end` when you are done."
+        )
+    else:
+        await message.reply_text(
+            f"❌ **Batch Is Full**\n\nA batch holds up to {Config.MAX_BATCH_FILES} files. Send `{command} end`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+
+    message.stop_propagation()
@@ -3,11 +3,11 @@ from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from pyrogram.enums import ParseMode
 from utils.database import db
-from utils.helpers import progress_for_pyrogram, remove_path, humanbytes
+from utils.helpers import progress_for_pyrogram, remove_path, humanbytes, format_caption, path_exists, get_file_size
+from utils.jobs import job_registry
 from Bot.config import Config, Messages
 import time
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
@@ -23,15 +23,17 @@ async def handle_upload_callback(client: Client, query):
         user_id = query.from_user.id
         
         # Verify file exists
-        if not os.path.exists(file_path):
+        if not await path_exists(file_path):
             await query.message.edit_text("❌ File not found. Please try again.")
             return
         
+        file_size = await get_file_size(file_path)
+        
         # Update status
         status_msg = await query.message.edit_text(
             f"📤 **Uploading as {upload_type.title()}**\n\n"
             f"📁 **File:** `{filename}`\n"
-            f"💾 **Size:** `{humanbytes(os.path.getsize(file_path))}`\n\n"
+            f"💾 **Size:** `{humanbytes(file_size)}`\n\n"
             "*\"Patience is a virtue, even for the impatient.\"*",
             parse_mode=ParseMode.MARKDOWN
         )
@@ -42,14 +44,12 @@ async def handle_upload_callback(client: Client, query):
         thumbnail = user_data.get("thumbnail")
         
         # Prepare caption
-        file_size = os.path.getsize(file_path)
         caption = None
         if caption_template:
-            caption = caption_template.format(
-                filename=filename,
-                filesize=humanbytes(file_size),
-                duration="N/A",  # Could be enhanced to get actual duration
-                filetype=upload_type
+            caption = format_caption(
+                caption_template,
+                {'file_name': filename, 'file_size': file_size},
+                {'filetype': upload_type}
             )
         
         start_time = time.time()
@@ -126,9 +126,17 @@ async def close_menu_callback(client: Client, query):
     await query.message.delete()
     await query.answer()
 
-@Client.on_callback_query(filters.regex(r"^cancel"))
+@Client.on_callback_query(filters.regex(r"^cancel_operation"))
 async def cancel_operation_callback(client: Client, query):
     """Handle cancel operation button"""
+    # Stop the job running behind this progress message
+    job = job_registry.find_by_message(query.message.chat.id, query.message.id)
+    if not job:
+        return await query.answer("Nothing to cancel - this operation already ended.", show_alert=True)
+    if job.user_id != query.from_user.id:
+        return await query.answer("❌ This is not your job!", show_alert=True)
+    job_registry.cancel(job)
+    
     await query.message.edit_text(
         "❌ **Operation Cancelled**\n\n"
         "*\"Sometimes retreat is the wisest strategy.\"*",
@@ -339,6 +347,7 @@ Set custom caption templates for your files.
 • `{filesize}` - File size (e.g., 1.5 GB)
 • `{duration}` - Video/audio duration
 • `{filetype}` - File type
+• `{md5}`, `{sha1}`, `{sha256}`, `{crc32}` - File checksums
 
 **Commands:**
 • `/set_caption` - Set new template
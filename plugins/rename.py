@@ -1,5 +1,5 @@
 # plugins/rename.py - Enhanced File Renaming Core with Dazai Theme
-from pyrogram import Client, filters
+from pyrogram import Client, filters, StopTransmission
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
 from pyrogram.enums import MessageMediaType, ParseMode, ChatType
 from pyrogram.errors import FloodWait
@@ -18,12 +18,35 @@ from utils.helpers import (
     remove_path,
     sanitize_filename,
     get_random_quote,
-    temp_data
+    temp_data,
+    ffmpeg_progress,
+    convert_seconds_to_readable,
+    run_fs,
+    path_exists,
+    get_file_size,
+    move_path
+)
+from utils.ffmpeg import ffmpeg_handler, change_metadata, track_rules_active
+from utils.jobs import job_registry, RenameJob, JobCancelled, DiskSpaceError
+from utils.journal import job_journal
+from utils.screenshots import auto_thumbnail
+from utils.tags import detect_tag_format, write_audio_tags
+from utils.pdf import is_pdf, write_pdf_metadata
+from utils.media_cache import media_cache
+from utils.transfer import caption_hash_algorithms, download_with_hashes, hash_file, parts_path
+from utils.uploads import send_with_retry
+from utils.autorename import render_auto_name, compile_rename_template, RenameTemplateError
+from utils.pipeline import PipelineTicket
+from utils.album import AlbumDelivery
+from utils.scratch import SCRATCH_DIR, job_workspace, workspace_path, memory_buffer, release_buffer, partial_path
+from utils.splitter import (
+    PartUploader, stream_chunks, split_stream, write_stream, prepend, can_pipe,
+    segment_seconds, segment_extension, part_name, segment_name, split_file
 )
-from utils.ffmpeg import ffmpeg_handler, change_metadata
 from Bot.config import Config
 from Bot.messages import Messages
 import logging
+from typing import Optional, Dict, Any
 
 logger = logging.getLogger(__name__)
 
@@ -43,19 +66,42 @@ class RenameSession:
     def is_expired(self, max_age=1800):  # 30 minutes
         return time.time() - self.timestamp > max_age
 
+class AlbumSession(RenameSession):
+    """Rename session covering every file of an album"""
+    def __init__(self, user_id, messages, chat_id):
+        super().__init__(user_id, messages[0], chat_id)
+        self.messages = messages
+        self.status = "waiting_for_template"
+
+# Album updates arrive as separate messages; they are gathered for this long
+ALBUM_COLLECT_DELAY = 1.5
+
+# Album files being gathered, keyed by "<chat_id>_<media_group_id>"
+album_buffers = {}
+
+# Album prompts awaiting a template, keyed by "<chat_id>_<prompt message id>"
+album_sessions = {}
+
 def clean_expired_sessions():
     """Clean up expired rename sessions"""
-    expired_keys = [k for k, v in rename_sessions.items() if v.is_expired()]
-    for key in expired_keys:
-        del rename_sessions[key]
+    for sessions in (rename_sessions, album_sessions):
+        expired_keys = [k for k, v in sessions.items() if v.is_expired()]
+        for key in expired_keys:
+            del sessions[key]
 
 # Handle files sent to bot (works in both private and groups)
 @Client.on_message(filters.document | filters.video | filters.audio)
 async def rename_file_handler(client: Client, message: Message):
     """Handle file uploads for renaming"""
     
+    # Further files of an album that is already being gathered
+    album_key = f"{message.chat.id}_{message.media_group_id}"
+    if message.media_group_id and album_key in album_buffers:
+        album_buffers[album_key].append(message)
+        return
+    
     # Clean expired sessions periodically
-    if len(rename_sessions) > 100:
+    if len(rename_sessions) + len(album_sessions) > 100:
         clean_expired_sessions()
     
     # Check if in group and bot was mentioned or replied to
@@ -95,17 +141,50 @@ async def rename_file_handler(client: Client, message: Message):
                 filesize=humanbytes(file_info['file_size']),
                 maxsize=humanbytes(max_size)
             )
-            return await message.reply_text(size_error, parse_mode=ParseMode.MARKDOWN)
+            
+            # The file can still go out as parts that fit the upload limit
+            session_key = f"{message.chat.id}_{user_id}"
+            rename_sessions[session_key] = RenameSession(user_id, message, message.chat.id)
+            return await message.reply_text(
+                size_error,
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("✂️ Split Into Parts", callback_data=f"split_file_{session_key}"),
+                    InlineKeyboardButton("❌ Cancel", callback_data=f"cancel_rename_{session_key}")
+                ]]),
+                parse_mode=ParseMode.MARKDOWN
+            )
+        
+        # Albums get one prompt for all their files
+        if message.media_group_id:
+            return await collect_album(client, message)
+        
+        # Known duration/resolution, from Telegram or an earlier probe of this file
+        media_info = await media_cache.lookup(file)
+        
+        # Auto rename skips the prompt whenever the user's template can be filled in
+        auto = await db.get_auto_rename(user_id)
+        if auto["enabled"] and auto["template"]:
+            auto_name = render_auto_name(auto["template"], file_info['file_name'] or '', media_info)
+            if auto_name:
+                return await auto_rename_file(client, message, auto_name, auto["format"])
+            logger.debug(f"Auto rename template did not match {file_info['file_name']}, prompting")
         
         # Create rename session
         session_key = f"{message.chat.id}_{user_id}"
         rename_sessions[session_key] = RenameSession(user_id, message, message.chat.id)
         
+        media_details = ""
+        if media_info.get('duration'):
+            media_details += f"\n• **Duration:** `{convert_seconds_to_readable(int(media_info['duration']))}`"
+        if media_info.get('width') and media_info.get('height'):
+            media_details += f"\n• **Resolution:** `{media_info['width']}x{media_info['height']}`"
+        
         # Create enhanced rename prompt
         prompt_text = Messages.RENAME_PROMPT.format(
             filename=file_info['file_name'] or 'unknown',
             filesize=humanbytes(file_info['file_size']),
-            filetype=get_file_type_display(file_info['mime_type'])
+            filetype=get_file_type_display(file_info['mime_type']),
+            media_details=media_details
         )
         
         # Add quick action buttons for common operations
@@ -145,6 +224,259 @@ async def rename_file_handler(client: Client, message: Message):
             parse_mode=ParseMode.MARKDOWN
         )
 
+def pick_upload_format(message: Message, preferred: str) -> str:
+    """Upload format for an unattended rename, honouring the user's default where the file allows it"""
+    file = message.document or message.video or message.audio
+    mime_type = file.mime_type or ""
+    
+    if preferred == "video" and (message.video or mime_type.startswith('video/')):
+        return "video"
+    if preferred == "audio" and (message.audio or mime_type.startswith('audio/')):
+        return "audio"
+    return "document"
+
+def rename_success_text(session: RenameSession) -> str:
+    """Final status message for a finished rename"""
+    file = session.file_message.document or session.file_message.video or session.file_message.audio
+    return Messages.SUCCESS_FILE_RENAMED.format(
+        filename=session.new_filename,
+        filesize=humanbytes(file.file_size),
+        duration="Processing completed"
+    )
+
+async def auto_rename_file(client: Client, message: Message, new_filename: str, preferred_format: str) -> bool:
+    """
+    Rename a file from the user's auto-rename template without prompting
+    
+    Args:
+        client (Client): Pyrogram client
+        message (Message): Message carrying the file
+        new_filename (str): Name produced by the template, extension included
+        preferred_format (str): User's default upload format
+    
+    Returns:
+        bool: True if the file was renamed and uploaded
+    """
+    user_id = message.from_user.id
+    
+    try:
+        user_data = await db.get_user_data(user_id)
+        final_filename = add_prefix_suffix(
+            sanitize_filename(new_filename), user_data.get("prefix", ""), user_data.get("suffix", "")
+        )
+    except Exception:
+        final_filename = sanitize_filename(new_filename)
+    
+    session = RenameSession(user_id, message, message.chat.id)
+    session.new_filename = final_filename
+    session.status = "processing"
+    
+    progress_msg = await message.reply_text(
+        f"🤖 **Auto Renaming**\n\n"
+        f"**New filename:** `{final_filename}`\n\n"
+        f"*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+    success = await process_file_rename(client, session, pick_upload_format(message, preferred_format), progress_msg)
+    if success:
+        await progress_msg.edit_text(rename_success_text(session), parse_mode=ParseMode.MARKDOWN)
+    return success
+
+# Albums (media groups)
+async def collect_album(client: Client, message: Message):
+    """Gather the files of an album, then ask for one naming template"""
+    key = f"{message.chat.id}_{message.media_group_id}"
+    if key in album_buffers:
+        album_buffers[key].append(message)
+        return
+    
+    album_buffers[key] = [message]
+    await asyncio.sleep(ALBUM_COLLECT_DELAY)
+    messages = sorted(album_buffers.pop(key), key=lambda msg: msg.id)
+    
+    user_id = message.from_user.id
+    session = AlbumSession(user_id, messages, message.chat.id)
+    
+    auto = await db.get_auto_rename(user_id)
+    if auto["enabled"] and auto["template"]:
+        status_msg = await message.reply_text(
+            f"🤖 **Auto Renaming Album**\n\n**Files:** `{len(messages)}`\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return await process_album(client, session, auto["template"], status_msg)
+    
+    total_size = sum((msg.document or msg.video or msg.audio).file_size for msg in messages)
+    prompt_msg = await message.reply_text(
+        "✍️ **Enter A Naming Template For The Album:**\n\n"
+        "*Reply to this message; it is applied to every file*",
+        reply_markup=ForceReply(placeholder="{title} E{episode:02}", selective=True),
+        parse_mode=ParseMode.MARKDOWN
+    )
+    
+    session_key = f"{message.chat.id}_{prompt_msg.id}"
+    album_sessions[session_key] = session
+    
+    await message.reply_text(
+        f"📚 **Album Received**\n\n"
+        f"• **Files:** `{len(messages)}`\n"
+        f"• **Total Size:** `{humanbytes(total_size)}`\n\n"
+        "Reply with a template such as `{title} E{episode:02}` or `Trip {n:02}`. "
+        "Send `/autorename` to see every field.\n\n"
+        f"*\"{get_random_quote('waiting')}\"*",
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("🔄 Keep Original Names", callback_data=f"album_keep_{session_key}"),
+            InlineKeyboardButton("❌ Cancel", callback_data=f"album_cancel_{session_key}")
+        ]]),
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+def default_filename(message: Message, index: int) -> str:
+    """Name for a file Telegram sent without one"""
+    if message.video:
+        return f"video_{index}.mp4"
+    if message.audio:
+        return f"audio_{index}.mp3"
+    return f"file_{index}"
+
+async def process_album(client: Client, session: AlbumSession, template: Optional[str], status_msg: Message) -> int:
+    """
+    Rename every file of an album concurrently and re-send them as a media group
+    
+    Each file is its own job, so the scheduler slots bound how many run at
+    once. Finished files wait for their siblings without holding a slot.
+    
+    Args:
+        template (str): Naming template, or None to keep the original names
+    
+    Returns:
+        int: Number of files renamed
+    """
+    user_data = await db.get_user_data(session.user_id)
+    auto = await db.get_auto_rename(session.user_id)
+    
+    # Media groups cannot mix documents with videos or audio
+    formats = {pick_upload_format(msg, auto["format"]) for msg in session.messages}
+    upload_format = formats.pop() if len(formats) == 1 else "document"
+    
+    album = AlbumDelivery(
+        client, session.chat_id, len(session.messages),
+        os.path.join(SCRATCH_DIR, f"album_{session.chat_id}_{status_msg.id}")
+    )
+    
+    async def rename_member(index: int, message: Message) -> bool:
+        try:
+            file = message.document or message.video or message.audio
+            original_name = file.file_name or default_filename(message, index)
+            new_name = None
+            if template:
+                new_name = render_auto_name(template, original_name, await media_cache.lookup(file), index)
+            
+            member = RenameSession(session.user_id, message, session.chat_id)
+            member.new_filename = add_prefix_suffix(
+                sanitize_filename(new_name or original_name), user_data.get("prefix", ""), user_data.get("suffix", "")
+            )
+            member.status = "processing"
+            
+            progress_msg = await client.send_message(
+                session.chat_id,
+                f"📚 **Album File {index}/{len(session.messages)}**\n\n`{member.new_filename}`",
+                parse_mode=ParseMode.MARKDOWN
+            )
+            success = await process_file_rename(
+                client, member, upload_format, progress_msg, album=album, album_index=index
+            )
+            if success:
+                try:
+                    await progress_msg.delete()
+                except Exception:
+                    pass
+            return success
+        except Exception as e:
+            logger.error(f"Album file {index} failed: {e}")
+            return False
+        finally:
+            album.skip(index)
+    
+    try:
+        results = await asyncio.gather(*(
+            rename_member(index, message) for index, message in enumerate(session.messages, 1)
+        ))
+    finally:
+        await remove_path(album.directory)
+    
+    renamed = sum(results)
+    await status_msg.edit_text(
+        f"{'✅' if renamed == len(results) else '⚠️'} **Album Renamed**\n\n"
+        f"**Files:** `{renamed}/{len(results)}`\n\n"
+        f"*\"{get_random_quote('success' if renamed == len(results) else 'error')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    return renamed
+
+async def handle_album_response(client: Client, message: Message, session_key: str):
+    """Handle the naming template sent for an album"""
+    session = album_sessions[session_key]
+    if message.from_user.id != session.user_id:
+        return
+    
+    template = message.text.strip()
+    try:
+        compile_rename_template(template)
+    except RenameTemplateError as e:
+        return await message.reply_text(
+            f"❌ **Invalid Template**\n\n{e}\n\nReply to the prompt again with a corrected template.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    del album_sessions[session_key]
+    try:
+        await message.reply_to_message.delete()
+    except Exception:
+        pass
+    
+    status_msg = await message.reply_text(
+        f"📚 **Renaming Album**\n\n**Template:** `{template}`\n\n"
+        f"*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    await process_album(client, session, template, status_msg)
+
+@Client.on_callback_query(filters.regex(r"^album_(keep|cancel)_"))
+async def handle_album_actions(client: Client, query):
+    """Handle keep original names and cancel for album prompts"""
+    _, action, session_key = query.data.split("_", 2)
+    session = album_sessions.get(session_key)
+    
+    if not session:
+        return await query.answer("❌ Session expired!", show_alert=True)
+    if query.from_user.id != session.user_id:
+        return await query.answer("❌ Not your session!", show_alert=True)
+    
+    del album_sessions[session_key]
+    await query.answer()
+    
+    # Remove the ForceReply prompt the session was keyed by
+    try:
+        await client.delete_messages(session.chat_id, int(session_key.rsplit("_", 1)[1]))
+    except Exception:
+        pass
+    
+    if action == "cancel":
+        return await query.message.edit_text(
+            "❌ **Album Rename Cancelled**\n\n"
+            f"*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    await query.message.edit_text(
+        "📚 **Uploading Album With Original Names**\n\n"
+        f"*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    await process_album(client, session, None, query.message)
+
 def get_file_type_display(mime_type):
     """Get user-friendly file type display"""
     if not mime_type:
@@ -172,6 +504,11 @@ async def handle_rename_response(client: Client, message: Message):
             isinstance(message.reply_to_message.reply_markup, ForceReply)):
         return
     
+    # Templates for album prompts
+    album_key = f"{message.chat.id}_{message.reply_to_message.id}"
+    if album_key in album_sessions:
+        return await handle_album_response(client, message, album_key)
+    
     user_id = message.from_user.id
     session_key = f"{message.chat.id}_{user_id}"
     
@@ -325,91 +662,267 @@ async def handle_upload_format(client: Client, query):
         del rename_sessions[session_key]
         
         if success:
-            await query.message.edit_text(
-                Messages.SUCCESS_FILE_RENAMED.format(
-                    filename=session.new_filename,
-                    filesize=humanbytes(session.file_message.document.file_size if session.file_message.document 
-                                      else session.file_message.video.file_size if session.file_message.video
-                                      else session.file_message.audio.file_size),
-                    duration="Processing completed"
-                ),
-                parse_mode=ParseMode.MARKDOWN
-            )
+            await query.message.edit_text(rename_success_text(session), parse_mode=ParseMode.MARKDOWN)
         
     except Exception as e:
         logger.error(f"Error in upload format callback: {e}")
         await query.answer("❌ An error occurred. Please try again.", show_alert=True)
 
-async def process_file_rename(client: Client, session: RenameSession, upload_format: str, progress_msg: Message):
-    """Process the actual file renaming and upload"""
+async def wait_for_slot(job, progress_msg: Message, disk_bytes: int = 0):
+    """Wait for a scheduler slot and scratch space, telling the user when they are queued"""
+    if not await job_registry.can_start(disk_bytes):
+        await progress_msg.edit_text(
+            f"⏳ **Queued**\n\n"
+            f"Other files are being processed, yours is next in line.\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            reply_markup=InlineKeyboardMarkup([
+                [InlineKeyboardButton("❌ Cancel", callback_data="cancel_operation")]
+            ]),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    await job_registry.acquire(job, disk_bytes)
+
+async def disk_space_failed(progress_msg: Message, error: DiskSpaceError):
+    await progress_msg.edit_text(
+        f"💾 **Not Enough Space**\n\n"
+        f"`{error}`\n\n"
+        f"*\"Even I can't fit an ocean into a teacup.\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+async def process_file_rename(client: Client, session: RenameSession, upload_format: str, progress_msg: Message,
+                              ticket: Optional[PipelineTicket] = None, album: Optional[AlbumDelivery] = None,
+                              album_index: int = 0, job: Optional[RenameJob] = None,
+                              resume: Optional[Dict[str, Any]] = None):
+    """
+    Process the actual file renaming and upload
+    
+    Args:
+        ticket (PipelineTicket): Batch renames pass one so download, processing
+            and upload overlap with the neighbouring files in order
+        album (AlbumDelivery): Album members hand their file over to be sent
+            as one media group instead of uploading it themselves
+        album_index (int): Position of the file within the album
+        job (RenameJob): Job registered in advance (resumed jobs)
+        resume (dict): Journal entry of an interrupted run to pick up from
+    """
+    
+    # Every run is a registered job so the cancel button can reach it
+    job = job or job_registry.create(client, session.user_id, session.chat_id, progress_msg)
+    buffer = None
     
     try:
+        # Album members are sent as a group, so only standalone files can resume on their own
+        if not album:
+            await job_journal.open(job, session, upload_format, progress_msg)
+        
         user_id = session.user_id
         original_msg = session.file_message
         new_filename = session.new_filename
         
         file = original_msg.document or original_msg.video or original_msg.audio
         
-        # Create unique temporary filename
-        temp_filename = create_temp_filename(new_filename, user_id)
-        download_path = f"downloads/{temp_filename}"
+        # Hashes used by the caption are computed while the file streams in
+        user_data = await db.get_user_data(user_id)
+        hash_algorithms = caption_hash_algorithms(user_data.get("caption"))
         
-        # Ensure downloads directory exists
-        os.makedirs("downloads", exist_ok=True)
+        # Prepare metadata if enabled
+        metadata = user_data.get("metadata", {})
+        metadata_str = ""
+        if metadata.get("enabled"):
+            if metadata.get("author"):
+                metadata_str += f"--change-author {metadata['author']} "
+            if metadata.get("title"):
+                metadata_str += f"--change-title {metadata['title']} "
         
-        # Update progress message
-        await progress_msg.edit_text(
-            f"📥 **Downloading File**\n\n"
-            f"**File:** `{file.file_name}`\n"
-            f"**Size:** `{humanbytes(file.file_size)}`\n\n"
-            f"*\"{get_random_quote('waiting')}\"*",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        # Track selection rides along in the same stream-copy pass
+        track_rules = user_data.get("tracks") or {}
+        is_media = file.mime_type and file.mime_type.startswith(('video/', 'audio/'))
+        drop_tracks = is_media and track_rules_active(track_rules)
         
-        # Download file with progress
-        start_time = time.time()
-        try:
-            downloaded_file = await client.download_media(
-                original_msg,
-                file_name=download_path,
-                progress=progress_for_pyrogram,
-                progress_args=(Messages.DOWNLOAD_PROGRESS, progress_msg, start_time)
+        # A resumed job whose download finished before the restart skips it
+        resumed_file = None
+        resume_stage = (resume or {}).get("stage", "queued")
+        if resume_stage in ("processing", "uploading") and resume.get("download_path") \
+                and await path_exists(resume["download_path"]):
+            resumed_file = resume["download_path"]
+        
+        # Small documents that need no processing never touch the disk
+        if upload_format == "document" and not album and not metadata_str and not drop_tracks and not resumed_file:
+            buffer = memory_buffer(file.file_size, new_filename)
+        
+        # Batch files download one at a time, in order
+        if ticket:
+            await job.run(ticket.enter("download"))
+        
+        # Room for the download plus a processed copy of it
+        disk_bytes = 0 if buffer else int(file.file_size * Config.DISK_STAGE_MULTIPLIER)
+        await wait_for_slot(job, progress_msg, disk_bytes)
+        
+        # Large files are processed in the job's scratch workspace
+        download_path = None
+        resume_path = None
+        if resumed_file:
+            await job_workspace(job)
+            download_path = resumed_file
+        elif not buffer:
+            download_path = os.path.join(await job_workspace(job), create_temp_filename(new_filename, user_id))
+            
+            # They download to a stable path first, so a failed attempt can be resumed
+            resume_path = await partial_path(user_id, file.file_unique_id)
+            if resume_path in job_registry.active_paths():
+                # The same file is already downloading for this user
+                resume_path = download_path
+            job.track_path(resume_path, parts_path(resume_path))
+        
+        if resumed_file:
+            downloaded_file = download_path
+            job.hashes = resume.get("hashes") or {}
+        else:
+            # Update progress message
+            await progress_msg.edit_text(
+                f"📥 **Downloading File**\n\n"
+                f"**File:** `{file.file_name}`\n"
+                f"**Size:** `{humanbytes(file.file_size)}`\n\n"
+                f"*\"{get_random_quote('waiting')}\"*",
+                parse_mode=ParseMode.MARKDOWN
             )
-        except Exception as e:
-            logger.error(f"Download failed: {e}")
-            error_msg = Messages.ERROR_DOWNLOAD_FAILED.format(error=str(e))
-            await progress_msg.edit_text(error_msg, parse_mode=ParseMode.MARKDOWN)
-            return False
+            
+            # Download file with progress
+            start_time = time.time()
+            job.set_stage("downloading")
+            await job_journal.record(job, "downloading", resume_path=resume_path)
+            try:
+                digests = await download_with_hashes(
+                    client, original_msg, buffer or resume_path, hash_algorithms,
+                    progress=progress_for_pyrogram,
+                    progress_args=(Messages.DOWNLOAD_PROGRESS, progress_msg, start_time, job)
+                )
+                job.hashes = digests or {}
+                downloaded_file = None if digests is None else (buffer or download_path)
+                if digests is not None and resume_path and resume_path != download_path:
+                    await move_path(resume_path, download_path)
+                    job.untrack_path(resume_path, parts_path(resume_path))
+            except Exception as e:
+                if job.cancelled:
+                    raise JobCancelled()
+                logger.error(f"Download failed: {e}")
+                if resume_path and resume_path != download_path:
+                    # Keep what was downloaded; sending the file again resumes it
+                    job.untrack_path(resume_path, parts_path(resume_path))
+                error_msg = Messages.ERROR_DOWNLOAD_FAILED.format(error=str(e))
+                await progress_msg.edit_text(error_msg, parse_mode=ParseMode.MARKDOWN)
+                return False
+        
+        # The download returns None when the transfer was stopped
+        job.token.raise_if_cancelled()
+        downloaded_stat = None
+        if not resumed_file:
+            downloaded_stat = await run_fs(os.stat, download_path) if await path_exists(download_path) else None
+            await job_journal.record(job, "processing", download_path=download_path, hashes=job.hashes)
+        
+        # Let the next batch file start downloading while this one is processed
+        if ticket:
+            await job.run(ticket.enter("process"))
         
-        # Get user settings
         try:
-            user_data = await db.get_user_data(user_id)
-            
-            # Prepare metadata if enabled
-            metadata = user_data.get("metadata", {})
-            if metadata.get("enabled") and ffmpeg_handler.is_available():
-                metadata_str = ""
-                if metadata.get("author"):
-                    metadata_str += f"--change-author {metadata['author']} "
-                if metadata.get("title"):
-                    metadata_str += f"--change-title {metadata['title']} "
+            # Audio tags (and cover art) are patched in place without a remux
+            thumbnail = user_data.get("thumbnail")
+            thumb_path = None
+            metadata_written = False
+            tracks_dropped = False
+            # A job that was already uploading when interrupted has its processing done
+            process = not (resumed_file and resume_stage == "uploading")
+            is_audio = original_msg.audio or (file.mime_type or "").startswith('audio/')
+            if process and metadata_str and is_audio and not drop_tracks and await run_fs(detect_tag_format, download_path):
+                job.set_stage("processing")
+                await progress_msg.edit_text(
+                    "🏷 **Writing Tags**\n\n"
+                    "*\"Adding the author's signature to the work...\"*",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                
+                if thumbnail:
+                    try:
+                        thumb_path = await client.download_media(thumbnail, os.path.join(await job_workspace(job), "thumb.jpg"))
+                        job.track_path(thumb_path)
+                    except Exception as e:
+                        logger.debug(f"Thumbnail download failed: {e}")
+                
+                metadata_written = await job.run(write_audio_tags(
+                    download_path, metadata.get("title"), metadata.get("author"), thumb_path
+                ))
+            
+            # PDFs get an appended Info dictionary; FFmpeg cannot touch them
+            is_document_pdf = process and metadata_str and await run_fs(is_pdf, download_path)
+            if is_document_pdf:
+                job.set_stage("processing")
+                await progress_msg.edit_text(
+                    "📑 **Updating Document Info**\n\n"
+                    "*\"Adding the author's signature to the work...\"*",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                metadata_written = await job.run(write_pdf_metadata(
+                    download_path, metadata.get("title"), metadata.get("author")
+                ))
+            
+            if process and ((metadata_str and not metadata_written and not is_document_pdf) or drop_tracks) \
+                    and ffmpeg_handler.is_available():
+                await progress_msg.edit_text(
+                    "⚙️ **Processing Metadata**\n\n"
+                    "*\"Adding the author's signature to the work...\"*",
+                    parse_mode=ParseMode.MARKDOWN
+                )
                 
-                if metadata_str:
-                    # Apply metadata
-                    await progress_msg.edit_text(
-                        f"⚙️ **Processing Metadata**\n\n"
-                        f"*\"Adding the author's signature to the work...\"*",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                    
-                    output_path = f"{download_path}.processed"
-                    if await change_metadata(download_path, output_path, metadata_str.strip()):
-                        # Replace original with processed file
-                        await remove_path(download_path)
-                        os.rename(output_path, download_path)
-                        downloaded_file = download_path
-            
-            # Prepare for upload
+                job.set_stage("processing")
+                output_path = f"{download_path}.processed"
+                job.track_path(output_path)
+                
+                # Cancelling the job kills the ffmpeg process group
+                metadata_applied = await job.run(change_metadata(
+                    download_path, output_path, metadata_str.strip(),
+                    ffmpeg_progress(Messages.PROCESSING_PROGRESS, progress_msg, file.file_size, job),
+                    track_rules if drop_tracks else None
+                ))
+                
+                if metadata_applied:
+                    # Replace original with processed file
+                    await remove_path(download_path)
+                    await run_fs(os.rename, output_path, download_path)
+                    downloaded_file = download_path
+                    tracks_dropped = bool(drop_tracks)
+            
+            # Relocate the MP4 index so Telegram can stream the video
+            if process and upload_format == "video" and ffmpeg_handler.is_available() \
+                    and await run_fs(ffmpeg_handler.needs_faststart, download_path):
+                job.set_stage("processing")
+                await progress_msg.edit_text(
+                    "⚙️ **Optimizing for Streaming**\n\n"
+                    "*\"Arranging the pages so the story can be read from the start...\"*",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                
+                output_path = f"{download_path}.processed"
+                job.track_path(output_path)
+                faststart_applied = await job.run(ffmpeg_handler.apply_faststart(
+                    download_path, output_path,
+                    ffmpeg_progress(Messages.PROCESSING_PROGRESS, progress_msg, file.file_size, job)
+                ))
+                
+                if faststart_applied:
+                    await remove_path(download_path)
+                    await run_fs(os.rename, output_path, download_path)
+                    downloaded_file = download_path
+            
+            # Processing is over: only the file being uploaded stays on disk
+            job_registry.release_disk(job, keep=await get_file_size(download_path))
+            
+            # Prepare for upload (batch uploads keep their original order)
+            if ticket:
+                await job.run(ticket.enter("upload"))
+            job.token.raise_if_cancelled()
+            job.set_stage("uploading")
+            await job_journal.record(job, "uploading", download_path=download_path)
             await progress_msg.edit_text(
                 f"📤 **Preparing Upload**\n\n"
                 f"**Format:** {upload_format.title()}\n"
@@ -418,12 +931,34 @@ async def process_file_rename(client: Client, session: RenameSession, upload_for
                 parse_mode=ParseMode.MARKDOWN
             )
             
-            # Get caption and thumbnail
+            # Get caption
             caption_template = user_data.get("caption")
-            thumbnail = user_data.get("thumbnail")
+            
+            # Documents carry no duration/dimensions; the shared cache spares
+            # a re-probe when the same file was seen before
+            media_info = await media_cache.lookup(file)
+            if upload_format in ['video', 'audio'] and ffmpeg_handler.is_ffprobe_available():
+                if tracks_dropped:
+                    # The upload no longer has the source's streams; probe it
+                    # without caching so the entry keeps describing the source
+                    media_info = await ffmpeg_handler.get_media_info(downloaded_file) or media_info
+                else:
+                    media_info = await media_cache.get_info(file.file_unique_id, downloaded_file) or media_info
             
             # Format caption
             file_info = extract_file_info(file)
+            for key in ('duration', 'width', 'height'):
+                if not file_info.get(key) and media_info.get(key):
+                    file_info[key] = int(media_info[key])
+            if job.hashes:
+                # Metadata/faststart passes change the bytes; checksums must match the upload
+                if not buffer:
+                    stat = await run_fs(os.stat, downloaded_file)
+                    if not downloaded_stat or \
+                            (stat.st_size, stat.st_mtime_ns) != (downloaded_stat.st_size, downloaded_stat.st_mtime_ns):
+                        job.hashes = await job.run(hash_file(downloaded_file, hash_algorithms))
+                file_info.update(job.hashes)
+            
             if caption_template:
                 caption = format_caption(caption_template, file_info, {
                     'bot_name': 'Dazai Rename Bot'
@@ -431,56 +966,93 @@ async def process_file_rename(client: Client, session: RenameSession, upload_for
             else:
                 caption = f"**{new_filename}**\n\n*Renamed with artistic precision by Dazai Bot*"
             
-            # Download thumbnail if available
-            thumb_path = None
-            if thumbnail and upload_format in ['video', 'audio']:
+            # Download thumbnail if available (already fetched for cover art)
+            if not thumb_path and thumbnail and upload_format in ['video', 'audio']:
                 try:
-                    thumb_path = await client.download_media(thumbnail, f"downloads/thumb_{user_id}.jpg")
+                    thumb_path = await client.download_media(thumbnail, os.path.join(await job_workspace(job), "thumb.jpg"))
+                    job.track_path(thumb_path)
                 except Exception as e:
                     logger.debug(f"Thumbnail download failed: {e}")
             
+            # No thumbnail set: use a frame from the video itself
+            if not thumb_path and upload_format == 'video' and Config.AUTO_THUMBNAIL \
+                    and ffmpeg_handler.is_available():
+                auto_thumb_path = os.path.join(await job_workspace(job), "thumb_auto.jpg")
+                thumb_path = await job.run(
+                    auto_thumbnail(downloaded_file, auto_thumb_path, media_info.get('duration'))
+                )
+            
             # Upload the file
             start_time = time.time()
             
             upload_kwargs = {
                 'progress': progress_for_pyrogram,
-                'progress_args': (Messages.UPLOAD_PROGRESS, progress_msg, start_time),
+                'progress_args': (Messages.UPLOAD_PROGRESS, progress_msg, start_time, job),
                 'file_name': new_filename
             }
             
-            if upload_format == "video":
+            if album:
+                # Album members are sent together once all are ready; media
+                # groups are named after the file on disk
+                album_path = os.path.join(album.directory, str(album_index), new_filename)
+                await move_path(downloaded_file, album_path)
+                job.untrack_path(downloaded_file)
+                job.track_path(album_path)
+                
+                await progress_msg.edit_text(
+                    f"📚 **Waiting For The Rest Of The Album**\n\n"
+                    f"**Name:** `{new_filename}`\n\n"
+                    f"*\"{get_random_quote('waiting')}\"*",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+                
+                # Waiting on siblings must not hold a slot they may need
+                job_registry.release_slot(job)
+                await job.run(album.deliver(
+                    album_index, upload_format, album_path, caption, thumb_path,
+                    duration=int(media_info.get('duration') or getattr(file, 'duration', 0) or 0),
+                    width=media_info.get('width') or getattr(file, 'width', 0) or 0,
+                    height=media_info.get('height') or getattr(file, 'height', 0) or 0
+                ))
+            
+            elif upload_format == "video":
                 upload_kwargs.update({
                     'caption': caption,
                     'thumb': thumb_path,
-                    'duration': getattr(file, 'duration', 0),
-                    'width': getattr(file, 'width', 0),
-                    'height': getattr(file, 'height', 0)
+                    'duration': int(media_info.get('duration') or getattr(file, 'duration', 0) or 0),
+                    'width': media_info.get('width') or getattr(file, 'width', 0) or 0,
+                    'height': media_info.get('height') or getattr(file, 'height', 0) or 0,
+                    'supports_streaming': True
                 })
-                await client.send_video(
+                await send_with_retry(lambda: client.send_video(
                     chat_id=session.chat_id,
                     video=downloaded_file,
                     **upload_kwargs
-                )
+                ), lambda: job.cancelled)
             
             elif upload_format == "audio":
                 upload_kwargs.update({
                     'caption': caption,
                     'thumb': thumb_path,
-                    'duration': getattr(file, 'duration', 0)
+                    'duration': int(media_info.get('duration') or getattr(file, 'duration', 0) or 0)
                 })
-                await client.send_audio(
+                await send_with_retry(lambda: client.send_audio(
                     chat_id=session.chat_id,
                     audio=downloaded_file,
                     **upload_kwargs
-                )
+                ), lambda: job.cancelled)
             
             else:  # document
                 upload_kwargs['caption'] = caption
-                await client.send_document(
+                await send_with_retry(lambda: client.send_document(
                     chat_id=session.chat_id,
                     document=downloaded_file,
                     **upload_kwargs
-                )
+                ), lambda: job.cancelled)
+            
+            # Pyrogram returns None when the upload was stopped
+            job.token.raise_if_cancelled()
+            job.set_stage("done")
             
             # Update user statistics
             await db.increment_renamed_count(user_id)
@@ -496,15 +1068,24 @@ async def process_file_rename(client: Client, session: RenameSession, upload_for
             logger.info(f"File renamed successfully for user {user_id}: {new_filename}")
             return True
             
+        except JobCancelled:
+            raise
         except Exception as e:
+            if job.cancelled:
+                raise JobCancelled()
             logger.error(f"Upload failed: {e}")
             error_msg = Messages.ERROR_UPLOAD_FAILED.format(error=str(e))
             await progress_msg.edit_text(error_msg, parse_mode=ParseMode.MARKDOWN)
             return False
-        
-        finally:
-            # Clean up temporary files
-            await remove_path(downloaded_file, thumb_path)
+    
+    except JobCancelled:
+        logger.info(f"Rename job {job.job_id} cancelled for user {session.user_id}")
+        return False
+    
+    except DiskSpaceError as e:
+        logger.warning(f"Rename job {job.job_id} refused: {e}")
+        await disk_space_failed(progress_msg, e)
+        return False
     
     except Exception as e:
         logger.error(f"Process rename error: {e}")
@@ -515,13 +1096,272 @@ async def process_file_rename(client: Client, session: RenameSession, upload_for
             parse_mode=ParseMode.MARKDOWN
         )
         return False
+    
+    finally:
+        # Release the slot, memory buffer and temporary files; a job torn
+        # down by shutdown keeps its files for the resumed run
+        if ticket:
+            ticket.finish()
+        release_buffer(buffer)
+        await job_journal.close(job)
+        await job_registry.finish(job, keep_files=job_journal.suspended and bool(job.journal_id))
+
+# Resuming jobs interrupted by a crash or deploy
+async def resume_interrupted_jobs(client: Client) -> int:
+    """
+    Restart every rename job left in the journal by the previous run
+    
+    Each job is registered, with its workspace claimed, before this returns,
+    so the startup scratch sweep leaves its files alone; the jobs themselves
+    continue in the background from their last completed stage.
+    
+    Returns:
+        int: Number of jobs resumed
+    """
+    resumed = 0
+    for entry in await job_journal.unfinished():
+        chat_id = entry.get("chat_id")
+        new_filename = entry.get("new_filename")
+        try:
+            message = await client.get_messages(chat_id, entry["message_id"])
+            if not message or message.empty or not (message.document or message.video or message.audio):
+                raise ValueError("the original file is no longer available")
+        except Exception as e:
+            logger.warning(f"Cannot resume journaled job {entry['_id']}: {e}")
+            await job_journal.discard(entry["_id"])
+            try:
+                await client.send_message(
+                    chat_id,
+                    f"❌ **Rename Interrupted**\n\n"
+                    f"I was restarted while renaming `{new_filename}` and could not pick it back up: `{e}`\n\n"
+                    f"Please send the file again.\n\n"
+                    f"*\"{get_random_quote('error')}\"*",
+                    parse_mode=ParseMode.MARKDOWN
+                )
+            except Exception:
+                pass
+            continue
+        
+        session = RenameSession(entry["user_id"], message, chat_id)
+        session.new_filename = new_filename
+        session.status = "processing"
+        
+        try:
+            progress_msg = await message.reply_text(
+                f"♻️ **Resuming Your Rename**\n\n"
+                f"**File:** `{new_filename}`\n"
+                f"**Picking up at:** {entry.get('stage', 'queued').title()}\n\n"
+                f"I was restarted mid-way; whatever was already transferred is reused.\n\n"
+                f"*\"{get_random_quote('waiting')}\"*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        except Exception as e:
+            # Left in the journal for the next start
+            logger.warning(f"Cannot notify user {entry['user_id']} about resumed job {entry['_id']}: {e}")
+            continue
+        
+        job = job_registry.create(client, session.user_id, chat_id, progress_msg)
+        job.journal_id = entry["_id"]
+        job.track_path(workspace_path(job))
+        asyncio.create_task(run_resumed_job(client, session, entry, progress_msg, job))
+        resumed += 1
+    
+    return resumed
+
+async def run_resumed_job(client: Client, session: RenameSession, entry: Dict[str, Any],
+                          progress_msg: Message, job: RenameJob):
+    """Run a journaled job to completion and report it like a fresh rename"""
+    success = await process_file_rename(
+        client, session, entry.get("upload_format", "document"), progress_msg, job=job, resume=entry
+    )
+    if success:
+        await progress_msg.edit_text(rename_success_text(session), parse_mode=ParseMode.MARKDOWN)
+
+# Splitting files over the upload limit
+@Client.on_callback_query(filters.regex(r"^split_file_"))
+async def handle_split_file(client: Client, query):
+    """Handle the split offer for oversized files"""
+    session_key = query.data.split("_", 2)[2]
+    session = rename_sessions.get(session_key)
+    
+    if not session or session.is_expired():
+        rename_sessions.pop(session_key, None)
+        return await query.answer("⏰ Session expired! Please try again.", show_alert=True)
+    if query.from_user.id != session.user_id:
+        return await query.answer("❌ This is not your session!", show_alert=True)
+    
+    del rename_sessions[session_key]
+    await query.answer()
+    await query.message.edit_text(
+        f"✂️ **Splitting File**\n\n"
+        f"*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    await process_file_split(client, session, query.message)
+
+async def process_file_split(client: Client, session: RenameSession, progress_msg: Message) -> bool:
+    """
+    Download a file too large to upload straight into parts that fit
+    
+    Videos are cut at keyframes by FFmpeg's segment muxer (stream copy) so
+    every part plays on its own; other files become raw .001/.002 parts.
+    Each part uploads as soon as it is finished while the download goes on.
+    """
+    job = job_registry.create(client, session.user_id, session.chat_id, progress_msg)
+    original_msg = session.file_message
+    file = original_msg.document or original_msg.video or original_msg.audio
+    filename = sanitize_filename(file.file_name or default_filename(original_msg, 1))
+    uploader = None
+    upload_msg = None
+    
+    try:
+        split_dir = await job_workspace(job)
+        
+        media_info = await media_cache.lookup(file)
+        duration = media_info.get('duration') or 0
+        is_video = bool(original_msg.video or (file.mime_type or "").startswith('video/'))
+        segmented = is_video and duration and ffmpeg_handler.is_available()
+        extension = segment_extension(filename)
+        
+        # Segments may pile up behind the uploads; raw parts stay bounded
+        # (one being written, one queued, one uploading)
+        disk_bytes = file.file_size * 2 if segmented else min(file.file_size, Config.SPLIT_SIZE * 3)
+        await wait_for_slot(job, progress_msg, disk_bytes)
+        
+        upload_msg = await client.send_message(
+            session.chat_id,
+            "📤 **Parts upload here as soon as they are ready**",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        # Its progress carries a Cancel button too
+        job_registry.bind_message(job, upload_msg)
+        
+        # Keyframe cuts follow the average bitrate, so VBR peaks or long GOPs
+        # can still push a segment over the limit; those go up as raw pieces
+        oversized = set()
+        
+        async def send_part(path: str, name: str, index: int, as_video: bool):
+            upload_kwargs = {
+                'file_name': name,
+                'caption': f"**{name}**\n\n*Part {index} of* `{filename}`",
+                'progress': progress_for_pyrogram,
+                'progress_args': (f"Uploading Part {index}", upload_msg, time.time(), job)
+            }
+            if as_video:
+                send = lambda: client.send_video(session.chat_id, path, supports_streaming=True, **upload_kwargs)
+            else:
+                send = lambda: client.send_document(session.chat_id, path, **upload_kwargs)
+            await send_with_retry(send, lambda: job.cancelled)
+            job.token.raise_if_cancelled()
+        
+        async def upload_part(path: str, index: int):
+            name = segment_name(filename, index, extension) if segmented else part_name(filename, index)
+            if index not in oversized:
+                return await send_part(path, name, index, segmented)
+            
+            pieces = await run_fs(split_file, path, Config.SPLIT_SIZE)
+            try:
+                for number, piece in enumerate(pieces, 1):
+                    await send_part(piece, part_name(name, number), index, False)
+            finally:
+                await remove_path(*pieces)
+        
+        # Raw parts wait on disk at most one at a time; segments are bounded by the file itself
+        uploader = PartUploader(upload_part, max_pending=0 if segmented else 1)
+        
+        async def queue_segment(path: str):
+            # FFmpeg numbers segments from part000
+            index = int(os.path.basename(path)[4:7]) + 1
+            if await get_file_size(path) > Config.SPLIT_SIZE:
+                logger.warning(f"Segment {index} of {filename} is over the split size, sending it as raw pieces")
+                oversized.add(index)
+            await uploader.put(path, index)
+        
+        chunks = stream_chunks(
+            client, original_msg, progress_for_pyrogram,
+            (Messages.DOWNLOAD_PROGRESS, progress_msg, time.time(), job)
+        )
+        job.set_stage("downloading")
+        
+        try:
+            if segmented:
+                seconds = segment_seconds(duration, file.file_size, Config.SPLIT_SIZE)
+                head = await chunks.__anext__()
+                if can_pipe(filename, head):
+                    # FFmpeg cuts while the file is still arriving
+                    ok = await job.run(ffmpeg_handler.segment(
+                        None, split_dir, seconds, queue_segment,
+                        feed=prepend(head, chunks), extension=extension
+                    ))
+                else:
+                    # The index sits at the end; the whole file is needed first
+                    source_path = os.path.join(split_dir, f"source{extension}")
+                    await job.run(write_stream(prepend(head, chunks), source_path))
+                    job.set_stage("processing")
+                    ok = await job.run(ffmpeg_handler.segment(
+                        source_path, split_dir, seconds, queue_segment,
+                        extension=extension
+                    ))
+                if not ok:
+                    raise RuntimeError("FFmpeg could not cut the video")
+            else:
+                await job.run(split_stream(chunks, split_dir, Config.SPLIT_SIZE, uploader.put))
+            
+            job.set_stage("uploading")
+            parts = await job.run(uploader.close())
+        except StopTransmission:
+            raise JobCancelled()
+        
+        job.set_stage("done")
+        await db.increment_renamed_count(session.user_id, file.file_size)
+        await progress_msg.edit_text(
+            f"✅ **File Split Complete**\n\n"
+            f"**File:** `{filename}`\n"
+            f"**Parts:** `{parts}`\n\n"
+            f"*\"{get_random_quote('success')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return True
+    
+    except JobCancelled:
+        logger.info(f"Split job {job.job_id} cancelled for user {session.user_id}")
+        return False
+    
+    except DiskSpaceError as e:
+        logger.warning(f"Split job {job.job_id} refused: {e}")
+        await disk_space_failed(progress_msg, e)
+        return False
+    
+    except Exception as e:
+        if job.cancelled:
+            return False
+        logger.error(f"Split failed: {e}")
+        await progress_msg.edit_text(
+            f"❌ **Splitting Failed**\n\n"
+            f"`{str(e)}`\n\n"
+            f"*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        return False
+    
+    finally:
+        if uploader:
+            uploader.cancel()
+        if upload_msg:
+            try:
+                await upload_msg.delete()
+            except Exception:
+                pass
+        await job_registry.finish(job)
 
 # Handle other callback queries
 @Client.on_callback_query(filters.regex(r"^(keep_original|cancel_rename)_"))
 async def handle_rename_actions(client: Client, query):
     """Handle keep original and cancel actions"""
     
-    action, session_key = query.data.rsplit("_", 1)
+    # Session keys contain "_" themselves; both actions are two words long
+    verb, noun, session_key = query.data.split("_", 2)
+    action = f"{verb}_{noun}"
     
     if session_key not in rename_sessions:
         return await query.answer("❌ Session expired!", show_alert=True)
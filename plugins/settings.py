@@ -3,6 +3,8 @@ from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
 from pyrogram.enums import ParseMode
 from utils.database import db
+from utils.captions import CaptionError
+from utils.autorename import RenameTemplateError, AUTO_RENAME_FIELDS, parse_release_name
 from Bot.config import Config
 import asyncio
 import logging
@@ -16,6 +18,8 @@ DAZAI_QUOTES = {
     "suffix_set": "And every tale deserves its elegant conclusion.",
     "thumbnail_set": "A picture speaks volumes, much like the silence between words.",
     "metadata_enabled": "Even files deserve their identity properly documented.",
+    "tracks_set": "Travel light. Only the voices worth hearing should come along.",
+    "autorename_set": "Why ask every time when the name was written in the file all along?",
     "settings_reset": "Sometimes we need to start over completely, like turning to a blank page.",
     "no_caption": "Silence can be more eloquent than words sometimes.",
     "no_thumbnail": "The absence of image is also a form of expression.",
@@ -37,7 +41,14 @@ async def set_caption_command(client: Client, message: Message):
     if len(message.command) > 1:
         # Caption provided directly with command
         caption = " ".join(message.command[1:])
-        await db.set_caption(user_id, caption)
+        try:
+            await db.set_caption(user_id, caption)
+        except CaptionError as e:
+            return await message.reply_text(
+                f"❌ **Invalid Caption Template**\n\n`{e}`\n\n"
+                "Send /set_caption to see the available variables.",
+                parse_mode=ParseMode.MARKDOWN
+            )
         await message.reply_text(
             f"📝 **Caption Set Successfully**\n\n"
             f"Your new caption:\n`{caption}`\n\n"
@@ -52,7 +63,8 @@ async def set_caption_command(client: Client, message: Message):
             "• `{filename}` - Original file name\n"
             "• `{filesize}` - File size in human readable format\n"
             "• `{duration}` - Duration for videos/audio\n"
-            "• `{filetype}` - File type (video/document/audio)\n\n"
+            "• `{filetype}` - File type (video/document/audio)\n"
+            "• `{md5}` `{sha1}` `{sha256}` `{crc32}` - File checksums\n\n"
             "**Example:**\n"
             "`📁 {filename}\n💾 Size: {filesize}\n⏱️ Duration: {duration}`\n\n"
             "*Send your caption or /cancel to abort*",
@@ -401,6 +413,160 @@ async def metadata_command(client: Client, message: Message):
         parse_mode=ParseMode.MARKDOWN
     )
 
+# Track Selection
+def format_track_rules(rules: dict) -> str:
+    languages = ", ".join(rules.get("languages") or []) or "All"
+    return (
+        f"**Languages:** `{languages}`\n"
+        f"**Drop Commentary:** {'✅ Yes' if rules.get('drop_commentary') else '❌ No'}\n"
+        f"**Drop Image Subtitles:** {'✅ Yes' if rules.get('drop_image_subs') else '❌ No'}"
+    )
+
+@Client.on_message(filters.command("tracks") & (filters.private | filters.group))
+async def tracks_command(client: Client, message: Message):
+    user_id = message.from_user.id
+    
+    # Check group mention
+    if message.chat.type.name != "PRIVATE":
+        bot_me = await client.get_me()
+        if not (f"@{bot_me.username}" in (message.text or "") or 
+                (message.reply_to_message and message.reply_to_message.from_user.is_self)):
+            return
+    
+    args = [arg.lower() for arg in message.command[1:]]
+    
+    if not args:
+        rules = await db.get_track_rules(user_id)
+        return await message.reply_text(
+            f"🎧 **Track Selection**\n\n"
+            f"{format_track_rules(rules)}\n\n"
+            "Unwanted audio and subtitle tracks are dropped without re-encoding.\n\n"
+            "**Usage:**\n"
+            "• `/tracks lang eng jpn` - Keep only these languages\n"
+            "• `/tracks lang all` - Keep every language\n"
+            "• `/tracks commentary on|off` - Drop commentary tracks\n"
+            "• `/tracks imagesubs on|off` - Drop PGS/VobSub subtitles\n"
+            "• `/tracks reset` - Keep everything",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    option, values = args[0], args[1:]
+    
+    if option == "lang" and values:
+        languages = [] if values[0] in ("all", "off") else values
+        if any(not lang.isalpha() or len(lang) not in (2, 3) for lang in languages):
+            return await message.reply_text(
+                "❌ **Invalid Language Code**\n\n"
+                "Use ISO 639 codes as found in the file, e.g. `eng`, `jpn`, `spa`.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        await db.set_track_rules(user_id, languages=languages)
+    elif option in ("commentary", "imagesubs") and values and values[0] in ("on", "off"):
+        enabled = values[0] == "on"
+        if option == "commentary":
+            await db.set_track_rules(user_id, drop_commentary=enabled)
+        else:
+            await db.set_track_rules(user_id, drop_image_subs=enabled)
+    elif option == "reset":
+        await db.set_track_rules(user_id, languages=[], drop_commentary=False, drop_image_subs=False)
+    else:
+        return await message.reply_text(
+            "❌ **Unknown Option**\n\nSend `/tracks` to see the available options.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    rules = await db.get_track_rules(user_id)
+    await message.reply_text(
+        f"✅ **Track Selection Updated**\n\n"
+        f"{format_track_rules(rules)}\n\n"
+        f"*\"{DAZAI_QUOTES['tracks_set']}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
+# Auto Rename
+AUTO_RENAME_FORMATS = ("document", "video", "audio")
+
+def format_auto_rename(auto: dict) -> str:
+    return (
+        f"**Status:** {'✅ Enabled' if auto.get('enabled') else '❌ Disabled'}\n"
+        f"**Template:** `{auto.get('template') or 'Not set'}`\n"
+        f"**Upload As:** `{auto.get('format', 'document')}`"
+    )
+
+@Client.on_message(filters.command("autorename") & (filters.private | filters.group))
+async def autorename_command(client: Client, message: Message):
+    user_id = message.from_user.id
+    
+    # Check group mention
+    if message.chat.type.name != "PRIVATE":
+        bot_me = await client.get_me()
+        if not (f"@{bot_me.username}" in (message.text or "") or 
+                (message.reply_to_message and message.reply_to_message.from_user.is_self)):
+            return
+    
+    args = message.command[1:]
+    option = args[0].lower() if args else ""
+    
+    if not args:
+        auto = await db.get_auto_rename(user_id)
+        fields = " ".join(f"`{{{field}}}`" for field in AUTO_RENAME_FIELDS)
+        return await message.reply_text(
+            f"🤖 **Auto Rename**\n\n"
+            f"{format_auto_rename(auto)}\n\n"
+            "Files are renamed from a template without asking, using details read "
+            "from the original filename or the media itself. Files the template "
+            "cannot be filled for fall back to the usual prompt.\n\n"
+            f"**Fields:** {fields}\n\n"
+            "**Usage:**\n"
+            "• `/autorename {title} S{season:02}E{episode:02} [{resolution}]` - Set template and enable\n"
+            "• `/autorename on|off` - Toggle auto rename\n"
+            "• `/autorename as document|video|audio` - Upload format\n"
+            "• `/autorename test <filename>` - Show what is detected in a filename",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    if option == "test" and len(args) > 1:
+        filename = message.text.split(None, 2)[2]
+        fields = parse_release_name(filename)
+        detected = "\n".join(f"• **{key}:** `{fields[key]}`" for key in AUTO_RENAME_FIELDS if key in fields)
+        return await message.reply_text(
+            f"🔎 **Detected Fields**\n\n{detected or 'Nothing recognised'}",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    if option in ("on", "off"):
+        auto = await db.get_auto_rename(user_id)
+        if option == "on" and not auto.get("template"):
+            return await message.reply_text(
+                "❌ **No Template Set**\n\nSet one first with `/autorename <template>`.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        await db.set_auto_rename(user_id, enabled=option == "on")
+    elif option == "as" and len(args) > 1 and args[1].lower() in AUTO_RENAME_FORMATS:
+        await db.set_auto_rename(user_id, upload_format=args[1].lower())
+    elif option == "as":
+        return await message.reply_text(
+            "❌ **Unknown Format**\n\nChoose one of `document`, `video` or `audio`.",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    else:
+        template = message.text.split(None, 1)[1].strip()
+        try:
+            await db.set_auto_rename(user_id, enabled=True, template=template)
+        except RenameTemplateError as e:
+            return await message.reply_text(
+                f"❌ **Invalid Template**\n\n{e}\n\nSend `/autorename` to see the available fields.",
+                parse_mode=ParseMode.MARKDOWN
+            )
+    
+    auto = await db.get_auto_rename(user_id)
+    await message.reply_text(
+        f"✅ **Auto Rename Updated**\n\n"
+        f"{format_auto_rename(auto)}\n\n"
+        f"*\"{DAZAI_QUOTES['autorename_set']}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+
 # Settings Overview Command
 @Client.on_message(filters.command("settings") & (filters.private | filters.group))
 async def settings_overview(client: Client, message: Message):
@@ -422,6 +588,10 @@ async def settings_overview(client: Client, message: Message):
     has_thumb = "✅ Set" if user_data.get("thumbnail") else "❌ Not set"
     metadata = user_data.get("metadata", {})
     meta_status = "✅ Enabled" if metadata.get("enabled") else "❌ Disabled"
+    tracks = user_data.get("tracks") or {}
+    track_status = "✅ Filtering" if any(tracks.values()) else "❌ Keep all"
+    user_settings = user_data.get("settings", {})
+    auto_status = "✅ Enabled" if user_settings.get("auto_rename") else "❌ Disabled"
     
     # Truncate long values for display
     def truncate(text, max_len=30):
@@ -437,6 +607,8 @@ async def settings_overview(client: Client, message: Message):
 🔤 **Suffix:** `{truncate(suffix)}`
 🖼️ **Thumbnail:** {has_thumb}
 📊 **Metadata:** {meta_status}
+🎧 **Tracks:** {track_status}
+🤖 **Auto Rename:** {auto_status}
 
 *"Settings shape our reality, like words shape our thoughts."*
 
@@ -446,6 +618,8 @@ async def settings_overview(client: Client, message: Message):
 • `/set_suffix` - Add suffix to filenames
 • Send photo - Set as thumbnail
 • `/metadata` - Configure file metadata
+• `/tracks` - Choose audio/subtitle tracks to keep
+• `/autorename` - Rename files from a template automatically
 • `/reset_all` - Reset all settings
 """
     
@@ -519,7 +693,14 @@ async def handle_caption_reply(client: Client, message: Message):
             )
             return
         
-        await db.set_caption(user_id, new_caption)
+        try:
+            await db.set_caption(user_id, new_caption)
+        except CaptionError as e:
+            return await message.reply_text(
+                f"❌ **Invalid Caption Template**\n\n`{e}`\n\n"
+                "Send /set_caption to see the available variables.",
+                parse_mode=ParseMode.MARKDOWN
+            )
         
         await message.reply_text(
             f"✅ **Caption Set Successfully**\n\n"
@@ -601,6 +782,7 @@ Use these variables in your caption:
 • `{filesize}` - File size (e.g., 1.5 GB)
 • `{duration}` - Video/audio duration
 • `{filetype}` - File type (video/document/audio)
+• `{md5}`, `{sha1}`, `{sha256}`, `{crc32}` - File checksums
 
 **Example template:**
 ```
@@ -0,0 +1,458 @@
+# plugins/tools.py - Media Tools (Screenshots, Samples, Transcoding, Audio, Archives) with Dazai Theme
+from pyrogram import Client, filters, StopTransmission
+from pyrogram.types import Message, InputMediaPhoto
+from pyrogram.enums import ParseMode
+import os
+import time
+import logging
+from utils.helpers import (
+    humanbytes,
+    progress_for_pyrogram,
+    create_temp_filename,
+    get_random_quote,
+    ffmpeg_progress,
+    get_file_size
+)
+from utils.jobs import job_registry, JobCancelled
+from utils.ffmpeg import ffmpeg_handler
+from utils.media_cache import media_cache
+from utils.screenshots import generate_screenshot_set, create_sample_clip
+from utils.transcode import transcode_video, VIDEO_CODECS
+from utils.splitter import PartUploader, stream_chunks
+from utils.archives import archive_kind, extract_archive, ArchiveError
+from utils.scratch import job_workspace
+from Bot.config import Config
+from Bot.messages import Messages
+
+logger = logging.getLogger(__name__)
+
+# Tool commands are sent as replies to media, which the generic reply
+# handlers in rename/settings would otherwise swallow in group 0
+TOOLS_GROUP = -1
+
+def get_replied_media(message: Message):
+    """Return the video/document message this command replies to"""
+    source = message.reply_to_message
+    if source and (source.video or source.document):
+        return source
+    return None
+
+def parse_int_argument(message: Message, default: int, minimum: int, maximum: int) -> int:
+    """Read an optional numeric command argument, clamped to a range"""
+    if len(message.command) > 1 and message.command[1].isdigit():
+        return max(minimum, min(int(message.command[1]), maximum))
+    return default
+
+def source_disk_bytes(source: Message, copies: float = Config.DISK_STAGE_MULTIPLIER) -> int:
+    """Scratch space a tool job needs: the download plus what it writes next to it"""
+    file = source.video or source.document
+    return int((file.file_size or 0) * copies)
+
+async def download_source(client: Client, source: Message, job, status_msg: Message) -> str:
+    """Download the replied media for a tool job, tracking it for cleanup"""
+    file = source.video or source.document
+    temp_filename = create_temp_filename(file.file_name or "video.mp4", job.user_id)
+    download_path = os.path.join(await job_workspace(job), temp_filename)
+    
+    job.set_stage("downloading")
+    
+    downloaded = await client.download_media(
+        source,
+        file_name=download_path,
+        progress=progress_for_pyrogram,
+        progress_args=(Messages.DOWNLOAD_PROGRESS, status_msg, time.time(), job)
+    )
+    
+    job.token.raise_if_cancelled()
+    if not downloaded:
+        raise RuntimeError("Download failed")
+    
+    return download_path
+
+@Client.on_message(filters.command(["screenshots", "ss"]), group=TOOLS_GROUP)
+async def screenshots_command(client: Client, message: Message):
+    """Generate evenly spaced screenshots and a contact sheet for a video"""
+    source = get_replied_media(message)
+    if not source or not ffmpeg_handler.is_available():
+        return await message.reply_text(
+            "📸 **Screenshots**\n\n"
+            "Reply to a video with `/screenshots [count]` to capture frames.\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    count = parse_int_argument(message, Config.SCREENSHOT_COUNT, 1, 10)
+    status_msg = await message.reply_text(
+        f"📸 **Capturing {count} Screenshots**\n\n*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    job = job_registry.create(client, message.from_user.id, message.chat.id, status_msg)
+    
+    try:
+        await job_registry.acquire(job, source_disk_bytes(source, 1))
+        video_path = await download_source(client, source, job, status_msg)
+        
+        job.set_stage("processing")
+        await status_msg.edit_text(
+            "🎞 **Seeking Keyframes**\n\n*\"Every frame tells its own story...\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        media_info = await media_cache.get_info((source.video or source.document).file_unique_id, video_path)
+        result = await job.run(generate_screenshot_set(
+            video_path, await job_workspace(job), count, duration=media_info.get('duration')
+        ))
+        job.track_path(result['sheet'], *result['screenshots'])
+        
+        if not result['screenshots']:
+            return await status_msg.edit_text(
+                f"❌ **No Frames Captured**\n\n*\"{get_random_quote('error')}\"*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        
+        job.set_stage("uploading")
+        media = [InputMediaPhoto(path) for path in result['screenshots']]
+        await client.send_media_group(message.chat.id, media, reply_to_message_id=source.id)
+        
+        if result['sheet']:
+            await client.send_photo(
+                message.chat.id,
+                result['sheet'],
+                caption="🎞 **Contact Sheet**",
+                reply_to_message_id=source.id
+            )
+        
+        await status_msg.delete()
+    
+    except JobCancelled:
+        pass
+    
+    except Exception as e:
+        if job.cancelled:
+            return
+        logger.error(f"Screenshot generation failed: {e}")
+        await status_msg.edit_text(
+            f"❌ **Screenshot Generation Failed**\n\n`{e}`\n\n*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    finally:
+        await job_registry.finish(job)
+
+@Client.on_message(filters.command("sample"), group=TOOLS_GROUP)
+async def sample_command(client: Client, message: Message):
+    """Cut a stream-copied sample clip from the middle of a video"""
+    source = get_replied_media(message)
+    if not source or not ffmpeg_handler.is_available():
+        return await message.reply_text(
+            "🎬 **Sample Clip**\n\n"
+            "Reply to a video with `/sample [seconds]` to cut a preview.\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    length = parse_int_argument(message, Config.SAMPLE_DURATION, 5, 300)
+    status_msg = await message.reply_text(
+        f"🎬 **Cutting a {length}s Sample**\n\n*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    job = job_registry.create(client, message.from_user.id, message.chat.id, status_msg)
+    
+    try:
+        await job_registry.acquire(job, source_disk_bytes(source, 1))
+        video_path = await download_source(client, source, job, status_msg)
+        
+        job.set_stage("processing")
+        base, ext = os.path.splitext(video_path)
+        sample_path = f"{base}_sample{ext if ext.lower() in ('.mp4', '.mkv', '.webm', '.mov') else '.mkv'}"
+        job.track_path(sample_path)
+        
+        if not await job.run(create_sample_clip(video_path, sample_path, length)):
+            return await status_msg.edit_text(
+                f"❌ **Sample Extraction Failed**\n\n*\"{get_random_quote('error')}\"*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        
+        job.set_stage("uploading")
+        info = await ffmpeg_handler.get_media_info(sample_path)
+        await client.send_video(
+            message.chat.id,
+            sample_path,
+            caption=f"🎬 **Sample** • `{humanbytes(await get_file_size(sample_path))}`",
+            duration=int(info.get('duration', 0)),
+            width=info.get('width', 0),
+            height=info.get('height', 0),
+            supports_streaming=True,
+            reply_to_message_id=source.id,
+            progress=progress_for_pyrogram,
+            progress_args=(Messages.UPLOAD_PROGRESS, status_msg, time.time(), job)
+        )
+        
+        await status_msg.delete()
+    
+    except JobCancelled:
+        pass
+    
+    except Exception as e:
+        if job.cancelled:
+            return
+        logger.error(f"Sample generation failed: {e}")
+        await status_msg.edit_text(
+            f"❌ **Sample Generation Failed**\n\n`{e}`\n\n*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    finally:
+        await job_registry.finish(job)
+
+@Client.on_message(filters.command(["compress", "transcode"]), group=TOOLS_GROUP)
+async def compress_command(client: Client, message: Message):
+    """Re-encode a video to H.264/HEVC, optionally to a target size in MB"""
+    source = get_replied_media(message)
+    if not source or not ffmpeg_handler.is_available():
+        return await message.reply_text(
+            "🗜 **Compress Video**\n\n"
+            "Reply to a video with `/compress [size_mb] [h264|hevc]`.\n"
+            "• `/compress` - Re-encode to H.264 at constant quality\n"
+            "• `/compress 300` - Aim for a ~300 MB file\n"
+            "• `/compress 300 hevc` - Same, encoded as HEVC\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    codec = 'h264'
+    target_size = None
+    for arg in message.command[1:]:
+        if arg.lower() in VIDEO_CODECS:
+            codec = arg.lower()
+        elif arg.isdigit() and int(arg) > 0:
+            target_size = int(arg) * 1024 * 1024
+    
+    status_msg = await message.reply_text(
+        f"🗜 **Preparing {codec.upper()} Encode**\n\n*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    job = job_registry.create(client, message.from_user.id, message.chat.id, status_msg)
+    
+    try:
+        await job_registry.acquire(job, source_disk_bytes(source))
+        video_path = await download_source(client, source, job, status_msg)
+        
+        job.set_stage("processing")
+        base, ext = os.path.splitext(video_path)
+        output_path = f"{base}_{codec}{'.mkv' if ext.lower() == '.mkv' else '.mp4'}"
+        job.track_path(output_path)
+        
+        media_info = await media_cache.get_info((source.video or source.document).file_unique_id, video_path)
+        file_size = await get_file_size(video_path)
+        
+        if not await job.run(transcode_video(
+            video_path, output_path, codec, target_size, media_info,
+            ffmpeg_progress(Messages.PROCESSING_PROGRESS, status_msg, file_size, job)
+        )):
+            return await status_msg.edit_text(
+                f"❌ **Encoding Failed**\n\n*\"{get_random_quote('error')}\"*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        
+        job.set_stage("uploading")
+        output_size = await get_file_size(output_path)
+        original_name = (source.video or source.document).file_name or os.path.basename(output_path)
+        await client.send_video(
+            message.chat.id,
+            output_path,
+            file_name=f"{os.path.splitext(original_name)[0]}{os.path.splitext(output_path)[1]}",
+            caption=(
+                f"🗜 **{codec.upper()} Encode**\n"
+                f"`{humanbytes(file_size)}` → `{humanbytes(output_size)}`"
+            ),
+            duration=int(media_info.get('duration', 0)),
+            width=media_info.get('width', 0),
+            height=media_info.get('height', 0),
+            supports_streaming=True,
+            reply_to_message_id=source.id,
+            progress=progress_for_pyrogram,
+            progress_args=(Messages.UPLOAD_PROGRESS, status_msg, time.time(), job)
+        )
+        
+        await status_msg.delete()
+    
+    except JobCancelled:
+        pass
+    
+    except Exception as e:
+        if job.cancelled:
+            return
+        logger.error(f"Transcode failed: {e}")
+        await status_msg.edit_text(
+            f"❌ **Encoding Failed**\n\n`{e}`\n\n*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    finally:
+        await job_registry.finish(job)
+
+@Client.on_message(filters.command(["extractaudio", "audio"]), group=TOOLS_GROUP)
+async def extract_audio_command(client: Client, message: Message):
+    """Copy a video's audio track into its own file without re-encoding"""
+    source = get_replied_media(message)
+    if not source or not ffmpeg_handler.is_available():
+        return await message.reply_text(
+            "🎧 **Extract Audio**\n\n"
+            "Reply to a video with `/extractaudio` to get its soundtrack as an audio file.\n"
+            "The track is copied as-is, so there is no quality loss.\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    status_msg = await message.reply_text(
+        f"🎧 **Preparing Audio Extraction**\n\n*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    job = job_registry.create(client, message.from_user.id, message.chat.id, status_msg)
+    
+    try:
+        await job_registry.acquire(job, source_disk_bytes(source))
+        video_path = await download_source(client, source, job, status_msg)
+        
+        job.set_stage("processing")
+        base = f"{os.path.splitext(video_path)[0]}_audio"
+        file_size = await get_file_size(video_path)
+        audio_path = await job.run(ffmpeg_handler.extract_audio(
+            video_path, base, ffmpeg_progress(Messages.PROCESSING_PROGRESS, status_msg, file_size, job)
+        ))
+        if not audio_path:
+            return await status_msg.edit_text(
+                f"❌ **No Audio Extracted**\n\nThe file has no readable audio track.\n\n"
+                f"*\"{get_random_quote('error')}\"*",
+                parse_mode=ParseMode.MARKDOWN
+            )
+        job.track_path(audio_path)
+        
+        job.set_stage("uploading")
+        original_name = (source.video or source.document).file_name or "audio"
+        title = os.path.splitext(original_name)[0]
+        info = await ffmpeg_handler.get_media_info(audio_path)
+        await client.send_audio(
+            message.chat.id,
+            audio_path,
+            file_name=f"{title}{os.path.splitext(audio_path)[1]}",
+            title=title,
+            duration=int(info.get('duration', 0)),
+            caption=f"🎧 **{title}** • `{humanbytes(await get_file_size(audio_path))}`",
+            reply_to_message_id=source.id,
+            progress=progress_for_pyrogram,
+            progress_args=(Messages.UPLOAD_PROGRESS, status_msg, time.time(), job)
+        )
+        
+        await status_msg.delete()
+    
+    except JobCancelled:
+        pass
+    
+    except Exception as e:
+        if job.cancelled:
+            return
+        logger.error(f"Audio extraction failed: {e}")
+        await status_msg.edit_text(
+            f"❌ **Audio Extraction Failed**\n\n`{e}`\n\n*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    finally:
+        await job_registry.finish(job)
+
+@Client.on_message(filters.command(["extract", "unzip"]), group=TOOLS_GROUP)
+async def extract_command(client: Client, message: Message):
+    """Unpack a zip/tar and send its files back one by one"""
+    source = message.reply_to_message
+    document = source.document if source else None
+    kind = archive_kind(document.file_name) if document else None
+    if not kind:
+        return await message.reply_text(
+            "📂 **Extract Archive**\n\n"
+            "Reply to a `.zip` or `.tar` (gz/bz2/xz) file with `/extract`.\n"
+            f"Up to {Config.MAX_BATCH_FILES} files are sent back as documents.\n\n"
+            f"*\"{get_random_quote('waiting')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    status_msg = await message.reply_text(
+        f"📂 **Preparing Extraction**\n\n*\"{get_random_quote('waiting')}\"*",
+        parse_mode=ParseMode.MARKDOWN
+    )
+    job = job_registry.create(client, message.from_user.id, message.chat.id, status_msg)
+    names = {}
+    uploader = None
+    
+    try:
+        work_dir = await job_workspace(job)
+        await job_registry.acquire(job, source_disk_bytes(source))
+        
+        async def upload_member(path: str, index: int):
+            await client.send_document(
+                message.chat.id, path, file_name=names.pop(index),
+                reply_to_message_id=source.id
+            )
+            job.token.raise_if_cancelled()
+        
+        async def on_member(path: str, index: int, name: str):
+            names[index] = name
+            await uploader.put(path, index)
+        
+        # One member uploads while the next is extracted
+        uploader = PartUploader(upload_member, max_pending=1)
+        
+        try:
+            if kind == 'tar':
+                # Tar members are read in order, straight from the download
+                job.set_stage("downloading")
+                archive = stream_chunks(
+                    client, source, progress_for_pyrogram,
+                    (Messages.DOWNLOAD_PROGRESS, status_msg, time.time(), job)
+                )
+            else:
+                # Zip keeps its index at the end, so it needs the whole file first
+                archive = await download_source(client, source, job, status_msg)
+                job.set_stage("processing")
+            
+            count, skipped = await job.run(extract_archive(
+                kind, archive, work_dir, on_member,
+                cancelled=lambda: job.cancelled,
+                max_members=Config.MAX_BATCH_FILES,
+                max_member_size=Config.MAX_FILE_SIZE
+            ))
+            job.set_stage("uploading")
+            await job.run(uploader.close())
+        except StopTransmission:
+            raise JobCancelled()
+        
+        text = (
+            f"✅ **Archive Extracted**\n\n"
+            f"**Files Sent:** `{count}`\n"
+        )
+        if skipped:
+            listed = "\n".join(f"• `{name}`" for name in skipped[:10])
+            more = f"\n• ...and {len(skipped) - 10} more" if len(skipped) > 10 else ""
+            text += f"**Skipped ({len(skipped)}):**\n{listed}{more}\n"
+        await status_msg.edit_text(
+            f"{text}\n*\"{get_random_quote('success')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    except JobCancelled:
+        pass
+    
+    except Exception as e:
+        if job.cancelled:
+            return
+        logger.error(f"Extraction failed: {e}")
+        reason = e if isinstance(e, ArchiveError) else "The archive could not be read"
+        await status_msg.edit_text(
+            f"❌ **Extraction Failed**\n\n`{reason}`\n\n*\"{get_random_quote('error')}\"*",
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    finally:
+        if uploader:
+            uploader.cancel()
+        await job_registry.finish(job)
@@ -0,0 +1,10 @@
+# tests/conftest.py - Test Environment (no Telegram, MongoDB or network)
+import os
+import sys
+import tempfile
+
+# Bot.config reads these at import time
+os.environ.setdefault("API_ID", "0")
+os.environ.setdefault("SCRATCH_DIR", tempfile.mkdtemp(prefix="dazai-tests-"))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
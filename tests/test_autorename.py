@@ -0,0 +1,55 @@
+# tests/test_autorename.py - Release Name Parser and Auto-Rename Templates
+import pytest
+from utils.autorename import (
+    parse_release_name, compile_rename_template, render_auto_name, RenameTemplateError
+)
+
+@pytest.mark.parametrize("filename, expected", [
+    ("[SubsPlease] Show Name - 05 (1080p) [ABCD1234].mkv",
+     {'group': 'SubsPlease', 'title': 'Show Name', 'season': 1, 'episode': 5, 'resolution': '1080p'}),
+    ("Show.Name.S02E07.720p.WEB-DL.x264-GRP.mkv",
+     {'title': 'Show Name', 'season': 2, 'episode': 7, 'resolution': '720p', 'source': 'WEB-DL', 'codec': 'x264'}),
+    ("Movie.Name.2019.2160p.BluRay.HEVC.TrueHD.mkv",
+     {'title': 'Movie Name', 'year': 2019, 'resolution': '2160p', 'source': 'BluRay', 'codec': 'HEVC',
+      'audio': 'TrueHD'}),
+    ("Blade Runner 2049 (2017) 1080p.mp4",
+     {'title': 'Blade Runner 2049', 'year': 2017, 'resolution': '1080p'}),
+    ("Show_Name_3x12_HDTV.avi",
+     {'title': 'Show Name', 'season': 3, 'episode': 12, 'source': 'HDTV'}),
+    ("[Group] Show 2nd Season - 03 [4K].mkv",
+     {'group': 'Group', 'title': 'Show', 'season': 2, 'episode': 3, 'resolution': '2160p'}),
+])
+def test_parse_release_name(filename, expected):
+    assert parse_release_name(filename) == expected
+
+def test_parse_plain_name_is_title_only():
+    assert parse_release_name("holiday video.mp4") == {'title': 'holiday video'}
+
+def test_compile_collects_fields():
+    compiled = compile_rename_template("{title} S{season:02}E{episode:02} [{resolution}]")
+    assert compiled.fields == {'title', 'season', 'episode', 'resolution'}
+
+@pytest.mark.parametrize("template", [
+    "", "x" * 201, "no fields", "{unknown}", "{title", "{title:{season}}"
+])
+def test_compile_rejects_bad_templates(template):
+    with pytest.raises(RenameTemplateError):
+        compile_rename_template(template)
+
+def test_render_formats_and_keeps_extension():
+    assert render_auto_name(
+        "{title} S{season:02}E{episode:02} [{resolution}]",
+        "[SubsPlease] Show Name - 05 (1080p) [ABCD1234].mkv"
+    ) == "Show Name S01E05 [1080p].mkv"
+
+def test_render_fills_resolution_and_codec_from_probe():
+    assert render_auto_name(
+        "{title} {resolution} {codec}", "Home Movie.mp4", {'width': 1920, 'height': 1080, 'codec': 'hevc'}
+    ) == "Home Movie 1080p HEVC.mp4"
+
+def test_render_uses_batch_index():
+    assert render_auto_name("{title} - {n:03}", "Lecture.pdf", index=7) == "Lecture - 007.pdf"
+
+def test_render_returns_none_when_a_field_is_missing():
+    assert render_auto_name("{title} E{episode}", "holiday video.mp4") is None
+    assert render_auto_name("{bogus}", "Show - 01.mkv") is None
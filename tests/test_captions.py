@@ -0,0 +1,66 @@
+# tests/test_captions.py - Compiled Caption Templates
+import pytest
+from utils.captions import compile_caption, validate_caption, CaptionError, MAX_CAPTION_LENGTH
+
+FILE_INFO = {
+    'file_name': 'ningen_shikkaku.mkv',
+    'file_size': 2048,
+    'mime_type': 'video/mp4',
+    'duration': 125,
+    'width': 1920,
+    'height': 1080,
+}
+
+def test_render_builtin_variables():
+    caption = compile_caption("{filename} | {filesize} | {duration} | {filetype} | {resolution}")
+    assert caption.render(FILE_INFO) == "ningen_shikkaku.mkv | 2.00 KB | 2m 5s | Video | 1920x1080"
+    assert caption.variables == {'filename', 'filesize', 'duration', 'filetype', 'resolution'}
+
+def test_missing_values_fall_back():
+    caption = compile_caption("{md5} {resolution} {duration} {filename}")
+    assert caption.render({}) == "N/A N/A N/A Unknown"
+
+def test_lazy_values_are_only_resolved_when_used():
+    calls = []
+
+    def probe():
+        calls.append(1)
+        return 'abc123'
+
+    compile_caption("{filename}").render({**FILE_INFO, 'sha256': probe})
+    assert calls == []
+
+    rendered = compile_caption("{sha256} {sha256:>8}").render({**FILE_INFO, 'sha256': probe})
+    assert rendered == "abc123   abc123"
+    assert calls == [1]
+
+def test_custom_vars_override_builtins():
+    caption = compile_caption("{bot_name}: {filename!r}")
+    assert caption.render(FILE_INFO, {'bot_name': 'Yozo'}) == "Yozo: 'ningen_shikkaku.mkv'"
+
+def test_numeric_spec_on_placeholder_renders_as_is():
+    assert compile_caption("{width:05d}").render({}) == "00000"
+    assert compile_caption("{md5:05d}").render({}) == "N/A"
+
+def test_compiled_templates_are_cached():
+    assert compile_caption("{filename}") is compile_caption("{filename}")
+
+@pytest.mark.parametrize("template", [
+    "{}",
+    "{0}",
+    "{filename.__class__}",
+    "{filename[0]}",
+    "{unknown}",
+    "{filename:{width}}",
+    "{filename",
+    "filename}",
+    "x" * (MAX_CAPTION_LENGTH + 1),
+])
+def test_invalid_templates_are_rejected(template):
+    with pytest.raises(CaptionError):
+        compile_caption(template)
+    assert validate_caption(template)
+
+def test_valid_template_has_no_error():
+    assert validate_caption("{{literal}} {filename}") is None
+    assert compile_caption("{{literal}}").render(FILE_INFO) == "{literal}"
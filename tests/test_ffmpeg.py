@@ -0,0 +1,73 @@
+# tests/test_ffmpeg.py - FFmpeg Output Handling
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+from collections import deque
+import pytest
+from utils import ffmpeg
+from utils.ffmpeg import _read_tail, STDERR_READ_SIZE
+
+def read_tail(data: bytes, lines: int = 5) -> list:
+    async def run():
+        stream = asyncio.StreamReader()
+        stream.feed_data(data)
+        stream.feed_eof()
+        tail = deque(maxlen=lines)
+        await _read_tail(stream, tail)
+        return list(tail)
+    return asyncio.run(run())
+
+def test_read_tail_survives_carriage_return_stats():
+    # FFmpeg's stats line is rewritten with \r and never ends in \n
+    stats = b"frame=  100 fps=25 size=1024kB time=00:00:04.00\r" * 20000
+    assert len(stats) > 2 ** 16
+    tail = read_tail(stats + b"Error while decoding stream\n", lines=2)
+    assert tail[-1] == b"Error while decoding stream"
+    assert tail[0].startswith(b"frame=")
+
+def test_read_tail_keeps_last_lines_only():
+    assert read_tail(b"".join(b"line %d\n" % i for i in range(100)), lines=3) == [
+        b"line 97", b"line 98", b"line 99"
+    ]
+
+def test_read_tail_bounds_unterminated_line():
+    tail = read_tail(b"x" * (STDERR_READ_SIZE * 4))
+    assert len(tail) == 1
+    assert len(tail[0]) <= STDERR_READ_SIZE
+
+def test_read_tail_keeps_crlf_lines_whole():
+    assert read_tail(b"first\r\nsecond\r\n") == [b"first", b"second"]
+
+def child_rlimit_as(preexec) -> int:
+    out = subprocess.run(
+        [sys.executable, "-c", "import resource; print(resource.getrlimit(resource.RLIMIT_AS)[0])"],
+        preexec_fn=preexec, capture_output=True, text=True, check=True
+    )
+    return int(out.stdout)
+
+def test_ffmpeg_children_get_no_address_space_cap(monkeypatch):
+    monkeypatch.setattr(ffmpeg.Config, "FFMPEG_MAX_MEMORY_MB", 64)
+    monkeypatch.setattr(ffmpeg.Config, "FFMPEG_MAX_CPU_SECONDS", 0)
+    assert child_rlimit_as(ffmpeg._limit_child_resources) == resource.getrlimit(resource.RLIMIT_AS)[0]
+    assert child_rlimit_as(ffmpeg._limit_probe_resources) == 64 * 1024 * 1024
+
+def test_sampler_kills_process_group_over_rss_limit(monkeypatch):
+    pytest.importorskip("psutil")
+    monkeypatch.setattr(ffmpeg.Config, "FFMPEG_MAX_MEMORY_MB", 32)
+    process = subprocess.Popen(
+        [sys.executable, "-c", "import time; data = bytearray(128 * 1024 * 1024); time.sleep(30)"],
+        start_new_session=True
+    )
+    try:
+        sampler = ffmpeg._UsageSampler(process.pid)
+        deadline = time.monotonic() + 10
+        while not sampler.over_memory and time.monotonic() < deadline:
+            sampler.sample()
+            time.sleep(0.1)
+        assert sampler.over_memory
+        assert process.wait(timeout=5) < 0
+    finally:
+        if process.poll() is None:
+            process.kill()
@@ -0,0 +1,105 @@
+# tests/test_janitor.py - Orphaned Scratch File Cleanup
+import asyncio
+import os
+import time
+import pytest
+from utils import janitor as janitor_module
+from utils.janitor import Janitor
+
+HOUR = 3600
+
+@pytest.fixture
+def scratch(tmp_path, monkeypatch):
+    active = set()
+    monkeypatch.setattr(janitor_module.job_registry, "active_paths", lambda: set(active))
+    partial_dir = tmp_path / "partial"
+    partial_dir.mkdir()
+    return tmp_path, partial_dir, active
+
+def make(path, size: int, age: float) -> str:
+    """A file of ``size`` bytes last modified ``age`` seconds ago"""
+    path.write_bytes(b"\0" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+def sweep(janitor: Janitor, **kwargs):
+    return asyncio.run(janitor.sweep(**kwargs))
+
+def test_old_orphans_go_young_ones_stay(scratch):
+    directory, partial_dir, _ = scratch
+    old = make(directory / "old.mkv", 10, 2 * HOUR)
+    young = make(directory / "young.mkv", 10, 60)
+
+    janitor = Janitor(str(directory), grace=HOUR, quota=0, interval=60,
+                      partial_dir=str(partial_dir), partial_keep=0)
+    assert sweep(janitor) == (1, 10)
+    assert not os.path.exists(old)
+    assert os.path.exists(young)
+
+def test_active_job_files_are_kept(scratch):
+    directory, partial_dir, active = scratch
+    job_dir = directory / "job_1"
+    job_dir.mkdir()
+    owned = make(job_dir / "part.001", 10, 2 * HOUR)
+    os.utime(job_dir, (time.time() - 2 * HOUR,) * 2)
+    active.add(owned)
+
+    janitor = Janitor(str(directory), grace=0, quota=0, interval=60,
+                      partial_dir=str(partial_dir), partial_keep=0)
+    assert sweep(janitor) == (0, 0)
+    assert os.path.exists(owned)
+
+def test_directories_are_measured_and_removed_whole(scratch):
+    directory, partial_dir, _ = scratch
+    leftover = directory / "leftover"
+    (leftover / "nested").mkdir(parents=True)
+    make(leftover / "a", 5, 2 * HOUR)
+    make(leftover / "nested" / "b", 7, 2 * HOUR)
+    os.utime(leftover, (time.time() - 2 * HOUR,) * 2)
+
+    janitor = Janitor(str(directory), grace=HOUR, quota=0, interval=60,
+                      partial_dir=str(partial_dir), partial_keep=0)
+    assert sweep(janitor) == (1, 12)
+    assert not leftover.exists()
+    # The partial directory itself is never an orphan
+    assert partial_dir.exists()
+
+def test_partial_downloads_are_kept_longer(scratch):
+    directory, partial_dir, _ = scratch
+    partial = make(partial_dir / "resume.part", 10, 2 * HOUR)
+
+    janitor = Janitor(str(directory), grace=HOUR, quota=0, interval=60,
+                      partial_dir=str(partial_dir), partial_keep=24 * HOUR)
+    # Even the startup sweep (grace=0) respects partial_keep
+    assert sweep(janitor, grace=0) == (0, 0)
+    assert os.path.exists(partial)
+
+    janitor.partial_keep = HOUR
+    assert sweep(janitor) == (1, 10)
+    assert not os.path.exists(partial)
+
+def test_quota_removes_young_orphans_oldest_first(scratch):
+    directory, partial_dir, active = scratch
+    oldest = make(directory / "oldest", 40, 300)
+    middle = make(directory / "middle", 40, 200)
+    newest = make(directory / "newest", 40, 100)
+    live = make(directory / "live", 40, 400)
+    active.add(live)
+
+    janitor = Janitor(str(directory), grace=HOUR, quota=100, interval=60,
+                      partial_dir=str(partial_dir), partial_keep=24 * HOUR)
+    assert sweep(janitor) == (2, 80)
+    assert not os.path.exists(oldest)
+    assert not os.path.exists(middle)
+    assert os.path.exists(newest)
+    assert os.path.exists(live)
+
+def test_quota_reaches_into_partials(scratch):
+    directory, partial_dir, _ = scratch
+    partial = make(partial_dir / "resume.part", 100, 60)
+
+    janitor = Janitor(str(directory), grace=HOUR, quota=50, interval=60,
+                      partial_dir=str(partial_dir), partial_keep=24 * HOUR)
+    assert sweep(janitor) == (1, 100)
+    assert not os.path.exists(partial)
@@ -0,0 +1,104 @@
+# tests/test_jobs.py - Scratch Disk Admission
+import asyncio
+from collections import namedtuple
+import pytest
+from utils import helpers, jobs
+from utils.jobs import DiskAdmission, DiskSpaceError, JobCancelled, RenameJob
+
+Usage = namedtuple("Usage", "total used free")
+MB = 1024 * 1024
+
+@pytest.fixture
+def volume(monkeypatch, tmp_path):
+    """Scratch volume whose free space the test controls"""
+    state = {"free": 100 * MB}
+    monkeypatch.setattr(jobs.shutil, "disk_usage", lambda path: Usage(0, 0, state["free"]))
+    monkeypatch.setattr(jobs, "DISK_RECHECK_SECONDS", 0.05)
+    state["path"] = str(tmp_path)
+    return state
+
+def make_job(job_id: int = 1) -> RenameJob:
+    return RenameJob(job_id, None, user_id=1, chat_id=1)
+
+def test_reserve_within_free_space(volume):
+    async def run():
+        disk = DiskAdmission(volume["path"], margin=10 * MB)
+        job = make_job()
+        await disk.reserve(job, 50 * MB)
+        assert job.disk_reserved == 50 * MB
+        # The unwritten part of the reservation counts as used
+        assert await disk.available() == 40 * MB
+    asyncio.run(run())
+
+def test_reserve_fails_when_idle_volume_is_too_small(volume):
+    async def run():
+        disk = DiskAdmission(volume["path"], margin=10 * MB)
+        with pytest.raises(DiskSpaceError):
+            await disk.reserve(make_job(), 95 * MB)
+    asyncio.run(run())
+
+def test_written_bytes_stop_counting_as_outstanding(volume, tmp_path):
+    async def run():
+        disk = DiskAdmission(volume["path"], margin=0)
+        job = make_job()
+        await disk.reserve(job, 30 * MB)
+        part = tmp_path / "part"
+        part.write_bytes(b"x" * MB)
+        job.track_path(str(part))
+        volume["free"] -= MB
+        assert await disk.available() == 70 * MB
+    asyncio.run(run())
+
+def test_queued_job_starts_when_space_is_released(volume):
+    async def run():
+        disk = DiskAdmission(volume["path"], margin=0)
+        first, second = make_job(1), make_job(2)
+        await disk.reserve(first, 80 * MB)
+        waiter = asyncio.ensure_future(disk.reserve(second, 50 * MB))
+        await asyncio.sleep(0.01)
+        assert not waiter.done() and second.stage == "waiting for disk"
+        disk.release(first)
+        await asyncio.wait_for(waiter, 1)
+        assert second.disk_reserved == 50 * MB
+    asyncio.run(run())
+
+def test_cancel_while_waiting(volume):
+    async def run():
+        disk = DiskAdmission(volume["path"], margin=0)
+        await disk.reserve(make_job(1), 80 * MB)
+        job = make_job(2)
+        waiter = asyncio.ensure_future(disk.reserve(job, 50 * MB))
+        await asyncio.sleep(0.01)
+        job.token.cancel()
+        with pytest.raises(JobCancelled):
+            await asyncio.wait_for(waiter, 1)
+    asyncio.run(run())
+
+def test_waits_for_background_deletes_before_failing(volume, monkeypatch):
+    async def run():
+        disk = DiskAdmission(volume["path"], margin=0)
+        volume["free"] = 20 * MB
+
+        async def delete():
+            await asyncio.sleep(0.05)
+            volume["free"] = 100 * MB
+
+        deleting = asyncio.ensure_future(delete())
+        monkeypatch.setattr(jobs, "pending_deletes", lambda: set() if deleting.done() else {deleting})
+        job = make_job()
+        await asyncio.wait_for(disk.reserve(job, 50 * MB), 1)
+        assert job.disk_reserved == 50 * MB
+    asyncio.run(run())
+
+def test_pending_deletes_tracks_background_removal(tmp_path, monkeypatch):
+    async def run():
+        monkeypatch.setattr(helpers.Config, "BACKGROUND_DELETE_SIZE", 1)
+        big = tmp_path / "big"
+        big.write_bytes(b"x" * 10)
+        await helpers.remove_path(str(big))
+        pending = helpers.pending_deletes()
+        assert pending
+        await asyncio.wait(pending)
+        assert not helpers.pending_deletes()
+        assert not list(tmp_path.iterdir())
+    asyncio.run(run())
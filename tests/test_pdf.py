@@ -0,0 +1,94 @@
+# tests/test_pdf.py - PDF Incremental Metadata Update
+import zlib
+import pytest
+from utils.pdf import (
+    write_pdf_info, is_pdf, PDFWriteError, _find_startxref, _read_section, _find_info, _ref_number
+)
+
+OBJECTS = [
+    b"<< /Type /Catalog /Pages 2 0 R >>",
+    b"<< /Type /Pages /Kids [] /Count 0 >>",
+    b"<< /Producer (Tsugaru Press) /Title (Old Title) >>",
+]
+
+def build_pdf(xref_stream: bool = False, trailer_extra: bytes = b"") -> bytes:
+    """A small PDF with objects 1-3, Info being object 3"""
+    data = b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n"
+    offsets = []
+    for number, body in enumerate(OBJECTS, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_offset = len(data)
+
+    if xref_stream:
+        # Object 4 is the xref stream itself, PNG-predicted and deflated like most writers do
+        rows = [b"\x00\x00\x00\xff\xff"] + [b"\x01" + offset.to_bytes(2, "big") + b"\x00\x00"
+                                             for offset in offsets + [xref_offset]]
+        predicted = b"".join(b"\x00" + row for row in rows)
+        stream = zlib.compress(predicted)
+        data += (
+            b"4 0 obj\n<< /Type /XRef /Size 5 /W [1 2 2] /Root 1 0 R /Info 3 0 R "
+            b"/Filter /FlateDecode /DecodeParms << /Columns 5 /Predictor 12 >> "
+            + trailer_extra + b"/Length %d >>\nstream\n" % len(stream)
+            + stream + b"\nendstream\nendobj\n"
+        )
+    else:
+        data += b"xref\n0 4\n0000000000 65535 f\r\n"
+        data += b"".join(b"%010d 00000 n\r\n" % offset for offset in offsets)
+        data += b"trailer\n<< /Size 4 /Root 1 0 R /Info 3 0 R " + trailer_extra + b">>\n"
+    return data + b"startxref\n%d\n%%%%EOF\n" % xref_offset
+
+def read_info(path: str) -> dict:
+    with open(path, "rb") as f:
+        size = f.seek(0, 2)
+        startxref = _find_startxref(f, size)
+        _, trailer, _ = _read_section(f, startxref)
+        return _find_info(f, startxref, _ref_number(trailer[b"Info"]))
+
+def write(tmp_path, data: bytes) -> str:
+    path = tmp_path / "book.pdf"
+    path.write_bytes(data)
+    return str(path)
+
+@pytest.mark.parametrize("xref_stream", [False, True])
+def test_update_is_appended_and_readable(tmp_path, xref_stream):
+    original = build_pdf(xref_stream)
+    path = write(tmp_path, original)
+    appended = write_pdf_info(path, title="No Longer Human", author="Osamu Dazai")
+
+    data = open(path, "rb").read()
+    assert data[:len(original)] == original
+    assert len(data) == len(original) + appended
+
+    info = read_info(path)
+    assert info[b"Title"] == b"(No Longer Human)"
+    assert info[b"Author"] == b"(Osamu Dazai)"
+    # Entries the update does not set are carried over
+    assert info[b"Producer"] == b"(Tsugaru Press)"
+    assert info[b"ModDate"].startswith(b"(D:")
+
+def test_updates_chain_through_prev(tmp_path):
+    path = write(tmp_path, build_pdf())
+    write_pdf_info(path, title="First")
+    write_pdf_info(path, author="Second")
+    info = read_info(path)
+    assert info[b"Title"] == b"(First)"
+    assert info[b"Author"] == b"(Second)"
+
+def test_non_ascii_and_special_characters(tmp_path):
+    path = write(tmp_path, build_pdf())
+    write_pdf_info(path, title="人間失格", author="a (b) \\ c")
+    info = read_info(path)
+    assert info[b"Title"] == b"<FEFF" + "人間失格".encode("utf-16-be").hex().upper().encode() + b">"
+    assert info[b"Author"] == b"(a \\(b\\) \\\\ c)"
+
+def test_encrypted_pdf_is_refused(tmp_path):
+    original = build_pdf(trailer_extra=b"/Encrypt 9 0 R ")
+    path = write(tmp_path, original)
+    with pytest.raises(PDFWriteError):
+        write_pdf_info(path, title="x")
+    assert open(path, "rb").read() == original
+
+def test_is_pdf(tmp_path):
+    assert is_pdf(write(tmp_path, build_pdf()))
+    assert not is_pdf(write(tmp_path, b"PK\x03\x04 not a pdf"))
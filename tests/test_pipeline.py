@@ -0,0 +1,66 @@
+# tests/test_pipeline.py - Ordered Stage Pipeline
+import asyncio
+from utils.pipeline import OrderedPipeline
+
+def test_uploads_stay_in_submission_order():
+    async def run():
+        pipeline = OrderedPipeline()
+        uploads = []
+
+        async def rename(ticket, process_time):
+            await ticket.enter("download")
+            await ticket.enter("process")
+            await asyncio.sleep(process_time)
+            await ticket.enter("upload")
+            uploads.append(ticket.index)
+            ticket.finish()
+
+        # Later files process faster but must not upload first
+        await asyncio.gather(*(rename(pipeline.ticket(), delay) for delay in (0.03, 0.01, 0.0)))
+        return uploads
+    assert asyncio.run(run()) == [1, 2, 3]
+
+def test_stages_overlap_between_files():
+    async def run():
+        pipeline = OrderedPipeline()
+        first, second = pipeline.ticket(), pipeline.ticket()
+        await first.enter("download")
+        await first.enter("process")
+        # First file left download, so the second can start it now
+        await asyncio.wait_for(second.enter("download"), 0.1)
+        entering = asyncio.ensure_future(second.enter("process"))
+        await asyncio.sleep(0.01)
+        assert not entering.done()
+        await first.enter("upload")
+        await asyncio.wait_for(entering, 0.1)
+        assert (first.stage, second.stage) == ("upload", "process")
+    asyncio.run(run())
+
+def test_finish_unblocks_next_file_after_failure():
+    async def run():
+        pipeline = OrderedPipeline()
+        first, second = pipeline.ticket(), pipeline.ticket()
+        await first.enter("download")
+        blocked = asyncio.ensure_future(second.enter("download"))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        first.finish()
+        await asyncio.wait_for(blocked, 0.1)
+        await asyncio.wait_for(second.enter("upload"), 0.1)
+    asyncio.run(run())
+
+def test_skipped_stage_does_not_let_next_file_overtake():
+    async def run():
+        pipeline = OrderedPipeline()
+        first, second = pipeline.ticket(), pipeline.ticket()
+        await first.enter("download")
+        # Second file has nothing to process and jumps to upload
+        jumping = asyncio.ensure_future(second.enter("upload"))
+        await asyncio.sleep(0.01)
+        assert not jumping.done()
+        await first.enter("upload")
+        await asyncio.sleep(0.01)
+        assert not jumping.done()
+        first.finish()
+        await asyncio.wait_for(jumping, 0.1)
+    asyncio.run(run())
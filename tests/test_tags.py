@@ -0,0 +1,202 @@
+# tests/test_tags.py - Native Audio Tag Writer
+import struct
+import pytest
+from utils.tags import (
+    detect_tag_format, write_id3, write_flac, write_mp4, write_tags, TagWriteError, TAG_PADDING,
+    _int_to_syncsafe, _syncsafe_to_int, _id3_frames, _mp4_children, _mp4_payload, _mp4_find_child
+)
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+# ADTS AAC-LC (MPEG-4 and MPEG-2 flavours), 44.1 kHz, stereo
+ADTS_MPEG4 = b'\xff\xf1\x50\x80\x02\x1f\xfc' + b'\x00' * 9
+ADTS_MPEG2 = b'\xff\xf9\x50\x80\x02\x1f\xfc' + b'\x00' * 9
+
+def id3_tag(body: bytes = b'') -> bytes:
+    return b'ID3\x03\x00\x00' + _int_to_syncsafe(len(body)) + body
+
+def write(tmp_path, name: str, data: bytes) -> str:
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def test_detects_mp3_by_frame_sync(tmp_path):
+    assert detect_tag_format(write(tmp_path, "a.mp3", MP3_FRAME * 3)) == 'id3'
+
+def test_detects_tagged_mp3(tmp_path):
+    assert detect_tag_format(write(tmp_path, "a.mp3", id3_tag(b'\x00' * 32) + MP3_FRAME)) == 'id3'
+
+def test_rejects_adts_aac(tmp_path):
+    assert detect_tag_format(write(tmp_path, "a.aac", ADTS_MPEG4 * 3)) is None
+    assert detect_tag_format(write(tmp_path, "b.aac", ADTS_MPEG2 * 3)) is None
+
+def test_rejects_id3_tagged_adts_aac(tmp_path):
+    assert detect_tag_format(write(tmp_path, "a.aac", id3_tag(b'\x00' * 16) + ADTS_MPEG4)) is None
+
+def test_detects_flac_and_mp4(tmp_path):
+    assert detect_tag_format(write(tmp_path, "a.flac", b'fLaC' + b'\x00' * 40)) == 'flac'
+    assert detect_tag_format(write(tmp_path, "a.m4a", b'\x00\x00\x00\x18ftypM4A ' + b'\x00' * 12)) == 'mp4'
+
+def test_rejects_id3_prefixed_flac_and_unknown(tmp_path):
+    assert detect_tag_format(write(tmp_path, "a.flac", id3_tag() + b'fLaC')) is None
+    assert detect_tag_format(write(tmp_path, "a.wav", b'RIFF\x00\x00\x00\x00WAVE')) is None
+    assert detect_tag_format(str(tmp_path / "missing.mp3")) is None
+
+# ID3v2
+
+def id3_text(raw_frame: bytes) -> str:
+    payload = raw_frame[10:]
+    return payload[1:].decode('utf-16' if payload[0] == 1 else 'utf-8')
+
+def read_id3(path: str):
+    data = open(path, 'rb').read()
+    size = _syncsafe_to_int(data[6:10])
+    return {frame_id: raw for frame_id, raw in _id3_frames(data[10:10 + size], data[3])}, data[10 + size:]
+
+def test_id3_tag_added_in_front_of_untagged_mp3(tmp_path):
+    path = write(tmp_path, "a.mp3", MP3_FRAME * 3)
+    assert write_id3(path, {'TIT2': 'Ningen Shikkaku', 'TPE1': 'Dazai'}) is False
+    frames, audio = read_id3(path)
+    assert id3_text(frames['TIT2']) == 'Ningen Shikkaku'
+    assert id3_text(frames['TPE1']) == 'Dazai'
+    assert audio.lstrip(b'\x00') == MP3_FRAME * 3
+
+def test_id3_rewrite_fits_in_padding_and_keeps_other_frames(tmp_path):
+    path = write(tmp_path, "a.mp3", MP3_FRAME)
+    write_id3(path, {'TIT2': 'Old', 'TALB': 'Album'})
+    size = len(open(path, 'rb').read())
+    assert write_id3(path, {'TIT2': 'New title'}, cover=b'\xff\xd8jpeg') is True
+    assert len(open(path, 'rb').read()) == size
+    frames, audio = read_id3(path)
+    assert id3_text(frames['TIT2']) == 'New title'
+    assert id3_text(frames['TALB']) == 'Album'
+    assert frames['APIC'].endswith(b'\xff\xd8jpeg')
+    assert audio.lstrip(b'\x00') == MP3_FRAME
+
+def test_id3_v22_is_refused(tmp_path):
+    path = write(tmp_path, "a.mp3", b'ID3\x02\x00\x00' + _int_to_syncsafe(0) + MP3_FRAME)
+    with pytest.raises(TagWriteError):
+        write_id3(path, {'TIT2': 'x'})
+
+# FLAC
+
+STREAMINFO = b'\x12' * 34
+FLAC_AUDIO = b'\xff\xf8' + b'\x5a' * 64
+
+def flac_file(tmp_path, padding: int = 0) -> str:
+    blocks = bytes([0x00 if padding else 0x80]) + len(STREAMINFO).to_bytes(3, 'big') + STREAMINFO
+    if padding:
+        blocks += bytes([0x81]) + padding.to_bytes(3, 'big') + b'\x00' * padding
+    return write(tmp_path, "a.flac", b'fLaC' + blocks + FLAC_AUDIO)
+
+def read_flac(path: str):
+    data = open(path, 'rb').read()
+    pos, blocks = 4, []
+    while True:
+        header = data[pos:pos + 4]
+        length = int.from_bytes(header[1:4], 'big')
+        blocks.append((header[0] & 0x7F, data[pos + 4:pos + 4 + length]))
+        pos += 4 + length
+        if header[0] & 0x80:
+            return blocks, data[pos:]
+
+def vorbis_comments(block: bytes) -> list:
+    pos = 4 + struct.unpack('<I', block[:4])[0]
+    count = struct.unpack('<I', block[pos:pos + 4])[0]
+    pos += 4
+    comments = []
+    for _ in range(count):
+        length = struct.unpack('<I', block[pos:pos + 4])[0]
+        comments.append(block[pos + 4:pos + 4 + length].decode())
+        pos += 4 + length
+    return comments
+
+def test_flac_comment_block_added_after_streaminfo(tmp_path):
+    path = flac_file(tmp_path)
+    assert write_flac(path, {'TITLE': 'Run, Melos!', 'ARTIST': 'Dazai'}) is False
+    blocks, audio = read_flac(path)
+    assert [kind for kind, _ in blocks] == [0, 4, 1]
+    assert blocks[0][1] == STREAMINFO
+    assert vorbis_comments(blocks[1][1]) == ['TITLE=Run, Melos!', 'ARTIST=Dazai']
+    assert len(blocks[2][1]) == TAG_PADDING
+    assert audio == FLAC_AUDIO
+
+def test_flac_in_place_update_replaces_keys_case_insensitively(tmp_path):
+    path = flac_file(tmp_path, padding=8192)
+    write_flac(path, {'title': 'Old', 'ALBUM': 'Kept'})
+    size = len(open(path, 'rb').read())
+    assert write_flac(path, {'TITLE': 'New'}, cover=b'\x89PNG\r\n\x1a\npng') is True
+    assert len(open(path, 'rb').read()) == size
+    blocks, audio = read_flac(path)
+    kinds = [kind for kind, _ in blocks]
+    assert kinds[0] == 0 and kinds[-1] == 1 and 6 in kinds
+    assert vorbis_comments(blocks[1][1]) == ['ALBUM=Kept', 'TITLE=New']
+    assert b'image/png' in blocks[kinds.index(6)][1]
+    assert audio == FLAC_AUDIO
+
+# MP4
+
+MDAT_PAYLOAD = b'\xde\xad\xbe\xef' * 16
+
+def atom(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', len(payload) + 8, kind) + payload
+
+def mp4_file(tmp_path, moov_first: bool = True, free: int = 0) -> str:
+    ftyp = atom(b'ftyp', b'M4A \x00\x00\x00\x00')
+
+    def moov(chunk_offset: int) -> bytes:
+        stco = atom(b'stco', b'\x00' * 4 + struct.pack('>II', 1, chunk_offset))
+        trak = atom(b'trak', atom(b'mdia', atom(b'minf', atom(b'stbl', stco))))
+        return atom(b'moov', atom(b'mvhd', b'\x00' * 100) + trak)
+
+    padding = atom(b'free', b'\x00' * (free - 8)) if free else b''
+    if moov_first:
+        head = ftyp + moov(0) + padding
+        data = ftyp + moov(len(head) + 8) + padding + atom(b'mdat', MDAT_PAYLOAD)
+    else:
+        data = ftyp + atom(b'mdat', MDAT_PAYLOAD) + moov(len(ftyp) + 8)
+    return write(tmp_path, "a.m4a", data)
+
+def read_mp4(path: str):
+    data = open(path, 'rb').read()
+    top = dict((kind, raw) for kind, raw in _mp4_children(data))
+    moov = _mp4_payload(top[b'moov'])
+    stbl = moov
+    for kind in (b'trak', b'mdia', b'minf', b'stbl'):
+        stbl = _mp4_find_child(stbl, kind)
+    offset = struct.unpack('>I', _mp4_find_child(stbl, b'stco')[8:12])[0]
+    ilst = _mp4_find_child(_mp4_find_child(_mp4_find_child(moov, b'udta'), b'meta')[4:], b'ilst')
+    items = {kind: _mp4_find_child(_mp4_payload(raw), b'data')[8:]
+             for kind, raw in _mp4_children(ilst)}
+    return items, data[offset:offset + len(MDAT_PAYLOAD)]
+
+def test_mp4_moov_before_mdat_shifts_chunk_offsets(tmp_path):
+    path = mp4_file(tmp_path)
+    assert write_mp4(path, {b'\xa9nam': 'Shayo', b'\xa9ART': 'Dazai'}) is False
+    items, media = read_mp4(path)
+    assert items == {b'\xa9nam': b'Shayo', b'\xa9ART': b'Dazai'}
+    assert media == MDAT_PAYLOAD
+
+def test_mp4_update_in_place_uses_free_padding(tmp_path):
+    path = mp4_file(tmp_path, free=4096)
+    size = len(open(path, 'rb').read())
+    assert write_mp4(path, {b'\xa9nam': 'Title'}, cover=b'\xff\xd8jpeg') is True
+    assert len(open(path, 'rb').read()) == size
+    items, media = read_mp4(path)
+    assert items[b'\xa9nam'] == b'Title' and items[b'covr'] == b'\xff\xd8jpeg'
+    assert media == MDAT_PAYLOAD
+
+def test_mp4_trailing_moov_is_rewritten_without_moving_media(tmp_path):
+    path = mp4_file(tmp_path, moov_first=False)
+    assert write_mp4(path, {b'\xa9nam': 'Title'}) is False
+    items, media = read_mp4(path)
+    assert items == {b'\xa9nam': b'Title'}
+    assert media == MDAT_PAYLOAD
+
+def test_write_tags_dispatches_by_format(tmp_path):
+    path = write(tmp_path, "a.mp3", MP3_FRAME)
+    write_tags(path, title="Title", artist=None)
+    frames, _ = read_id3(path)
+    assert set(frames) == {'TIT2'}
+    with pytest.raises(TagWriteError):
+        write_tags(write(tmp_path, "a.aac", ADTS_MPEG4), title="Title")
@@ -0,0 +1,94 @@
+# tests/test_transfer.py - Resumable Transfer Bitmap
+import os
+import time
+from utils import uploads
+from utils.transfer import ChunkMap, BITMAP_SAVE_INTERVAL, PARTS_SUFFIX
+
+CHUNK = 1024
+
+def sized_file(tmp_path, size: int) -> str:
+    path = tmp_path / "movie.mkv"
+    path.write_bytes(b"\0" * size)
+    return str(path)
+
+def test_chunk_count_and_done_bytes(tmp_path):
+    parts = ChunkMap(sized_file(tmp_path, 10 * CHUNK + 1), 10 * CHUNK + 1, chunk_size=CHUNK)
+    assert parts.count == 11
+    for index in range(parts.count):
+        parts.mark(index)
+    assert parts.complete
+    # The short last chunk does not overshoot the size
+    assert parts.done_bytes == 10 * CHUNK + 1
+
+def test_mark_is_idempotent_and_asks_for_periodic_saves(tmp_path):
+    parts = ChunkMap(sized_file(tmp_path, 64 * CHUNK), 64 * CHUNK, chunk_size=CHUNK)
+    due = [parts.mark(index) for index in range(BITMAP_SAVE_INTERVAL)]
+    assert due == [False] * (BITMAP_SAVE_INTERVAL - 1) + [True]
+    parts.mark(0)
+    assert parts.done == BITMAP_SAVE_INTERVAL
+
+def test_missing_runs(tmp_path):
+    parts = ChunkMap(sized_file(tmp_path, 20 * CHUNK), 20 * CHUNK, chunk_size=CHUNK)
+    for index in (0, 1, 5, 6, 7, 19):
+        parts.mark(index)
+    assert parts.first_missing() == 2
+    assert parts.missing_runs() == [(2, 3), (8, 11)]
+
+def test_save_and_load_round_trip(tmp_path):
+    file_path = sized_file(tmp_path, 20 * CHUNK)
+    parts = ChunkMap(file_path, 20 * CHUNK, chunk_size=CHUNK)
+    for index in (3, 9, 17):
+        parts.mark(index)
+    parts.meta = {'file_id': 42}
+    parts.save()
+    assert os.path.exists(file_path + PARTS_SUFFIX)
+    assert not os.path.exists(file_path + PARTS_SUFFIX + ".tmp")
+
+    restored = ChunkMap(file_path, 20 * CHUNK, chunk_size=CHUNK)
+    assert restored.load(file_path)
+    assert restored.done == 3 and restored.has(9) and not restored.has(10)
+    assert restored.meta == {'file_id': 42}
+
+    restored.discard()
+    assert not os.path.exists(file_path + PARTS_SUFFIX)
+
+def test_load_rejects_state_that_does_not_match(tmp_path):
+    file_path = sized_file(tmp_path, 20 * CHUNK)
+    parts = ChunkMap(file_path, 20 * CHUNK, chunk_size=CHUNK)
+    parts.mark(0)
+    parts.save()
+
+    assert not ChunkMap(file_path, 20 * CHUNK, chunk_size=2 * CHUNK).load(file_path)
+    assert not ChunkMap(file_path, 21 * CHUNK, chunk_size=CHUNK).load(file_path)
+    # The partial file itself was truncated or replaced
+    with open(file_path, "ab") as f:
+        f.write(b"x")
+    assert not ChunkMap(file_path, 20 * CHUNK, chunk_size=CHUNK).load(file_path)
+
+def test_load_rejects_corrupt_state(tmp_path):
+    file_path = sized_file(tmp_path, 4 * CHUNK)
+    with open(file_path + PARTS_SUFFIX, "w") as f:
+        f.write("{not json")
+    assert not ChunkMap(file_path, 4 * CHUNK, chunk_size=CHUNK).load(file_path)
+
+def upload_state(file_path: str, meta: dict) -> None:
+    size = os.path.getsize(file_path)
+    parts = ChunkMap(file_path, size, chunk_size=uploads.UPLOAD_PART_SIZE, suffix=uploads.UPLOAD_STATE_SUFFIX)
+    parts.mark(0)
+    parts.meta = meta
+    parts.save()
+
+def test_upload_state_resumes_only_the_same_recent_file(tmp_path):
+    file_path = sized_file(tmp_path, 3 * uploads.UPLOAD_PART_SIZE)
+    stat = os.stat(file_path)
+
+    upload_state(file_path, {'file_id': 7, 'mtime': stat.st_mtime_ns, 'started': time.time()})
+    resumed = uploads._load_state(file_path, stat.st_size, stat.st_mtime_ns)
+    assert resumed.meta['file_id'] == 7 and resumed.has(0)
+
+    # A modified file needs a new upload
+    assert not uploads._load_state(file_path, stat.st_size, stat.st_mtime_ns + 1).meta
+
+    # Telegram has forgotten parts uploaded too long ago
+    upload_state(file_path, {'file_id': 7, 'mtime': stat.st_mtime_ns, 'started': 0})
+    assert not uploads._load_state(file_path, stat.st_size, stat.st_mtime_ns).meta
@@ -0,0 +1,45 @@
+# tests/test_uploads.py - Upload Retry Policy
+import asyncio
+import pytest
+from pyrogram.errors import FloodWait
+from utils import uploads
+
+def run_send(failures):
+    """Call send_with_retry with a send that raises ``failures`` in turn, then succeeds"""
+    calls = []
+
+    async def send():
+        calls.append(1)
+        if len(calls) <= len(failures):
+            raise failures[len(calls) - 1]
+        return "sent"
+
+    return asyncio.run(uploads.send_with_retry(send)), len(calls)
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    async def sleep(_):
+        pass
+    monkeypatch.setattr(uploads.asyncio, "sleep", sleep)
+
+def test_transient_errors_are_retried():
+    assert run_send([ConnectionError("reset"), TimeoutError("Request timed out")]) == ("sent", 3)
+
+def test_flood_wait_is_retried():
+    assert run_send([FloodWait(value=3)]) == ("sent", 2)
+
+def test_permanent_errors_are_raised_at_once():
+    calls = []
+
+    async def send():
+        calls.append(1)
+        raise ValueError("FILE_ID_INVALID")
+
+    with pytest.raises(ValueError):
+        asyncio.run(uploads.send_with_retry(send))
+    assert len(calls) == 1
+
+def test_gives_up_after_upload_retries(monkeypatch):
+    monkeypatch.setattr(uploads.Config, "UPLOAD_RETRIES", 2)
+    with pytest.raises(ConnectionError):
+        run_send([ConnectionError()] * 5)
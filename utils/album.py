@@ -0,0 +1,99 @@
+# utils/album.py - Re-sending Renamed Album Files as One Media Group
+import asyncio
+import logging
+from typing import Optional, Dict, Any, Set
+from pyrogram import Client
+from pyrogram.types import InputMediaVideo, InputMediaAudio, InputMediaDocument
+
+logger = logging.getLogger(__name__)
+
+# Telegram accepts 2-10 items per media group
+MEDIA_GROUP_LIMIT = 10
+
+class AlbumDelivery:
+    """
+    Gathers the renamed files of an album and sends them together
+
+    Each member's job calls ``deliver`` once its file is ready and waits
+    there; failed members call ``skip``. When every member has settled, the
+    ready files go out as one media group (in album order) and all waiting
+    jobs resume to clean up.
+    """
+
+    def __init__(self, client: Client, chat_id: int, size: int, directory: str):
+        self.client = client
+        self.chat_id = chat_id
+        self.size = size
+        self.directory = directory
+        self._media: Dict[int, Any] = {}
+        self._settled: Set[int] = set()
+        self._sent = asyncio.Event()
+        self.error: Optional[Exception] = None
+
+    def _settle(self, index: int) -> None:
+        if index in self._settled:
+            return
+        self._settled.add(index)
+        if len(self._settled) >= self.size:
+            asyncio.create_task(self._send())
+
+    def skip(self, index: int) -> None:
+        """Mark a member that will not be delivered (failed or cancelled)"""
+        self._settle(index)
+
+    async def deliver(self, index: int, upload_format: str, file_path: str, caption: str,
+                      thumb: Optional[str] = None, duration: int = 0, width: int = 0, height: int = 0) -> None:
+        """
+        Hand over a ready file and wait until the whole album was sent
+
+        Raises:
+            Exception: Whatever sending the media group raised
+        """
+        if upload_format == "video":
+            media = InputMediaVideo(file_path, thumb=thumb, caption=caption, duration=duration,
+                                    width=width, height=height, supports_streaming=True)
+        elif upload_format == "audio":
+            media = InputMediaAudio(file_path, thumb=thumb, caption=caption, duration=duration)
+        else:
+            media = InputMediaDocument(file_path, thumb=thumb, caption=caption)
+
+        self._media[index] = media
+        self._settle(index)
+
+        try:
+            await self._sent.wait()
+        except asyncio.CancelledError:
+            # A cancelled member's files are about to be deleted
+            if not self._sent.is_set():
+                self._media.pop(index, None)
+            raise
+
+        if self.error:
+            raise self.error
+
+    async def _send(self) -> None:
+        try:
+            media = [self._media[index] for index in sorted(self._media)]
+            for offset in range(0, len(media), MEDIA_GROUP_LIMIT):
+                chunk = media[offset:offset + MEDIA_GROUP_LIMIT]
+                if len(chunk) == 1:
+                    await self._send_single(chunk[0])
+                else:
+                    await self.client.send_media_group(self.chat_id, chunk)
+        except Exception as e:
+            logger.error(f"Sending album to {self.chat_id} failed: {e}")
+            self.error = e
+        finally:
+            self._sent.set()
+
+    async def _send_single(self, media) -> None:
+        """A lone file cannot form a media group"""
+        if isinstance(media, InputMediaVideo):
+            await self.client.send_video(self.chat_id, media.media, caption=media.caption, thumb=media.thumb,
+                                         duration=media.duration, width=media.width, height=media.height,
+                                         supports_streaming=True)
+        elif isinstance(media, InputMediaAudio):
+            await self.client.send_audio(self.chat_id, media.media, caption=media.caption, thumb=media.thumb,
+                                         duration=media.duration)
+        else:
+            await self.client.send_document(self.chat_id, media.media, caption=media.caption, thumb=media.thumb)
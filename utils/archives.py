@@ -0,0 +1,317 @@
+# utils/archives.py - Streaming Zip/Tar Creation and Extraction
+import asyncio
+import io
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Awaitable, AsyncIterator, List, Tuple, Union
+from Bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Compression and extraction run here, never on the event loop
+_archive_executor = ThreadPoolExecutor(max_workers=Config.ARCHIVE_WORKERS, thread_name_prefix="archive")
+
+# Extensions recognised as archives, mapped to their kind
+ARCHIVE_KINDS = {
+    '.zip': 'zip',
+    '.tar': 'tar', '.tar.gz': 'tar', '.tgz': 'tar', '.tar.bz2': 'tar',
+    '.tbz2': 'tar', '.tar.xz': 'tar', '.txz': 'tar'
+}
+
+# Already-compressed payloads are stored instead of deflated again
+STORED_MIME_PREFIXES = ('video/', 'audio/', 'image/')
+STORED_MIME_TYPES = (
+    'application/zip', 'application/gzip', 'application/x-7z-compressed',
+    'application/x-rar-compressed', 'application/vnd.rar', 'application/x-xz'
+)
+
+# Copy buffer for extraction
+COPY_SIZE = 1024 * 1024
+
+class ArchiveError(Exception):
+    """Raised for archives that cannot be read or written"""
+    pass
+
+def archive_kind(filename: Optional[str]) -> Optional[str]:
+    """'zip', 'tar' or None, judged from the file name"""
+    name = (filename or "").lower()
+    for extension, kind in sorted(ARCHIVE_KINDS.items(), key=lambda item: -len(item[0])):
+        if name.endswith(extension):
+            return kind
+    return None
+
+def should_compress(mime_type: Optional[str]) -> bool:
+    mime_type = mime_type or ""
+    return not (mime_type.startswith(STORED_MIME_PREFIXES) or mime_type in STORED_MIME_TYPES)
+
+def _wait(loop: asyncio.AbstractEventLoop, coro) -> None:
+    """Run a coroutine on the event loop from a worker thread and wait for it"""
+    asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+class PartWriter(io.RawIOBase):
+    """
+    Write-only, unseekable file object that cuts its output into part files
+
+    Used from a worker thread. Each full part (and the last one on close) is
+    handed to the async ``on_part(path, index)`` on the event loop, which may
+    block the writer to apply backpressure.
+    """
+
+    def __init__(self, output_dir: str, part_size: int,
+                 on_part: Callable[[str, int], Awaitable[None]], loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self._output_dir = output_dir
+        self._part_size = part_size
+        self._on_part = on_part
+        self._loop = loop
+        self._part = None
+        self._part_path = None
+        self._part_written = 0
+        self.index = 0
+        self.written = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def _finish_part(self) -> None:
+        self._part.close()
+        self._part = None
+        _wait(self._loop, self._on_part(self._part_path, self.index))
+
+    def write(self, data) -> int:
+        view = memoryview(data).cast('B')
+        total = len(view)
+        while view:
+            if self._part is None:
+                self.index += 1
+                self._part_path = os.path.join(self._output_dir, f"part{self.index:03d}")
+                self._part = open(self._part_path, 'wb')
+                self._part_written = 0
+
+            piece = view[:self._part_size - self._part_written]
+            view = view[len(piece):]
+            self._part.write(piece)
+            self._part_written += len(piece)
+            if self._part_written == self._part_size:
+                self._finish_part()
+
+        self.written += total
+        return total
+
+    def close(self) -> None:
+        if not self.closed and self._part is not None:
+            self._finish_part()
+        super().close()
+
+class ArchiveBuilder:
+    """
+    Streams entries into a zip or tar written to a PartWriter
+
+    Entries are added from async chunk iterators; every blocking step
+    (compression, part writes) runs on the archive thread pool. Zip entries
+    use data descriptors, tar entries need their exact size up front.
+    """
+
+    def __init__(self, kind: str, writer: PartWriter):
+        self.kind = kind
+        self.writer = writer
+        self._zip = zipfile.ZipFile(writer, 'w', allowZip64=True) if kind == 'zip' else None
+        self._entry = None
+        self._entry_left = 0
+        self._names = set()
+
+    def unique_name(self, name: str) -> str:
+        """Entry name not used yet in this archive"""
+        base, extension = os.path.splitext(name)
+        candidate, counter = name, 1
+        while candidate in self._names:
+            counter += 1
+            candidate = f"{base} ({counter}){extension}"
+        self._names.add(candidate)
+        return candidate
+
+    def _begin(self, name: str, size: int, compress: bool) -> None:
+        if self._zip is not None:
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            info.file_size = size
+            self._entry = self._zip.open(info, 'w')
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            self.writer.write(info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+            self._entry_left = size
+
+    def _write(self, data: bytes) -> None:
+        if self._zip is not None:
+            self._entry.write(data)
+        else:
+            if len(data) > self._entry_left:
+                raise ArchiveError("Entry is larger than announced")
+            self.writer.write(data)
+            self._entry_left -= len(data)
+
+    def _end(self, size: int) -> None:
+        if self._zip is not None:
+            self._entry.close()
+            self._entry = None
+        else:
+            if self._entry_left:
+                raise ArchiveError("Entry is smaller than announced")
+            remainder = size % tarfile.BLOCKSIZE
+            if remainder:
+                self.writer.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+
+    def _close(self) -> None:
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            # End-of-archive marker, padded to a full record like tarfile does
+            self.writer.write(tarfile.NUL * (tarfile.BLOCKSIZE * 2))
+            remainder = self.writer.written % tarfile.RECORDSIZE
+            if remainder:
+                self.writer.write(tarfile.NUL * (tarfile.RECORDSIZE - remainder))
+        self.writer.close()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(_archive_executor, func, *args)
+
+    async def add(self, name: str, size: int, chunks: AsyncIterator[bytes], compress: bool = True) -> str:
+        """
+        Stream one entry into the archive
+
+        Args:
+            name (str): Entry name (made unique within the archive)
+            size (int): Exact size of the data
+            chunks (async iterator): Entry data
+            compress (bool): Deflate zip entries (ignored for tar)
+
+        Returns:
+            str: Name the entry was stored under
+        """
+        name = self.unique_name(name)
+        await self._run(self._begin, name, size, compress)
+        async for chunk in chunks:
+            await self._run(self._write, chunk)
+        await self._run(self._end, size)
+        return name
+
+    async def close(self) -> int:
+        """Finish the archive; returns the number of parts written"""
+        await self._run(self._close)
+        return self.writer.index
+
+class StreamReader(io.RawIOBase):
+    """Blocking, read-only file object over an async chunk iterator, for worker threads"""
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        super().__init__()
+        self._chunks = chunks
+        self._loop = loop
+        self._buffer = memoryview(b'')
+        self._done = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer and not self._done:
+            try:
+                chunk = asyncio.run_coroutine_threadsafe(self._chunks.__anext__(), self._loop).result()
+                self._buffer = memoryview(chunk)
+            except StopAsyncIteration:
+                self._done = True
+
+        count = min(len(buffer), len(self._buffer))
+        buffer[:count] = self._buffer[:count]
+        self._buffer = self._buffer[count:]
+        return count
+
+def _extract(kind: str, source: Union[str, io.RawIOBase], output_dir: str,
+             on_member: Callable[[str, int, str], Awaitable[None]], loop: asyncio.AbstractEventLoop,
+             cancelled: Callable[[], bool], max_members: int, max_member_size: int) -> Tuple[int, List[str]]:
+    """Blocking extraction loop; see extract_archive"""
+    index = 0
+    skipped = []
+
+    def emit(name: str, size: int, open_member) -> bool:
+        nonlocal index
+        if cancelled():
+            raise ArchiveError("Cancelled")
+        if index >= max_members or size > max_member_size:
+            skipped.append(name)
+            return True
+
+        target = os.path.join(output_dir, f"member{index + 1:04d}")
+        try:
+            with open_member() as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, COPY_SIZE)
+        except RuntimeError as e:
+            # Encrypted zip members cannot be read without the password
+            logger.debug(f"Skipping {name}: {e}")
+            skipped.append(name)
+            return True
+
+        index += 1
+        _wait(loop, on_member(target, index, os.path.basename(name.rstrip('/')) or f"file_{index}"))
+        return True
+
+    if kind == 'zip':
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    emit(info.filename, info.file_size, lambda info=info: archive.open(info))
+    else:
+        # Stream mode reads members in order without seeking
+        with tarfile.open(fileobj=source, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    emit(member.name, member.size, lambda member=member: archive.extractfile(member))
+
+    return index, skipped
+
+async def extract_archive(kind: str, source: Union[str, AsyncIterator[bytes]], output_dir: str,
+                          on_member: Callable[[str, int, str], Awaitable[None]],
+                          cancelled: Callable[[], bool] = lambda: False,
+                          max_members: int = 100, max_member_size: int = 0) -> Tuple[int, List[str]]:
+    """
+    Extract an archive member by member on the archive thread pool
+
+    Each member is written to ``output_dir`` and handed to
+    ``on_member(path, index, name)`` before the next one is read, so uploads
+    overlap extraction and only a bounded number of members sit on disk.
+    Tar archives can be read straight from a download stream; zip archives
+    need a file on disk for their central directory.
+
+    Args:
+        kind (str): 'zip' or 'tar'
+        source (str | async iterator): Archive path, or chunks of a tar archive
+        output_dir (str): Directory for extracted members
+        on_member (callable): Async callback receiving (path, index, member name)
+        cancelled (callable): Polled between members; stops extraction when True
+        max_members (int): Members beyond this are skipped
+        max_member_size (int): Members larger than this are skipped (0 = no limit)
+
+    Returns:
+        Tuple of (members extracted, names skipped)
+    """
+    loop = asyncio.get_event_loop()
+    if not isinstance(source, str):
+        if kind != 'tar':
+            raise ArchiveError("Only tar archives can be extracted from a stream")
+        source = StreamReader(source, loop)
+
+    try:
+        return await loop.run_in_executor(
+            _archive_executor, _extract, kind, source, output_dir, on_member, loop,
+            cancelled, max_members, max_member_size or float('inf')
+        )
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise ArchiveError(f"Archive is damaged or unsupported: {e}")
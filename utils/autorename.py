@@ -0,0 +1,221 @@
+# utils/autorename.py - Release Filename Parser and Auto-Rename Templates
+import os
+import re
+from functools import lru_cache
+from string import Formatter
+from typing import Optional, Dict, Any, FrozenSet
+
+# Compiled once; these cover fansub and scene naming conventions
+GROUP_PATTERN = re.compile(r'^\s*[\[(【](?P<group>[^\])】]{1,40})[\])】]')
+SEASON_EPISODE_PATTERNS = [
+    re.compile(r'\b[Ss](?P<season>\d{1,2})[\s.-]*[Ee](?P<episode>\d{1,4})(?:[-~]?[Ee]?\d{1,4})?\b'),
+    re.compile(r'\b(?P<season>\d{1,2})x(?P<episode>\d{2,3})\b'),
+    re.compile(r'\bSeason[\s.-]*(?P<season>\d{1,2})[\s.-]*(?:Episode|Ep?)[\s.-]*(?P<episode>\d{1,4})\b', re.I)
+]
+EPISODE_PATTERNS = [
+    # "Show - 05 [1080p]" / "Show - 05v2"
+    re.compile(r'\s-\s(?P<episode>\d{1,4})(?:v\d)?(?=[\s\[(.]|$)'),
+    re.compile(r'\b(?:Episode|Ep|E)[\s.-]*(?P<episode>\d{1,4})\b', re.I)
+]
+SEASON_PATTERNS = [
+    re.compile(r'\b(?P<season>\d{1,2})(?:st|nd|rd|th)[ .]Season\b', re.I),
+    re.compile(r'\b(?:Season[ .]?|S)(?P<season>\d{1,2})\b', re.I)
+]
+RESOLUTION_PATTERN = re.compile(r'\b(?P<resolution>2160|1440|1080|720|576|480|360)[pi]\b|\b(?P<uhd>4K|UHD)\b', re.I)
+# Bracketed years win over bare ones ("Blade Runner 2049 (2017)")
+YEAR_PATTERNS = [
+    re.compile(r'[\[(](?P<year>(?:19|20)\d{2})[\])]'),
+    re.compile(r'(?<![\d])(?P<year>(?:19|20)\d{2})(?![\dpi])')
+]
+SOURCE_PATTERN = re.compile(
+    r'\b(?P<source>WEB[-. ]?DL|WEB[-. ]?Rip|Blu[-. ]?Ray|BDRip|BRRip|HDTV|DVDRip|HDRip|WEB)\b', re.I
+)
+CODEC_PATTERN = re.compile(r'\b(?P<codec>[xh]\.?26[45]|HEVC|AVC|AV1|VP9)\b', re.I)
+AUDIO_PATTERN = re.compile(
+    r'\b(?P<audio>AAC(?:[ .]?[25]\.[01])?|DDP?(?:[ .]?[257]\.[01])?|E-?AC-?3|FLAC|Opus|TrueHD|'
+    r'DTS(?:-HD)?(?:[ .]?MA)?|Atmos)\b', re.I
+)
+
+# Fields a template may use; {n} is the file's position in a batch or album
+AUTO_RENAME_FIELDS = ('title', 'season', 'episode', 'resolution', 'group', 'year', 'source', 'codec', 'audio', 'n')
+
+# Probe codec names as they usually appear in release names
+CODEC_LABELS = {'h264': 'H.264', 'hevc': 'HEVC', 'av1': 'AV1', 'vp9': 'VP9', 'mpeg4': 'XviD'}
+
+class RenameTemplateError(ValueError):
+    """Raised for auto-rename templates that cannot be compiled"""
+    pass
+
+def _resolution_label(width: int, height: int) -> Optional[str]:
+    """Name a frame size the way releases do; width copes with cropped films"""
+    for min_width, min_height, label in ((3800, 2000, '2160p'), (2500, 1400, '1440p'),
+                                         (1900, 1000, '1080p'), (1200, 700, '720p')):
+        if width >= min_width or height >= min_height:
+            return label
+    return f"{height}p" if height else None
+
+def parse_release_name(filename: str) -> Dict[str, Any]:
+    """
+    Extract release fields from a filename
+
+    Args:
+        filename (str): e.g. "[SubsPlease] Show Name - 05 (1080p) [ABCD1234].mkv"
+
+    Returns:
+        Dict with any of AUTO_RENAME_FIELDS that were found (season/episode/year as int)
+    """
+    stem = os.path.splitext(filename)[0]
+    # Underscores separate words in many releases but count as \w for regexes
+    work = stem.replace('_', ' ')
+    fields: Dict[str, Any] = {}
+    title_start = 0
+    title_end = len(work)
+
+    match = GROUP_PATTERN.match(work)
+    if match:
+        fields['group'] = match.group('group').strip()
+        title_start = match.end()
+
+    for pattern in SEASON_EPISODE_PATTERNS:
+        match = pattern.search(work, title_start)
+        if match:
+            fields['season'] = int(match.group('season'))
+            fields['episode'] = int(match.group('episode'))
+            title_end = min(title_end, match.start())
+            break
+    else:
+        for pattern in EPISODE_PATTERNS:
+            match = pattern.search(work, title_start)
+            if match:
+                fields['episode'] = int(match.group('episode'))
+                title_end = min(title_end, match.start())
+                break
+
+        for pattern in SEASON_PATTERNS:
+            match = pattern.search(work, title_start)
+            if match:
+                fields['season'] = int(match.group('season'))
+                title_end = min(title_end, match.start())
+                break
+        else:
+            if 'episode' in fields:
+                # Absolute-numbered (anime) releases are season 1
+                fields['season'] = 1
+
+    for key, pattern in (('resolution', RESOLUTION_PATTERN), ('source', SOURCE_PATTERN),
+                         ('codec', CODEC_PATTERN), ('audio', AUDIO_PATTERN)):
+        match = pattern.search(work, title_start)
+        if match:
+            if key == 'resolution':
+                fields[key] = '2160p' if match.group('uhd') else f"{match.group('resolution')}p"
+            else:
+                fields[key] = match.group(key)
+            title_end = min(title_end, match.start())
+
+    # A year after some title text ends the title ("Movie.Name.2019.1080p")
+    for pattern in YEAR_PATTERNS:
+        match = next((m for m in pattern.finditer(work, title_start)
+                      if work[title_start:m.start()].strip(' .-[(')), None)
+        if match:
+            fields['year'] = int(match.group('year'))
+            title_end = min(title_end, match.start())
+            break
+
+    title = work[title_start:title_end]
+    if title.count('.') > title.count(' '):
+        title = title.replace('.', ' ')
+    title = re.sub(r'[\[(【][^\])】]*[\])】]', ' ', title)
+    title = re.sub(r'\s+', ' ', title).strip(' -.[](')
+    if title:
+        fields['title'] = title
+
+    return fields
+
+def fields_from_media(media_info: Dict[str, Any]) -> Dict[str, Any]:
+    """Release fields derivable from probe data"""
+    fields = {}
+    resolution = _resolution_label(int(media_info.get('width') or 0), int(media_info.get('height') or 0))
+    if resolution and media_info.get('height'):
+        fields['resolution'] = resolution
+    codec = media_info.get('codec')
+    if codec:
+        fields['codec'] = CODEC_LABELS.get(codec, codec.upper())
+    return fields
+
+class AutoRenameTemplate:
+    """A validated auto-rename template"""
+
+    def __init__(self, template: str, fields: FrozenSet[str]):
+        self.template = template
+        self.fields = fields
+
+    def render(self, filename: str, media_info: Optional[Dict[str, Any]] = None, index: int = 1) -> Optional[str]:
+        """
+        Build the new name (without extension) for a file
+
+        Returns:
+            str, or None if a field used by the template could not be determined
+        """
+        values = fields_from_media(media_info or {})
+        values.update(parse_release_name(filename))
+        values['n'] = index
+
+        if not self.fields.issubset(values):
+            return None
+
+        try:
+            name = self.template.format(**{key: values[key] for key in self.fields})
+        except (ValueError, TypeError):
+            return None
+
+        name = re.sub(r'\s+', ' ', name).strip()
+        return name or None
+
+@lru_cache(maxsize=256)
+def compile_rename_template(template: str) -> AutoRenameTemplate:
+    """
+    Validate an auto-rename template such as ``{title} S{season:02}E{episode:02} [{resolution}]``
+
+    Raises:
+        RenameTemplateError: For malformed braces or unknown fields
+    """
+    if not template or len(template) > 200:
+        raise RenameTemplateError("Template must be between 1 and 200 characters")
+
+    fields = set()
+    try:
+        for _, name, spec, _ in Formatter().parse(template):
+            if name is None:
+                continue
+            if name not in AUTO_RENAME_FIELDS:
+                raise RenameTemplateError(f"Unknown field {{{name}}}")
+            if spec and '{' in spec:
+                raise RenameTemplateError(f"Nested fields in {{{name}}} are not allowed")
+            fields.add(name)
+    except ValueError as e:
+        if isinstance(e, RenameTemplateError):
+            raise
+        raise RenameTemplateError(f"Malformed template: {e}")
+
+    if not fields:
+        raise RenameTemplateError("Template must use at least one field")
+
+    return AutoRenameTemplate(template, frozenset(fields))
+
+def render_auto_name(template: str, filename: str, media_info: Optional[Dict[str, Any]] = None,
+                     index: int = 1) -> Optional[str]:
+    """
+    Apply a user's auto-rename template to a filename, keeping its extension
+
+    Returns:
+        New filename, or None if the template is invalid or cannot be filled
+    """
+    try:
+        compiled = compile_rename_template(template)
+    except RenameTemplateError:
+        return None
+
+    name = compiled.render(filename, media_info, index)
+    if not name:
+        return None
+    return name + os.path.splitext(filename)[1]
@@ -0,0 +1,152 @@
+# utils/captions.py - Compiled Caption Templates with Lazy Variables
+import logging
+from functools import lru_cache
+from string import Formatter
+from typing import Optional, Dict, Any, Callable, List, Tuple, FrozenSet
+from utils.helpers import humanbytes, convert_seconds_to_readable, get_file_type_from_mime
+
+logger = logging.getLogger(__name__)
+
+# Compiled templates kept in memory (users share few distinct templates)
+CAPTION_CACHE_SIZE = 1024
+
+# Telegram's caption limit; longer templates can never render
+MAX_CAPTION_LENGTH = 1024
+
+class CaptionError(ValueError):
+    """Raised for templates that cannot be compiled"""
+    pass
+
+def _file_value(key: str, default: Any = 'N/A') -> Callable[[Dict[str, Any]], Any]:
+    def resolve(file_info: Dict[str, Any]) -> Any:
+        value = file_info.get(key)
+        # Callables are lazy values (e.g. probe results) computed on first use
+        if callable(value):
+            value = value()
+        return value if value not in (None, '') else default
+    return resolve
+
+def _duration(file_info: Dict[str, Any]) -> str:
+    seconds = _file_value('duration', 0)(file_info)
+    return convert_seconds_to_readable(int(seconds)) if seconds else 'N/A'
+
+def _resolution(file_info: Dict[str, Any]) -> str:
+    width = _file_value('width', 0)(file_info)
+    height = _file_value('height', 0)(file_info)
+    return f"{width}x{height}" if width else 'N/A'
+
+# Every variable a template may reference, resolved only when used
+CAPTION_VARIABLES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'filename': _file_value('file_name', 'Unknown'),
+    'filesize': lambda info: humanbytes(_file_value('file_size', 0)(info)),
+    'duration': _duration,
+    'filetype': lambda info: get_file_type_from_mime(_file_value('mime_type', '')(info)),
+    'width': _file_value('width', 0),
+    'height': _file_value('height', 0),
+    'resolution': _resolution,
+    'md5': _file_value('md5'),
+    'sha1': _file_value('sha1'),
+    'sha256': _file_value('sha256'),
+    'crc32': _file_value('crc32'),
+    'bot_name': lambda info: 'Dazai Rename Bot'
+}
+
+class CompiledCaption:
+    """A parsed template: literal chunks plus (variable, conversion, format spec) fields"""
+
+    def __init__(self, template: str, parts: List[Tuple[str, Optional[Tuple[str, Optional[str], str]]]]):
+        self.template = template
+        self.parts = parts
+        self.variables: FrozenSet[str] = frozenset(field[0] for _, field in parts if field)
+
+    def render(self, file_info: Dict[str, Any], custom_vars: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Fill the template, evaluating each referenced variable once
+
+        Args:
+            file_info (dict): Output of extract_file_info plus any extra fields
+            custom_vars (dict): Values overriding the built-in variables
+
+        Returns:
+            str: Rendered caption
+        """
+        custom_vars = custom_vars or {}
+        values: Dict[str, Any] = {}
+        out = []
+
+        for literal, field in self.parts:
+            out.append(literal)
+            if not field:
+                continue
+
+            name, conversion, spec = field
+            if name not in values:
+                if name in custom_vars:
+                    values[name] = custom_vars[name]
+                else:
+                    values[name] = CAPTION_VARIABLES[name](file_info)
+
+            value = values[name]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            elif conversion == 's':
+                value = str(value)
+
+            try:
+                out.append(format(value, spec))
+            except (ValueError, TypeError):
+                # A numeric spec on a 'N/A' placeholder; show the value as-is
+                out.append(str(value))
+
+        return ''.join(out)
+
+@lru_cache(maxsize=CAPTION_CACHE_SIZE)
+def compile_caption(template: str) -> CompiledCaption:
+    """
+    Parse and validate a caption template (cached per template)
+
+    Args:
+        template (str): Caption using ``{variable}`` / ``{variable:spec}`` fields
+
+    Returns:
+        CompiledCaption
+
+    Raises:
+        CaptionError: For malformed braces, unknown variables or attribute/index access
+    """
+    if len(template) > MAX_CAPTION_LENGTH:
+        raise CaptionError(f"Caption is longer than {MAX_CAPTION_LENGTH} characters")
+
+    parts = []
+    try:
+        for literal, name, spec, conversion in Formatter().parse(template):
+            if name is None:
+                parts.append((literal, None))
+                continue
+
+            if not name or name.isdigit():
+                raise CaptionError("Empty or positional fields like {} are not allowed")
+            if '.' in name or '[' in name:
+                raise CaptionError(f"Attribute or index access in {{{name}}} is not allowed")
+            if name not in CAPTION_VARIABLES:
+                raise CaptionError(f"Unknown variable {{{name}}}")
+            if spec and '{' in spec:
+                raise CaptionError(f"Nested fields in {{{name}}} are not allowed")
+
+            parts.append((literal, (name, conversion, spec or '')))
+    except ValueError as e:
+        if isinstance(e, CaptionError):
+            raise
+        raise CaptionError(f"Malformed template: {e}")
+
+    return CompiledCaption(template, parts)
+
+def validate_caption(template: str) -> Optional[str]:
+    """Return an error message for an invalid template, or None if it compiles"""
+    try:
+        compile_caption(template)
+        return None
+    except CaptionError as e:
+        return str(e)
@@ -2,12 +2,21 @@
 import motor.motor_asyncio
 from datetime import datetime, timedelta
 from Bot.config import Config
+from utils.captions import compile_caption
+from utils.autorename import compile_rename_template
 import logging
 from typing import Optional, Dict, Any, List
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Keep every track unless the user opts in to filtering
+DEFAULT_TRACK_RULES = {
+    "languages": [],
+    "drop_commentary": False,
+    "drop_image_subs": False
+}
+
 class EnhancedDatabase:
     """Enhanced database handler with comprehensive user management"""
     
@@ -15,6 +24,8 @@ class EnhancedDatabase:
         self._client = None
         self.db = None
         self.users = None
+        self.media_info = None
+        self.jobs = None
         self._connection_lock = asyncio.Lock()
         self._initialize_database()
     
@@ -38,6 +49,8 @@ class EnhancedDatabase:
             
             self.db = self._client[db_name]
             self.users = self.db.users
+            self.media_info = self.db.media_info
+            self.jobs = self.db.jobs
             
             logger.info(f"Database initialized: {db_name}")
             
@@ -77,9 +90,13 @@ class EnhancedDatabase:
                 "title": ""
             },
             
+            # Track selection for the stream-copy pass
+            "tracks": dict(DEFAULT_TRACK_RULES),
+            
             # User preferences
             "settings": {
                 "auto_rename": False,
+                "auto_rename_template": "",
                 "show_progress": True,
                 "default_format": "document",
                 "language": "en"
@@ -211,4 +228,372 @@ class EnhancedDatabase:
         try:
             await self._ensure_connection()
             result = await self.users.update_one(
-                {"_id
+                {"_id": user_id},
+                {"$set": {"thumbnail": None}}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error deleting thumbnail for {user_id}: {e}")
+            return False
+    
+    # Caption Management
+    async def set_caption(self, user_id: int, caption: str) -> bool:
+        """
+        Set user's caption template
+        
+        The template is compiled here so broken templates never reach the
+        database and the compiled form is already cached for the next upload.
+        
+        Raises:
+            CaptionError: If the template cannot be compiled
+        """
+        compile_caption(caption)
+        try:
+            await self._ensure_connection()
+            result = await self.users.update_one(
+                {"_id": user_id},
+                {"$set": {"caption": caption}}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error setting caption for {user_id}: {e}")
+            return False
+    
+    async def get_caption(self, user_id: int) -> Optional[str]:
+        """Get user's caption template"""
+        try:
+            user_data = await self.get_user_data(user_id)
+            return user_data.get("caption")
+        except Exception as e:
+            logger.error(f"Error getting caption for {user_id}: {e}")
+            return None
+    
+    async def delete_caption(self, user_id: int) -> bool:
+        """Delete user's caption template"""
+        try:
+            await self._ensure_connection()
+            result = await self.users.update_one(
+                {"_id": user_id},
+                {"$set": {"caption": None}}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error deleting caption for {user_id}: {e}")
+            return False
+    
+    # Prefix/Suffix Management
+    async def set_prefix(self, user_id: int, prefix: str) -> bool:
+        """Set user's filename prefix (empty string removes it)"""
+        try:
+            await self._ensure_connection()
+            result = await self.users.update_one(
+                {"_id": user_id},
+                {"$set": {"prefix": prefix or ""}}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error setting prefix for {user_id}: {e}")
+            return False
+    
+    async def get_prefix(self, user_id: int) -> str:
+        """Get user's filename prefix"""
+        try:
+            user_data = await self.get_user_data(user_id)
+            return user_data.get("prefix", "")
+        except Exception as e:
+            logger.error(f"Error getting prefix for {user_id}: {e}")
+            return ""
+    
+    async def set_suffix(self, user_id: int, suffix: str) -> bool:
+        """Set user's filename suffix (empty string removes it)"""
+        try:
+            await self._ensure_connection()
+            result = await self.users.update_one(
+                {"_id": user_id},
+                {"$set": {"suffix": suffix or ""}}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error setting suffix for {user_id}: {e}")
+            return False
+    
+    async def get_suffix(self, user_id: int) -> str:
+        """Get user's filename suffix"""
+        try:
+            user_data = await self.get_user_data(user_id)
+            return user_data.get("suffix", "")
+        except Exception as e:
+            logger.error(f"Error getting suffix for {user_id}: {e}")
+            return ""
+    
+    # Metadata Management
+    async def get_metadata(self, user_id: int) -> Dict[str, Any]:
+        """Get user's metadata configuration"""
+        try:
+            user_data = await self.get_user_data(user_id)
+            return user_data.get("metadata", {"enabled": False, "author": "", "title": ""})
+        except Exception as e:
+            logger.error(f"Error getting metadata for {user_id}: {e}")
+            return {"enabled": False, "author": "", "title": ""}
+    
+    async def set_metadata(self, user_id: int, enabled: Optional[bool] = None,
+                           title: Optional[str] = None, author: Optional[str] = None) -> bool:
+        """Update metadata configuration; only given fields are changed"""
+        try:
+            await self._ensure_connection()
+            update = {}
+            if enabled is not None:
+                update["metadata.enabled"] = enabled
+            if title is not None:
+                update["metadata.title"] = title
+            if author is not None:
+                update["metadata.author"] = author
+            
+            if not update:
+                return False
+            
+            result = await self.users.update_one({"_id": user_id}, {"$set": update})
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error setting metadata for {user_id}: {e}")
+            return False
+    
+    # Track Selection
+    async def get_track_rules(self, user_id: int) -> Dict[str, Any]:
+        """Get user's track selection rules merged over the defaults"""
+        rules = dict(DEFAULT_TRACK_RULES)
+        try:
+            user_data = await self.get_user_data(user_id)
+            rules.update(user_data.get("tracks") or {})
+        except Exception as e:
+            logger.error(f"Error getting track rules for {user_id}: {e}")
+        return rules
+    
+    async def set_track_rules(self, user_id: int, languages: Optional[List[str]] = None,
+                              drop_commentary: Optional[bool] = None,
+                              drop_image_subs: Optional[bool] = None) -> bool:
+        """Update track selection rules; only given fields are changed"""
+        try:
+            await self._ensure_connection()
+            update = {}
+            if languages is not None:
+                update["tracks.languages"] = [lang.lower() for lang in languages]
+            if drop_commentary is not None:
+                update["tracks.drop_commentary"] = drop_commentary
+            if drop_image_subs is not None:
+                update["tracks.drop_image_subs"] = drop_image_subs
+            
+            if not update:
+                return False
+            
+            result = await self.users.update_one({"_id": user_id}, {"$set": update})
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error setting track rules for {user_id}: {e}")
+            return False
+    
+    # Auto Rename
+    async def get_auto_rename(self, user_id: int) -> Dict[str, Any]:
+        """Get user's auto-rename state, template and upload format"""
+        try:
+            settings = (await self.get_user_data(user_id)).get("settings", {})
+        except Exception as e:
+            logger.error(f"Error getting auto rename for {user_id}: {e}")
+            settings = {}
+        return {
+            "enabled": settings.get("auto_rename", False),
+            "template": settings.get("auto_rename_template", ""),
+            "format": settings.get("default_format", "document")
+        }
+    
+    async def set_auto_rename(self, user_id: int, enabled: Optional[bool] = None,
+                              template: Optional[str] = None,
+                              upload_format: Optional[str] = None) -> bool:
+        """
+        Update auto-rename settings; only given fields are changed
+        
+        Raises:
+            RenameTemplateError: If the template cannot be compiled
+        """
+        update = {}
+        if template is not None:
+            compile_rename_template(template)
+            update["settings.auto_rename_template"] = template
+        if enabled is not None:
+            update["settings.auto_rename"] = enabled
+        if upload_format is not None:
+            update["settings.default_format"] = upload_format
+        
+        if not update:
+            return False
+        
+        try:
+            await self._ensure_connection()
+            result = await self.users.update_one({"_id": user_id}, {"$set": update})
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error setting auto rename for {user_id}: {e}")
+            return False
+    
+    # Statistics
+    async def increment_renamed_count(self, user_id: int, file_size: int = 0) -> bool:
+        """Count a finished rename for the user and for today's totals"""
+        try:
+            await self._ensure_connection()
+            now = datetime.now()
+            today = now.strftime("%Y-%m-%d")
+            
+            result = await self.users.update_one(
+                {"_id": user_id},
+                {
+                    "$set": {"stats.last_file_date": now},
+                    "$inc": {
+                        "stats.files_renamed": 1,
+                        "stats.total_size_processed": file_size,
+                        f"activity.daily_files.{today}": 1
+                    }
+                }
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error incrementing renamed count for {user_id}: {e}")
+            return False
+    
+    async def get_user_stats(self, user_id: int) -> Dict[str, Any]:
+        """Get user's statistics"""
+        try:
+            user_data = await self.get_user_data(user_id)
+            stats = user_data.get("stats", {})
+            
+            return {
+                "files_renamed": stats.get("files_renamed", 0),
+                "total_size_processed": stats.get("total_size_processed", 0),
+                "join_date": user_data.get("join_date", "Unknown"),
+                "last_used": user_data.get("last_used", "Never")
+            }
+        except Exception as e:
+            logger.error(f"Error getting stats for {user_id}: {e}")
+            return {}
+    
+    async def reset_user_settings(self, user_id: int) -> bool:
+        """Reset every user setting to its default, keeping stats and activity"""
+        try:
+            await self._ensure_connection()
+            defaults = self.create_user_document(user_id)
+            
+            result = await self.users.update_one(
+                {"_id": user_id},
+                {"$set": {
+                    key: defaults[key]
+                    for key in ("thumbnail", "caption", "prefix", "suffix",
+                                "metadata", "tracks", "settings")
+                }}
+            )
+            return result.modified_count > 0
+        except Exception as e:
+            logger.error(f"Error resetting settings for {user_id}: {e}")
+            return False
+    
+    # Media Info Cache (shared across users, keyed by Telegram file_unique_id)
+    async def get_media_info(self, file_unique_id: str) -> Optional[Dict[str, Any]]:
+        """Get cached probe results for a file"""
+        try:
+            await self._ensure_connection()
+            return await self.media_info.find_one({"_id": file_unique_id})
+        except Exception as e:
+            logger.error(f"Error getting media info for {file_unique_id}: {e}")
+            return None
+    
+    async def update_media_info(self, file_unique_id: str, info: Dict[str, Any], probed: bool = False) -> bool:
+        """Merge probe results into the cache entry; ``probed`` marks a full FFprobe run"""
+        try:
+            await self._ensure_connection()
+            update = {"$set": {f"info.{key}": value for key, value in info.items()}}
+            update["$set"]["updated"] = datetime.now()
+            if probed:
+                update["$set"]["probed"] = True
+            else:
+                update["$setOnInsert"] = {"probed": False}
+            
+            result = await self.media_info.update_one({"_id": file_unique_id}, update, upsert=True)
+            return result.acknowledged
+        except Exception as e:
+            logger.error(f"Error caching media info for {file_unique_id}: {e}")
+            return False
+    
+    # Rename Job Journal (one document per unfinished job)
+    async def save_job(self, job_id: str, fields: Dict[str, Any]) -> bool:
+        """Create or update a journal entry"""
+        try:
+            await self._ensure_connection()
+            update = {"$set": dict(fields, updated=datetime.now())}
+            result = await self.jobs.update_one({"_id": job_id}, update, upsert=True)
+            return result.acknowledged
+        except Exception as e:
+            logger.error(f"Error journaling job {job_id}: {e}")
+            return False
+    
+    async def delete_job(self, job_id: str) -> bool:
+        """Drop a finished job from the journal"""
+        try:
+            await self._ensure_connection()
+            result = await self.jobs.delete_one({"_id": job_id})
+            return result.deleted_count > 0
+        except Exception as e:
+            logger.error(f"Error removing job {job_id} from journal: {e}")
+            return False
+    
+    async def get_unfinished_jobs(self) -> List[Dict[str, Any]]:
+        """Every journaled job, oldest first"""
+        try:
+            await self._ensure_connection()
+            return await self.jobs.find({}).sort("created", 1).to_list(length=None)
+        except Exception as e:
+            logger.error(f"Error reading job journal: {e}")
+            return []
+    
+    # Admin Queries
+    async def total_users_count(self) -> int:
+        """Total number of users"""
+        try:
+            await self._ensure_connection()
+            return await self.users.count_documents({})
+        except Exception as e:
+            logger.error(f"Error counting users: {e}")
+            return 0
+    
+    async def get_all_users(self):
+        """Every user document; iterate with ``async for`` (no await needed)"""
+        await self._ensure_connection()
+        async for user in self.users.find({}):
+            yield user
+    
+    async def get_active_users_count(self, hours: int = 24) -> int:
+        """Number of users active in the last ``hours`` hours"""
+        try:
+            await self._ensure_connection()
+            since = datetime.now() - timedelta(hours=hours)
+            return await self.users.count_documents({"last_used": {"$gte": since}})
+        except Exception as e:
+            logger.error(f"Error counting active users: {e}")
+            return 0
+    
+    async def get_files_processed_today(self) -> int:
+        """Files renamed today across all users"""
+        try:
+            await self._ensure_connection()
+            field = f"activity.daily_files.{datetime.now().strftime('%Y-%m-%d')}"
+            
+            cursor = self.users.aggregate([
+                {"$match": {field: {"$gt": 0}}},
+                {"$group": {"_id": None, "total": {"$sum": f"${field}"}}}
+            ])
+            async for row in cursor:
+                return row.get("total", 0)
+            return 0
+        except Exception as e:
+            logger.error(f"Error counting today's files: {e}")
+            return 0
+
+# Global database instance
+db = EnhancedDatabase()
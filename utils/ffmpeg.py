@@ -5,8 +5,13 @@ import shutil
 import logging
 import asyncio
 import os
-from typing import Optional, Dict, Any, Tuple
+import signal
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Tuple, List, Callable, Awaitable, AsyncIterator
 from pathlib import Path
+from Bot.config import Config
+from utils.helpers import run_fs, path_exists, remove_path
 
 logger = logging.getLogger(__name__)
 
@@ -16,10 +21,304 @@ except ImportError:
     imageio_ffmpeg = None
     logger.warning("imageio-ffmpeg not installed. Falling back to system ffmpeg.")
 
+try:
+    import resource
+except ImportError:
+    resource = None  # Not available on Windows; limits are skipped
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Async callback receiving (done_seconds, total_seconds)
+ProgressCallback = Callable[[float, float], Awaitable[None]]
+
+# Lines of stderr kept for error reporting
+STDERR_TAIL_LINES = 50
+
+# Bytes read from stderr at a time; FFmpeg's stats lines end in \r, so
+# line-based reads would hit the StreamReader limit on long runs
+STDERR_READ_SIZE = 64 * 1024
+
+# Containers that need the moov atom up front for progressive playback
+MP4_EXTENSIONS = ('.mp4', '.m4v', '.mov')
+
+# Muxer for each container the metadata pass writes
+CONTAINER_MUXERS = {
+    '.mkv': 'matroska', '.mp4': 'mp4', '.m4v': 'mp4',
+    '.mov': 'mov', '.avi': 'avi', '.webm': 'webm'
+}
+
+# Muxers that accept -movflags +faststart
+FASTSTART_MUXERS = ('mp4', 'mov')
+
+# Bitmap subtitle codecs (Blu-ray/DVD/DVB); large and useless to most players
+IMAGE_SUBTITLE_CODECS = ('hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub')
+
+# Streams without a language tag carry one of these
+UNKNOWN_LANGUAGES = ('', 'und', 'unk', 'mis', 'zxx')
+
+# Container an extracted audio stream is copied into, by codec; others go to Matroska audio
+AUDIO_CONTAINERS = {
+    'aac': '.m4a', 'alac': '.m4a', 'mp3': '.mp3', 'opus': '.opus', 'vorbis': '.ogg',
+    'flac': '.flac', 'ac3': '.ac3', 'eac3': '.eac3', 'dts': '.dts', 'truehd': '.thd',
+    'pcm_s16le': '.wav', 'pcm_s24le': '.wav', 'pcm_f32le': '.wav'
+}
+
+# Stream properties that must match for the concat demuxer to stream-copy
+CONCAT_KEYS = {
+    'video': ('codec_name', 'profile', 'width', 'height', 'pix_fmt'),
+    'audio': ('codec_name', 'sample_rate', 'channels'),
+    'subtitle': ('codec_name',)
+}
+
 class FFmpegError(Exception):
     """Custom exception for FFmpeg-related errors"""
     pass
 
+class FFmpegTimeout(FFmpegError):
+    """Raised when an FFmpeg/FFprobe child exceeds its wall-clock budget"""
+    pass
+
+class ProcessResult:
+    """Outcome of a sandboxed FFmpeg/FFprobe invocation"""
+    
+    def __init__(self, returncode: int, stdout: bytes, stderr: bytes,
+                 timed_out: bool = False, rusage: Optional[Dict[str, float]] = None):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+        self.rusage = rusage or {}
+    
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+def _limit_child_resources() -> None:
+    """
+    preexec_fn: cap CPU time of the FFmpeg child
+    
+    Memory is not capped here: multi-threaded encoders reserve far more
+    address space than they touch, so RLIMIT_AS would fail them long
+    before they use that much. _UsageSampler enforces the limit on RSS.
+    """
+    if resource is None:
+        return
+    
+    if Config.FFMPEG_MAX_CPU_SECONDS > 0:
+        cpu = Config.FFMPEG_MAX_CPU_SECONDS
+        # Soft limit sends SIGXCPU, the hard limit a little later SIGKILL
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+
+def _limit_probe_resources() -> None:
+    """preexec_fn for FFprobe: CPU cap plus an address space cap (it never spawns encoder threads)"""
+    _limit_child_resources()
+    if resource is not None and Config.FFMPEG_MAX_MEMORY_MB > 0:
+        limit = Config.FFMPEG_MAX_MEMORY_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _kill_process_group(process) -> None:
+    """Kill the child together with anything it spawned"""
+    if process.returncode is not None:
+        return
+    
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+    except Exception as e:
+        logger.debug(f"Failed to kill FFmpeg process group {process.pid}: {e}")
+
+class _UsageSampler:
+    """Track CPU time and peak RSS of a child while it runs, killing its group above FFMPEG_MAX_MEMORY_MB"""
+    
+    INTERVAL = 0.5
+    
+    def __init__(self, pid: int):
+        self.started = time.monotonic()
+        self.usage = {'wall': 0.0, 'cpu_user': 0.0, 'cpu_system': 0.0, 'max_rss': 0}
+        self.over_memory = False
+        self._pid = pid
+        self._max_rss = Config.FFMPEG_MAX_MEMORY_MB * 1024 * 1024
+        self._proc = None
+        if psutil:
+            try:
+                self._proc = psutil.Process(pid)
+            except Exception:
+                self._proc = None
+    
+    def sample(self) -> None:
+        if not self._proc:
+            return
+        try:
+            cpu = self._proc.cpu_times()
+            self.usage['cpu_user'] = cpu.user
+            self.usage['cpu_system'] = cpu.system
+            self.usage['max_rss'] = max(self.usage['max_rss'], self._proc.memory_info().rss)
+        except Exception:
+            # Process already exited; keep the last sample
+            self._proc = None
+            return
+        
+        if self._max_rss > 0 and self.usage['max_rss'] > self._max_rss:
+            logger.error(
+                f"FFmpeg process {self._pid} uses {self.usage['max_rss'] // 1048576} MB, "
+                f"over the {Config.FFMPEG_MAX_MEMORY_MB} MB limit; killing its process group"
+            )
+            self.over_memory = True
+            self._proc = None
+            try:
+                os.killpg(self._pid, signal.SIGKILL)
+            except OSError:
+                pass
+    
+    async def run(self) -> None:
+        while self._proc:
+            self.sample()
+            await asyncio.sleep(self.INTERVAL)
+    
+    def finish(self) -> Dict[str, float]:
+        self.usage['wall'] = round(time.monotonic() - self.started, 3)
+        return self.usage
+
+async def _read_tail(stream, tail: deque) -> None:
+    """Consume a pipe in fixed-size reads keeping only its last lines"""
+    pending = b''
+    while True:
+        chunk = await stream.read(STDERR_READ_SIZE)
+        if not chunk:
+            break
+        lines = (pending + chunk).replace(b'\r', b'\n').split(b'\n')
+        # An unterminated line is carried over, but never grows unbounded
+        pending = lines.pop()[-STDERR_READ_SIZE:]
+        tail.extend(line.rstrip() for line in lines if line.strip())
+    if pending.strip():
+        tail.append(pending.rstrip())
+
+def _stream_types(probe: Dict[str, Any]) -> Dict[int, str]:
+    """Map stream index to codec type from raw FFprobe output"""
+    stream_info = {}
+    for stream in probe.get('streams', []):
+        index = stream.get('index')
+        codec_type = stream.get('codec_type')
+        if index is not None and codec_type:
+            stream_info[index] = codec_type
+    return stream_info
+
+def track_rules_active(rules: Optional[Dict[str, Any]]) -> bool:
+    """True if the user's track rules can drop anything"""
+    return bool(rules) and bool(
+        rules.get('languages') or rules.get('drop_commentary') or rules.get('drop_image_subs')
+    )
+
+def _is_commentary(stream: Dict[str, Any]) -> bool:
+    if stream.get('disposition', {}).get('comment'):
+        return True
+    return 'commentary' in stream.get('tags', {}).get('title', '').lower()
+
+def select_tracks(probe: Dict[str, Any], rules: Optional[Dict[str, Any]]) -> List[int]:
+    """
+    Pick the input streams to keep according to a user's track rules
+    
+    Video, attachments (MKV fonts) and data streams are always kept. Audio
+    and subtitle streams are filtered by language, commentary and (for
+    subtitles) bitmap codecs. Untagged streams pass the language filter
+    since their language is unknown, and at least one audio stream is
+    always kept.
+    
+    Args:
+        probe (dict): Raw FFprobe output
+        rules (dict): {'languages': [...], 'drop_commentary': bool, 'drop_image_subs': bool}
+    
+    Returns:
+        List of input stream indexes in their original order
+    """
+    streams = [s for s in probe.get('streams', []) if s.get('index') is not None]
+    if not track_rules_active(rules):
+        return [s['index'] for s in streams]
+    
+    languages = {lang.lower() for lang in rules.get('languages') or []}
+    keep = []
+    audio = []
+    
+    for stream in streams:
+        codec_type = stream.get('codec_type')
+        if codec_type == 'audio':
+            audio.append(stream)
+        
+        if codec_type in ('audio', 'subtitle'):
+            language = stream.get('tags', {}).get('language', '').lower()
+            if languages and language not in UNKNOWN_LANGUAGES and language not in languages:
+                continue
+            if rules.get('drop_commentary') and _is_commentary(stream):
+                continue
+            if codec_type == 'subtitle' and rules.get('drop_image_subs') \
+                    and stream.get('codec_name') in IMAGE_SUBTITLE_CODECS:
+                continue
+        
+        keep.append(stream['index'])
+    
+    # Never produce a silent file: fall back to the default (or first) audio track
+    if audio and not any(s['index'] in keep for s in audio):
+        fallback = next((s for s in audio if s.get('disposition', {}).get('default')), audio[0])
+        keep.append(fallback['index'])
+        keep.sort()
+    
+    return keep
+
+def _write_concat_list(list_file: str, input_files: List[str]) -> None:
+    """Write an FFmpeg concat demuxer list (paths escaped for single quotes)"""
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for path in input_files:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+def audio_extension(codec: Optional[str]) -> str:
+    """Extension of the container an audio codec is stream-copied into"""
+    return AUDIO_CONTAINERS.get((codec or '').lower(), '.mka')
+
+def _concat_layout(probe: Dict[str, Any]) -> List[Tuple[str, Tuple]]:
+    """Per-stream (type, properties) that the concat demuxer needs to agree"""
+    layout = []
+    for stream in probe.get('streams', []):
+        codec_type = stream.get('codec_type')
+        if codec_type in CONCAT_KEYS:
+            layout.append((codec_type, tuple(stream.get(key) for key in CONCAT_KEYS[codec_type])))
+    return layout
+
+def concat_mismatch(probes: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Explain why files cannot be joined by stream copy, or None if they can
+    
+    Args:
+        probes (list): Raw FFprobe output of each file, in join order
+    
+    Returns:
+        str: Human readable reason, None when all files match the first
+    """
+    if not probes or not all(probes):
+        return "Some files could not be read"
+    
+    first = _concat_layout(probes[0])
+    if not first:
+        return "The first file has no audio or video streams"
+    
+    for number, probe in enumerate(probes[1:], 2):
+        layout = _concat_layout(probe)
+        if len(layout) != len(first) or [t for t, _ in layout] != [t for t, _ in first]:
+            return f"File {number} has different tracks than file 1"
+        for (codec_type, expected), (_, actual) in zip(first, layout):
+            if expected != actual:
+                keys = CONCAT_KEYS[codec_type]
+                differs = next(key for key, a, b in zip(keys, expected, actual) if a != b)
+                return f"File {number} {codec_type} {differs} is {actual[keys.index(differs)]}, file 1 has {expected[keys.index(differs)]}"
+    return None
+
 class DazaiFFmpeg:
     """Enhanced FFmpeg handler with Dazai bot integration"""
     
@@ -64,17 +363,132 @@ class DazaiFFmpeg:
         """Check if FFprobe is available"""
         return bool(self.ffprobe_path)
     
-    async def get_media_info(self, file_path: str) -> Dict[str, Any]:
+    async def _run(self, cmd: List[str], timeout: Optional[float] = None,
+                   progress: Optional[ProgressCallback] = None,
+                   duration: float = 0) -> ProcessResult:
         """
-        Extract comprehensive media information using FFprobe
+        Run an FFmpeg/FFprobe command inside the resource sandbox
+        
+        The child gets its own process group with RLIMIT_CPU applied (plus
+        RLIMIT_AS for FFprobe), and the whole group is killed on timeout, when
+        its sampled RSS goes over FFMPEG_MAX_MEMORY_MB, or when the awaiting
+        task is cancelled, so a pathological file can never outlive its job.
+        
+        When ``progress`` is given the command is run with ``-progress pipe:1``
+        and the key=value blocks on stdout are parsed as they arrive. Only the
+        tail of stderr is ever kept in memory.
+        
+        Args:
+            cmd (list): Command line to execute
+            timeout (float): Wall-clock limit in seconds (None/0 disables)
+            progress (callable): Async callback receiving (done_seconds, total_seconds)
+            duration (float): Probed input duration used as the progress total
+            
+        Returns:
+            ProcessResult with output, exit status and resource usage
+        """
+        if progress:
+            # Progress goes to stdout, only errors to stderr
+            cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', '-v', 'error'] + list(cmd[1:])
+        elif cmd[0] == self.ffmpeg_path and '-nostats' not in cmd:
+            # Nobody reads the stats line; it would only flood stderr
+            cmd = [cmd[0], '-nostats'] + list(cmd[1:])
+        
+        logger.debug(f"Running: {' '.join(cmd)}")
+        
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=(_limit_probe_resources if cmd[0] == self.ffprobe_path else _limit_child_resources)
+            if resource else None,
+            start_new_session=True
+        )
+        
+        sampler = _UsageSampler(process.pid)
+        sampler_task = asyncio.create_task(sampler.run())
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        timed_out = False
+        stdout = b''
+        
+        if progress:
+            stdout_reader = self._read_progress(process.stdout, progress, duration)
+        else:
+            stdout_reader = process.stdout.read()
+        
+        try:
+            stdout, _, _ = await asyncio.wait_for(
+                asyncio.gather(stdout_reader, _read_tail(process.stderr, stderr_tail), process.wait()),
+                timeout or None
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+            logger.error(f"{os.path.basename(cmd[0])} timed out after {timeout}s, killing process group")
+            _kill_process_group(process)
+            await process.wait()
+        except asyncio.CancelledError:
+            _kill_process_group(process)
+            raise
+        finally:
+            sampler_task.cancel()
+            if process.returncode is None:
+                _kill_process_group(process)
+        
+        usage = sampler.finish()
+        if sampler.over_memory:
+            stderr_tail.append(f"Killed: over the {Config.FFMPEG_MAX_MEMORY_MB} MB memory limit".encode())
+        logger.debug(
+            f"{os.path.basename(cmd[0])} exited {process.returncode} in {usage['wall']}s "
+            f"(cpu {usage['cpu_user'] + usage['cpu_system']:.1f}s, rss {usage['max_rss'] // 1048576} MB)"
+        )
+        
+        return ProcessResult(process.returncode, stdout or b'', b'\n'.join(stderr_tail), timed_out, usage)
+    
+    async def _read_progress(self, stream, progress: ProgressCallback, duration: float) -> bytes:
+        """Parse ``-progress`` blocks incrementally and report elapsed output time"""
+        block = {}
+        
+        async for raw_line in stream:
+            line = raw_line.decode(errors='replace').strip()
+            if '=' not in line:
+                continue
+            
+            key, value = line.split('=', 1)
+            block[key] = value
+            
+            # Every block ends with progress=continue|end
+            if key != 'progress':
+                continue
+            
+            try:
+                done = int(block.get('out_time_us') or block.get('out_time_ms') or 0) / 1_000_000
+            except ValueError:
+                done = 0
+            
+            if value == 'end' and duration:
+                done = duration
+            
+            try:
+                await progress(max(done, 0), duration)
+            except Exception as e:
+                logger.debug(f"FFmpeg progress callback failed: {e}")
+            
+            block = {}
+        
+        return b''
+    
+    async def _probe(self, file_path: str) -> Dict[str, Any]:
+        """
+        Run FFprobe once and return its raw format/streams JSON
         
         Args:
             file_path (str): Path to the media file
             
         Returns:
-            Dict containing media information
+            Dict with 'format' and 'streams' keys, empty on failure
         """
-        if not self.ffprobe_path or not os.path.exists(file_path):
+        if not self.ffprobe_path or not await path_exists(file_path):
             return {}
         
         cmd = [
@@ -87,22 +501,33 @@ class DazaiFFmpeg:
         ]
         
         try:
-            logger.debug(f"Running FFprobe: {' '.join(cmd)}")
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            result = await self._run(cmd, Config.FFPROBE_TIMEOUT)
             
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode != 0:
-                logger.error(f"FFprobe failed: {stderr.decode()}")
+            if not result.ok:
+                logger.error(f"FFprobe failed: {result.stderr.decode(errors='replace')}")
                 return {}
             
-            data = json.loads(stdout.decode())
+            return json.loads(result.stdout.decode())
             
+        except Exception as e:
+            logger.error(f"Error probing {file_path}: {e}")
+            return {}
+    
+    async def get_media_info(self, file_path: str) -> Dict[str, Any]:
+        """
+        Extract comprehensive media information using FFprobe
+        
+        Args:
+            file_path (str): Path to the media file
+            
+        Returns:
+            Dict containing media information
+        """
+        data = await self._probe(file_path)
+        if not data:
+            return {}
+        
+        try:
             # Extract useful information
             info = {
                 'duration': 0,
@@ -114,6 +539,7 @@ class DazaiFFmpeg:
                 'format': '',
                 'has_video': False,
                 'has_audio': False,
+                'audio_codec': '',
                 'file_size': 0
             }
             
@@ -142,8 +568,9 @@ class DazaiFFmpeg:
                         if int(den) > 0:
                             info['fps'] = round(int(num) / int(den), 2)
                 
-                elif codec_type == 'audio':
+                elif codec_type == 'audio' and not info['has_audio']:
                     info['has_audio'] = True
+                    info['audio_codec'] = stream.get('codec_name', '')
             
             return info
             
@@ -152,70 +579,90 @@ class DazaiFFmpeg:
             return {}
     
     async def change_metadata(self, input_file: str, output_file: str, 
-                            metadata: Dict[str, str]) -> bool:
+                            metadata: Dict[str, str],
+                            progress: Optional[ProgressCallback] = None,
+                            track_rules: Optional[Dict[str, Any]] = None) -> bool:
         """
         Change file metadata with enhanced options
         
+        Unwanted audio/subtitle tracks are dropped in the same stream-copy
+        pass when track rules are given.
+        
         Args:
             input_file (str): Input file path
             output_file (str): Output file path
             metadata (dict): Metadata to apply
+            progress (callable): Optional async callback receiving (done_seconds, total_seconds)
+            track_rules (dict): Optional track selection rules (see select_tracks)
             
         Returns:
             bool: Success status
         """
-        if not self.ffmpeg_path or not os.path.exists(input_file):
+        if not self.ffmpeg_path or not await path_exists(input_file):
             logger.error("FFmpeg not available or input file doesn't exist")
             return False
         
         try:
-            # Get stream information for advanced metadata
-            streams_info = await self._get_streams_info(input_file)
+            # One probe gives both the stream layout and the progress total
+            probe = await self._probe(input_file)
+            streams_info = _stream_types(probe)
+            duration = float(probe.get('format', {}).get('duration', 0) or 0)
             
-            cmd = [
-                self.ffmpeg_path,
-                '-i', input_file,
-                '-map', '0',
-                '-c', 'copy',
-                '-avoid_negative_ts', 'make_zero'
-            ]
+            cmd = [self.ffmpeg_path, '-i', input_file]
+            
+            kept = select_tracks(probe, track_rules)
+            if track_rules_active(track_rules) and kept:
+                for index in kept:
+                    cmd.extend(['-map', f'0:{index}'])
+                dropped = len(streams_info) - len(kept)
+                if dropped:
+                    logger.info(f"Dropping {dropped} unwanted track(s) from {input_file}")
+            else:
+                cmd.extend(['-map', '0'])
+                kept = sorted(streams_info)
+            
+            cmd.extend(['-c', 'copy', '-avoid_negative_ts', 'make_zero'])
             
             # Apply global metadata
             for key, value in metadata.items():
                 if value and value.strip():
                     cmd.extend(['-metadata', f'{key}={value.strip()}'])
             
-            # Apply stream-specific metadata if streams are available
-            if streams_info:
-                for stream_index, stream_type in streams_info.items():
-                    title_key = f'{stream_type}_title'
-                    if title_key in metadata and metadata[title_key]:
-                        cmd.extend([f'-metadata:s:{stream_index}', f'title={metadata[title_key]}'])
+            # Apply stream-specific metadata; specifiers address output
+            # streams, which are renumbered once tracks are dropped
+            for output_index, stream_index in enumerate(kept):
+                title_key = f'{streams_info.get(stream_index)}_title'
+                if title_key in metadata and metadata[title_key]:
+                    cmd.extend([f'-metadata:s:{output_index}', f'title={metadata[title_key]}'])
             
             # Add Dazai bot signature
             cmd.extend(['-metadata', 'comment=Processed by Dazai Rename Bot - Where art meets technology'])
             
-            # Output format based on extension
+            # Output format based on extension (temp outputs like
+            # "movie.mkv.processed" take the input's container)
             output_ext = Path(output_file).suffix.lower()
-            if output_ext in ['.mkv', '.mp4', '.avi']:
-                cmd.extend(['-f', 'matroska' if output_ext == '.mkv' else 'mp4'])
+            if output_ext not in CONTAINER_MUXERS:
+                output_ext = Path(input_file).suffix.lower()
+            muxer = CONTAINER_MUXERS.get(output_ext)
+            if muxer:
+                cmd.extend(['-f', muxer])
             
-            cmd.append(output_file)
+            # The remux is already rewriting the file, so relocating the
+            # index for instant playback costs nothing extra
+            if muxer in FASTSTART_MUXERS:
+                cmd.extend(['-movflags', '+faststart'])
             
-            logger.debug(f"Running FFmpeg: {' '.join(cmd)}")
+            cmd.extend(['-y', output_file])
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            result = await self._run(cmd, Config.FFMPEG_TIMEOUT, progress=progress, duration=duration)
             
-            if process.returncode != 0:
-                error_msg = stderr.decode()
+            if not result.ok:
+                error_msg = result.stderr.decode(errors='replace')
                 logger.error(f"FFmpeg metadata change failed: {error_msg}")
                 
+                # Never leave a truncated output behind
+                await remove_path(output_file)
+                
                 # Try to provide helpful error messages
                 if "Invalid argument" in error_msg:
                     logger.error("Metadata values may contain invalid characters")
@@ -227,105 +674,463 @@ class DazaiFFmpeg:
                 return False
             
             # Verify output file was created
-            if not os.path.exists(output_file):
+            if not await path_exists(output_file):
                 logger.error("Output file was not created")
                 return False
             
             logger.info(f"Successfully applied metadata to {output_file}")
             return True
             
+        except asyncio.CancelledError:
+            await remove_path(output_file)
+            raise
         except Exception as e:
             logger.error(f"Exception during metadata change: {e}")
             return False
     
     async def _get_streams_info(self, file_path: str) -> Dict[int, str]:
         """Get stream types for metadata application"""
-        if not self.ffprobe_path:
-            return {}
+        return _stream_types(await self._probe(file_path))
+    
+    def needs_faststart(self, file_path: str) -> bool:
+        """
+        Check whether an MP4/MOV file has its moov atom after the media data
+        
+        Only the top-level box headers are read, so this is cheap even for
+        multi-gigabyte files.
+        
+        Args:
+            file_path (str): Path to the video file
+            
+        Returns:
+            bool: True if a faststart remux would help playback
+        """
+        if Path(file_path).suffix.lower() not in MP4_EXTENSIONS:
+            return False
+        
+        try:
+            file_size = os.path.getsize(file_path)
+            with open(file_path, 'rb') as f:
+                offset = 0
+                while offset + 8 <= file_size:
+                    f.seek(offset)
+                    header = f.read(8)
+                    size = int.from_bytes(header[:4], 'big')
+                    box_type = header[4:8]
+                    
+                    if size == 1:
+                        size = int.from_bytes(f.read(8), 'big')
+                    elif size == 0:
+                        size = file_size - offset
+                    
+                    if box_type == b'moov':
+                        return False
+                    if box_type == b'mdat':
+                        return True
+                    if size < 8:
+                        break
+                    offset += size
+        except Exception as e:
+            logger.debug(f"Could not inspect MP4 layout of {file_path}: {e}")
+        
+        return False
+    
+    async def apply_faststart(self, input_file: str, output_file: str,
+                              progress: Optional[ProgressCallback] = None) -> bool:
+        """
+        Stream-copy an MP4 with the moov atom moved to the front
+        
+        Args:
+            input_file (str): Input file path
+            output_file (str): Output file path
+            progress (callable): Optional async callback receiving (done_seconds, total_seconds)
+            
+        Returns:
+            bool: Success status
+        """
+        if not self.ffmpeg_path or not await path_exists(input_file):
+            return False
         
         try:
+            probe = await self._probe(input_file)
+            duration = float(probe.get('format', {}).get('duration', 0) or 0)
+            
             cmd = [
-                self.ffprobe_path,
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_streams',
-                file_path
+                self.ffmpeg_path,
+                '-i', input_file,
+                '-map', '0',
+                '-c', 'copy',
+                '-movflags', '+faststart',
+                '-f', 'mp4',
+                '-y', output_file
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            result = await self._run(cmd, Config.FFMPEG_TIMEOUT, progress=progress, duration=duration)
             
-            stdout, stderr = await process.communicate()
+            if not result.ok:
+                logger.error(f"Faststart remux failed: {result.stderr.decode(errors='replace')}")
+                await remove_path(output_file)
+                return False
             
-            if process.returncode != 0:
-                return {}
+            return await path_exists(output_file)
             
-            data = json.loads(stdout.decode())
-            streams = data.get('streams', [])
+        except asyncio.CancelledError:
+            await remove_path(output_file)
+            raise
+        except Exception as e:
+            logger.error(f"Exception during faststart remux: {e}")
+            return False
+    
+    async def segment(self, input_file: Optional[str], output_dir: str, segment_time: float,
+                      on_segment: Callable[[str], Awaitable[None]],
+                      feed: Optional[AsyncIterator[bytes]] = None, extension: str = '.mkv') -> bool:
+        """
+        Cut a video at keyframes into stream-copied parts of about ``segment_time`` seconds
+        
+        Each finished part is reported through ``on_segment`` while FFmpeg
+        keeps going. With ``feed`` the input is piped to FFmpeg as it arrives
+        instead of read from ``input_file``, so cutting overlaps the download.
+        
+        Runs in the same sandbox as ``_run``: resource limits, usage sampling
+        and, for a file on disk, the FFMPEG_TIMEOUT wall-clock limit (a piped
+        run lasts as long as the download feeding it).
+        
+        Args:
+            input_file (str): Source file, or None when ``feed`` is given
+            output_dir (str): Directory receiving part001<ext>, part002<ext>, ...
+            segment_time (float): Target part duration in seconds
+            on_segment (callable): Async callback receiving each finished part's path
+            feed (async iterator): Chunks of the source file, in order
+            extension (str): Output container extension
             
-            stream_info = {}
-            for stream in streams:
-                index = stream.get('index')
-                codec_type = stream.get('codec_type')
-                if index is not None and codec_type:
-                    stream_info[index] = codec_type
+        Returns:
+            bool: Success status
+        """
+        if not self.ffmpeg_path:
+            return False
+        
+        cmd = [
+            self.ffmpeg_path, '-hide_banner', '-nostats', '-v', 'error',
+            '-i', 'pipe:0' if feed else input_file,
+            '-map', '0',
+            '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', f"{segment_time:.3f}",
+            '-reset_timestamps', '1',
+            # Each part is listed on stdout once it is closed
+            '-segment_list', 'pipe:1',
+            '-segment_list_type', 'flat'
+        ]
+        if extension in MP4_EXTENSIONS:
+            cmd += ['-segment_format_options', 'movflags=+faststart']
+        cmd += ['-y', os.path.join(output_dir, f"part%03d{extension}")]
+        
+        logger.debug(f"Running: {' '.join(cmd)}")
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if feed else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            preexec_fn=_limit_child_resources if resource else None,
+            start_new_session=True
+        )
+        
+        sampler = _UsageSampler(process.pid)
+        sampler_task = asyncio.create_task(sampler.run())
+        stderr_tail = deque(maxlen=STDERR_TAIL_LINES)
+        reported = set()
+        timeout = None if feed else Config.FFMPEG_TIMEOUT
+        
+        async def report(name: str) -> None:
+            path = os.path.join(output_dir, os.path.basename(name))
+            if path not in reported and await path_exists(path):
+                reported.add(path)
+                await on_segment(path)
+        
+        async def read_segments() -> None:
+            async for line in process.stdout:
+                name = line.decode(errors='replace').strip()
+                if name:
+                    await report(name)
+        
+        async def write_input() -> None:
+            try:
+                async for chunk in feed:
+                    process.stdin.write(chunk)
+                    await process.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                # FFmpeg gave up early; its exit status says why
+                pass
+            finally:
+                try:
+                    process.stdin.close()
+                except Exception:
+                    pass
+        
+        readers = [read_segments(), _read_tail(process.stderr, stderr_tail), process.wait()]
+        if feed:
+            readers.append(write_input())
+        
+        try:
+            await asyncio.wait_for(asyncio.gather(*readers), timeout or None)
+        except asyncio.TimeoutError:
+            logger.error(f"Segmenting timed out after {timeout}s, killing process group")
+            _kill_process_group(process)
+            await process.wait()
+            return False
+        except BaseException:
+            _kill_process_group(process)
+            raise
+        finally:
+            sampler_task.cancel()
+            if process.returncode is None:
+                _kill_process_group(process)
+        
+        usage = sampler.finish()
+        if sampler.over_memory:
+            stderr_tail.append(f"Killed: over the {Config.FFMPEG_MAX_MEMORY_MB} MB memory limit".encode())
+        logger.debug(
+            f"Segmenting exited {process.returncode} in {usage['wall']}s "
+            f"(cpu {usage['cpu_user'] + usage['cpu_system']:.1f}s, rss {usage['max_rss'] // 1048576} MB)"
+        )
+        
+        if process.returncode != 0:
+            logger.error(f"Segmenting failed: {b' '.join(stderr_tail).decode(errors='replace')}")
+            return False
+        
+        # Parts whose list entry was not flushed before exit
+        for name in sorted(await run_fs(os.listdir, output_dir)):
+            if name.startswith('part') and name.endswith(extension):
+                await report(name)
+        return True
+    
+    async def check_concat(self, input_files: List[str]) -> Optional[str]:
+        """
+        Probe files before joining them; see concat_mismatch
+        
+        Args:
+            input_files (list): Paths in join order
             
-            return stream_info
+        Returns:
+            str: Why they cannot be stream-copied together, None if they can
+        """
+        probes = await asyncio.gather(*(self._probe(path) for path in input_files))
+        return concat_mismatch(list(probes))
+    
+    async def concat(self, input_files: List[str], output_file: str,
+                     progress: Optional[ProgressCallback] = None) -> bool:
+        """
+        Join files end to end with the concat demuxer, without re-encoding
+        
+        Run check_concat first: the demuxer only copies cleanly when every
+        file has the same tracks and codec parameters.
+        
+        Args:
+            input_files (list): Paths in join order
+            output_file (str): Output file path
+            progress (callable): Optional async callback receiving (done_seconds, total_seconds)
             
-        except Exception:
-            return {}
+        Returns:
+            bool: Success status
+        """
+        if not self.ffmpeg_path or not all([await path_exists(path) for path in input_files]):
+            return False
+        
+        list_file = f"{output_file}.txt"
+        try:
+            await run_fs(_write_concat_list, list_file, input_files)
+            
+            probes = await asyncio.gather(*(self._probe(path) for path in input_files))
+            duration = sum(float(probe.get('format', {}).get('duration', 0) or 0) for probe in probes)
+            
+            cmd = [
+                self.ffmpeg_path,
+                '-f', 'concat',
+                '-safe', '0',
+                '-i', list_file,
+                '-map', '0',
+                '-c', 'copy'
+            ]
+            
+            if Path(output_file).suffix.lower() in MP4_EXTENSIONS:
+                cmd.extend(['-movflags', '+faststart'])
+            
+            cmd.extend(['-y', output_file])
+            
+            result = await self._run(cmd, Config.FFMPEG_TIMEOUT, progress=progress, duration=duration)
+            
+            if not result.ok:
+                logger.error(f"Concat failed: {result.stderr.decode(errors='replace')}")
+                await remove_path(output_file)
+                return False
+            
+            return await path_exists(output_file)
+            
+        except asyncio.CancelledError:
+            await remove_path(output_file)
+            raise
+        except Exception as e:
+            logger.error(f"Exception during concat: {e}")
+            return False
+        finally:
+            await remove_path(list_file)
+    
+    async def extract_audio(self, input_file: str, output_base: str,
+                            progress: Optional[ProgressCallback] = None) -> Optional[str]:
+        """
+        Copy the default (or first) audio track out of a video without re-encoding
+        
+        The container is picked from the audio codec (AAC -> .m4a, Opus ->
+        .opus, ...), so the stream never has to be transcoded to fit it.
+        
+        Args:
+            input_file (str): Input video path
+            output_base (str): Output path without extension
+            progress (callable): Optional async callback receiving (done_seconds, total_seconds)
+            
+        Returns:
+            str: Path of the extracted audio, None on failure or without audio
+        """
+        if not self.ffmpeg_path or not await path_exists(input_file):
+            return None
+        
+        probe = await self._probe(input_file)
+        audio = [s for s in probe.get('streams', []) if s.get('codec_type') == 'audio']
+        if not audio:
+            return None
+        
+        track = next((s for s in audio if s.get('disposition', {}).get('default')), audio[0])
+        output_file = f"{output_base}{audio_extension(track.get('codec_name'))}"
+        duration = float(probe.get('format', {}).get('duration', 0) or 0)
+        
+        try:
+            cmd = [
+                self.ffmpeg_path,
+                '-i', input_file,
+                '-map', f"0:{track['index']}",
+                '-vn', '-sn', '-dn',
+                '-c:a', 'copy',
+                '-map_metadata', '0'
+            ]
+            
+            if output_file.endswith('.m4a'):
+                cmd.extend(['-movflags', '+faststart'])
+            
+            cmd.extend(['-y', output_file])
+            
+            result = await self._run(cmd, Config.FFMPEG_TIMEOUT, progress=progress, duration=duration)
+            
+            if not result.ok:
+                logger.error(f"Audio extraction failed: {result.stderr.decode(errors='replace')}")
+                await remove_path(output_file)
+                return None
+            
+            return output_file if await path_exists(output_file) else None
+            
+        except asyncio.CancelledError:
+            await remove_path(output_file)
+            raise
+        except Exception as e:
+            logger.error(f"Exception during audio extraction: {e}")
+            return None
     
     async def extract_thumbnail(self, video_path: str, output_path: str, 
-                              time_offset: str = "00:00:01") -> bool:
+                              time_offset: str = "00:00:01",
+                              max_size: Optional[int] = None) -> bool:
         """
         Extract thumbnail from video file
         
+        The seek is placed before ``-i`` so FFmpeg jumps to the nearest
+        keyframe instead of decoding everything up to the offset.
+        
         Args:
             video_path (str): Input video path
             output_path (str): Output thumbnail path
-            time_offset (str): Time offset for thumbnail extraction
+            time_offset (str): Time offset (HH:MM:SS or seconds) for thumbnail extraction
+            max_size (int): Optional bounding box for the longest side in pixels
             
         Returns:
             bool: Success status
         """
-        if not self.ffmpeg_path or not os.path.exists(video_path):
+        if not self.ffmpeg_path or not await path_exists(video_path):
             return False
         
         try:
             cmd = [
                 self.ffmpeg_path,
+                '-ss', str(time_offset),
                 '-i', video_path,
-                '-ss', time_offset,
                 '-vframes', '1',
-                '-q:v', '2',
-                '-y',  # Overwrite output file
-                output_path
+                '-q:v', '2'
             ]
             
-            logger.debug(f"Extracting thumbnail: {' '.join(cmd)}")
+            if max_size:
+                cmd.extend([
+                    '-vf', f'scale={max_size}:{max_size}:force_original_aspect_ratio=decrease'
+                ])
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            cmd.extend(['-y', output_path])  # Overwrite output file
             
-            stdout, stderr = await process.communicate()
+            result = await self._run(cmd, Config.THUMBNAIL_TIMEOUT)
             
-            if process.returncode == 0 and os.path.exists(output_path):
+            if result.ok and await path_exists(output_path):
                 logger.info(f"Thumbnail extracted: {output_path}")
                 return True
             else:
-                logger.error(f"Thumbnail extraction failed: {stderr.decode()}")
+                logger.error(f"Thumbnail extraction failed: {result.stderr.decode(errors='replace')}")
                 return False
                 
         except Exception as e:
             logger.error(f"Exception during thumbnail extraction: {e}")
             return False
     
+    async def extract_clip(self, input_file: str, output_file: str,
+                           start: float, length: float) -> bool:
+        """
+        Cut a stream-copied clip starting at the keyframe nearest to ``start``
+        
+        Args:
+            input_file (str): Input video path
+            output_file (str): Output clip path
+            start (float): Start offset in seconds
+            length (float): Clip length in seconds
+            
+        Returns:
+            bool: Success status
+        """
+        if not self.ffmpeg_path or not await path_exists(input_file):
+            return False
+        
+        try:
+            cmd = [
+                self.ffmpeg_path,
+                '-ss', f'{max(start, 0):.3f}',
+                '-i', input_file,
+                '-t', f'{length:.3f}',
+                '-map', '0:v:0?',
+                '-map', '0:a?',
+                '-c', 'copy',
+                '-avoid_negative_ts', 'make_zero'
+            ]
+            
+            if Path(output_file).suffix.lower() in MP4_EXTENSIONS:
+                cmd.extend(['-movflags', '+faststart'])
+            
+            cmd.extend(['-y', output_file])
+            
+            result = await self._run(cmd, Config.FFMPEG_TIMEOUT)
+            
+            if not result.ok:
+                logger.error(f"Clip extraction failed: {result.stderr.decode(errors='replace')}")
+                await remove_path(output_file)
+                return False
+            
+            return await path_exists(output_file)
+            
+        except Exception as e:
+            logger.error(f"Exception during clip extraction: {e}")
+            return False
+    
     async def convert_audio(self, input_file: str, output_file: str, 
                           codec: str = "aac", bitrate: str = "128k") -> bool:
         """
@@ -353,15 +1158,9 @@ class DazaiFFmpeg:
                 output_file
             ]
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
+            result = await self._run(cmd, Config.FFMPEG_TIMEOUT)
             
-            return process.returncode == 0
+            return result.ok
             
         except Exception as e:
             logger.error(f"Audio conversion failed: {e}")
@@ -401,7 +1200,9 @@ class DazaiFFmpeg:
 ffmpeg_handler = DazaiFFmpeg()
 
 # Compatibility functions for existing code
-async def change_metadata(input_file: str, output_file: str, metadata_text: str) -> bool:
+async def change_metadata(input_file: str, output_file: str, metadata_text: str,
+                          progress: Optional[ProgressCallback] = None,
+                          track_rules: Optional[Dict[str, Any]] = None) -> bool:
     """
     Legacy compatibility function for metadata changes
     
@@ -409,12 +1210,14 @@ async def change_metadata(input_file: str, output_file: str, metadata_text: str)
         input_file (str): Input file path
         output_file (str): Output file path
         metadata_text (str): Metadata configuration string
+        progress (callable): Optional async callback receiving (done_seconds, total_seconds)
+        track_rules (dict): Optional track selection rules
         
     Returns:
         bool: Success status
     """
     metadata = ffmpeg_handler.parse_metadata_string(metadata_text)
-    return await ffmpeg_handler.change_metadata(input_file, output_file, metadata)
+    return await ffmpeg_handler.change_metadata(input_file, output_file, metadata, progress, track_rules)
 
 async def get_media_duration(file_path: str) -> int:
     """
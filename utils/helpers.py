@@ -2,11 +2,16 @@
 import math
 import time
 import os
+import shutil
 import asyncio
+import threading
+import uuid
 import aiofiles
+from concurrent.futures import ThreadPoolExecutor
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 import logging
+from Bot.config import Config
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +31,12 @@ PROGRESS_MESSAGES = [
     "The art of waiting is often underappreciated..."
 ]
 
-async def progress_for_pyrogram(current: int, total: int, ud_type: str, message, start_time: float):
+async def progress_for_pyrogram(current: int, total: int, ud_type: str, message, start_time: float, job=None):
     """Enhanced progress callback with Dazai-themed messages"""
+    # Abort the transfer as soon as the owning job is cancelled
+    if job is not None:
+        job.check_transfer()
+    
     now = time.time()
     diff = now - start_time
     
@@ -77,6 +86,20 @@ async def progress_for_pyrogram(current: int, total: int, ud_type: str, message,
             logger.debug(f"Progress update failed: {e}")
             pass
 
+def ffmpeg_progress(ud_type: str, message, file_size: int, job=None):
+    """Build an ffmpeg progress callback that drives the transfer progress UI"""
+    start_time = time.time()
+    
+    async def callback(done: float, total: float):
+        # Map output time onto the file size so the same display applies
+        if total > 0:
+            fraction = min(done / total, 1.0)
+            await progress_for_pyrogram(
+                int(file_size * fraction), file_size, ud_type, message, start_time, job
+            )
+    
+    return callback
+
 def humanbytes(size: int) -> str:
     """Convert bytes to human readable format with improved precision"""
     if not size:
@@ -143,22 +166,131 @@ def sanitize_filename(filename: str) -> str:
     
     return filename
 
+# Filesystem calls run here, never on the event loop and never queued
+# behind unrelated work in the default executor
+_fs_executor = ThreadPoolExecutor(max_workers=Config.FS_WORKERS, thread_name_prefix="fs")
+
+# Huge deletes get their own thread so they cannot starve the pool above
+_delete_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fs-delete")
+
+# Per-operation timings: name -> {'count', 'wait', 'run', 'max'} in seconds
+fs_stats: Dict[str, Dict[str, float]] = {}
+_fs_stats_lock = threading.Lock()
+
+# Pending background deletes, kept referenced until they finish
+_background_deletes = set()
+
+def _record_fs(name: str, wait: float, run: float) -> None:
+    with _fs_stats_lock:
+        stats = fs_stats.setdefault(name, {'count': 0, 'wait': 0.0, 'run': 0.0, 'max': 0.0})
+        stats['count'] += 1
+        stats['wait'] += wait
+        stats['run'] += run
+        stats['max'] = max(stats['max'], run)
+    if run >= Config.FS_SLOW_SECONDS:
+        logger.warning(f"Filesystem {name} took {run:.2f}s")
+
+async def run_fs(func: Callable, *args, executor: Optional[ThreadPoolExecutor] = None):
+    """
+    Run a blocking filesystem call on the filesystem pool
+    
+    Time spent queued and running is recorded per operation in ``fs_stats``,
+    which is what the call would otherwise have blocked the event loop for.
+    
+    Args:
+        func (callable): Blocking function such as os.rename
+        *args: Arguments for ``func``
+        executor (ThreadPoolExecutor): Pool to use instead of the filesystem pool
+    """
+    queued = time.perf_counter()
+    name = getattr(func, '__name__', 'call')
+    
+    def timed():
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            _record_fs(name, started - queued, time.perf_counter() - started)
+    
+    return await asyncio.get_event_loop().run_in_executor(executor or _fs_executor, timed)
+
+def fs_stats_summary(limit: int = 0) -> str:
+    """One line per filesystem operation (slowest total first): count, average and worst run time"""
+    with _fs_stats_lock:
+        lines = [
+            f"`{name}` ×{stats['count']} avg {stats['run'] / stats['count'] * 1000:.1f}ms "
+            f"max {stats['max'] * 1000:.0f}ms wait {stats['wait'] / stats['count'] * 1000:.1f}ms"
+            for name, stats in sorted(fs_stats.items(), key=lambda item: -item[1]['run'])
+        ]
+    if limit:
+        lines = lines[:limit]
+    return "\n".join(lines) or "No filesystem operations yet"
+
+def _path_info(path: str) -> Optional[tuple]:
+    """(is_directory, size) of a path, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return os.path.isdir(path), stat.st_size
+
+def _delete(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+async def get_file_size(path: Optional[str]) -> int:
+    """Size of a file, 0 if it does not exist"""
+    info = await run_fs(_path_info, path) if path else None
+    return info[1] if info else 0
+
+async def path_exists(path: Optional[str]) -> bool:
+    return bool(path) and await run_fs(os.path.exists, path)
+
+async def move_path(source: str, destination: str) -> None:
+    """Rename a file, creating the destination directory if needed"""
+    await run_fs(os.makedirs, os.path.dirname(destination) or ".", 0o777, True)
+    await run_fs(os.replace, source, destination)
+
 async def remove_path(*paths) -> None:
-    """Asynchronously remove multiple file paths"""
+    """
+    Asynchronously remove multiple file paths (directories with their contents)
+    
+    Directories and files of BACKGROUND_DELETE_SIZE or more are renamed aside
+    and deleted in the background, so the caller does not wait for a slow
+    unlink of a multi-gigabyte file. Leftovers of an interrupted delete are
+    picked up by the scratch janitor.
+    """
     for path in paths:
         try:
-            if path and os.path.exists(path):
-                await asyncio.get_event_loop().run_in_executor(None, os.remove, path)
+            info = await run_fs(_path_info, path) if path else None
+            if info is None:
+                continue
+            
+            is_dir, size = info
+            if is_dir or size >= Config.BACKGROUND_DELETE_SIZE:
+                # Same directory, so the rename never crosses filesystems
+                trash = f"{path.rstrip(os.sep)}.deleting-{uuid.uuid4().hex[:8]}"
+                await run_fs(os.rename, path, trash)
+                task = asyncio.ensure_future(run_fs(_delete, trash, executor=_delete_executor))
+                _background_deletes.add(task)
+                task.add_done_callback(_background_deletes.discard)
+                logger.debug(f"Removing in background: {path}")
+            else:
+                await run_fs(os.remove, path)
                 logger.debug(f"Removed file: {path}")
         except Exception as e:
             logger.debug(f"Failed to remove {path}: {e}")
 
+def pending_deletes() -> set:
+    """Background deletes still running; their bytes are on disk but owned by no job"""
+    return set(_background_deletes)
+
 async def ensure_directory(directory: str) -> None:
     """Ensure directory exists, create if it doesn't"""
     try:
-        if not os.path.exists(directory):
-            os.makedirs(directory, exist_ok=True)
-            logger.debug(f"Created directory: {directory}")
+        await run_fs(os.makedirs, directory, 0o777, True)
     except Exception as e:
         logger.error(f"Failed to create directory {directory}: {e}")
 
@@ -192,27 +324,13 @@ def format_caption(template: str, file_info: Dict[str, Any], custom_vars: Option
     if not template:
         return ""
     
-    # Default variables
-    variables = {
-        'filename': file_info.get('file_name', 'Unknown'),
-        'filesize': humanbytes(file_info.get('file_size', 0)),
-        'duration': convert_seconds_to_readable(file_info.get('duration', 0)) if file_info.get('duration') else 'N/A',
-        'filetype': get_file_type_from_mime(file_info.get('mime_type', '')),
-        'width': file_info.get('width', 0),
-        'height': file_info.get('height', 0),
-        'resolution': f"{file_info.get('width', 0)}x{file_info.get('height', 0)}" if file_info.get('width') else 'N/A'
-    }
-    
-    # Add custom variables if provided
-    if custom_vars:
-        variables.update(custom_vars)
+    from utils.captions import compile_caption, CaptionError
     
-    # Replace variables in template
+    # Compiled once per template; only referenced variables are evaluated
     try:
-        formatted_caption = template.format(**variables)
-        return formatted_caption
-    except KeyError as e:
-        logger.warning(f"Caption template contains unknown variable: {e}")
+        return compile_caption(template).render(file_info, custom_vars)
+    except CaptionError as e:
+        logger.warning(f"Invalid caption template: {e}")
         return template
     except Exception as e:
         logger.error(f"Caption formatting error: {e}")
@@ -241,28 +359,11 @@ def get_file_type_from_mime(mime_type: str) -> str:
     return "Document"
 
 async def get_file_duration(file_path: str) -> int:
-    """Get duration of video/audio file using ffprobe"""
+    """Get duration of video/audio file using the sandboxed ffprobe"""
     try:
-        import subprocess
-        import json
-        
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_format', '-show_streams', file_path
-        ]
-        
-        result = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await result.communicate()
-        
-        if result.returncode == 0:
-            data = json.loads(stdout.decode())
-            duration = float(data.get('format', {}).get('duration', 0))
-            return int(duration)
-    except:
+        from utils.ffmpeg import get_media_duration
+        return await get_media_duration(file_path)
+    except Exception:
         pass
     
     return 0
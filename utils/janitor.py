@@ -0,0 +1,194 @@
+# utils/janitor.py - Orphaned Scratch File Cleanup with Startup Recovery and a Size Quota
+import asyncio
+import os
+import shutil
+import time
+import logging
+from typing import List, Set, Tuple, Optional
+from Bot.config import Config
+from utils.helpers import humanbytes, run_fs
+from utils.jobs import job_registry
+from utils.scratch import SCRATCH_DIR, PARTIAL_DIR
+
+logger = logging.getLogger(__name__)
+
+def _entry_stats(path: str) -> Tuple[int, float]:
+    """Total size and newest modification time of a file or directory tree"""
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    size, newest = 0, os.stat(path).st_mtime
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            size += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return size, newest
+
+def _scan(directory: str, exclude: Optional[str] = None) -> List[Tuple[str, int, float]]:
+    """(path, size, newest mtime) of every top-level entry in a scratch directory"""
+    entries = []
+    if not os.path.isdir(directory):
+        return entries
+    for name in os.listdir(directory):
+        path = os.path.abspath(os.path.join(directory, name))
+        if path == exclude:
+            continue
+        try:
+            entries.append((path, *_entry_stats(path)))
+        except OSError:
+            # Removed while scanning
+            continue
+    return entries
+
+def _remove(path: str) -> None:
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+class Janitor:
+    """
+    Deletes scratch files no live job owns
+
+    Anything in the scratch directory that is not (and does not contain or
+    sit inside) a path tracked by the job registry is an orphan, e.g. left
+    behind by a crash. Orphans are deleted once older than the grace
+    period; when the directory is over its quota, younger orphans go too,
+    oldest first. Files of running jobs are never touched.
+
+    Incomplete downloads in ``partial_dir`` are orphans by design (they
+    wait for the file to be sent again), so they are kept for at least
+    ``partial_keep`` seconds, even by the startup sweep, unless the quota
+    needs the room.
+    """
+
+    def __init__(self, directory: str, grace: float, quota: int, interval: float,
+                 partial_dir: str, partial_keep: float):
+        self.directory = directory
+        self.grace = grace
+        self.partial_dir = os.path.abspath(partial_dir)
+        self.partial_keep = partial_keep
+        self.quota = quota
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _active_paths() -> Set[str]:
+        return {os.path.abspath(path) for path in job_registry.active_paths()}
+
+    @staticmethod
+    def _is_active(path: str, active: Set[str]) -> bool:
+        return any(
+            owned == path or owned.startswith(path + os.sep) or path.startswith(owned + os.sep)
+            for owned in active
+        )
+
+    async def sweep(self, grace: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Delete orphaned scratch entries once
+
+        Args:
+            grace (float): Minimum age in seconds (defaults to the configured grace period)
+
+        Returns:
+            Tuple of (entries removed, bytes reclaimed)
+        """
+        grace = self.grace if grace is None else grace
+        entries = await run_fs(_scan, self.directory, self.partial_dir)
+        partials = await run_fs(_scan, self.partial_dir)
+        partial_grace = max(grace, self.partial_keep)
+
+        active = self._active_paths()
+        now = time.time()
+        total = sum(size for _, size, _ in entries + partials)
+        orphans = sorted(
+            (entry for entry in entries + partials if not self._is_active(entry[0], active)),
+            key=lambda entry: entry[2]
+        )
+
+        doomed = [
+            entry for entry in orphans
+            if now - entry[2] >= (partial_grace if entry in partials else grace)
+        ]
+        remaining = total - sum(size for _, size, _ in doomed)
+        if self.quota:
+            for entry in orphans:
+                if remaining <= self.quota:
+                    break
+                if entry not in doomed:
+                    doomed.append(entry)
+                    remaining -= entry[1]
+
+        removed, reclaimed = 0, 0
+        for path, size, _ in doomed:
+            # A job may have claimed the path since the scan
+            if self._is_active(path, self._active_paths()):
+                continue
+            try:
+                await run_fs(_remove, path)
+                removed += 1
+                reclaimed += size
+                logger.debug(f"Janitor removed {path} ({humanbytes(size)})")
+            except OSError as e:
+                logger.error(f"Janitor could not remove {path}: {e}")
+
+        if self.quota and remaining > self.quota:
+            logger.warning(
+                f"Scratch directory holds {humanbytes(remaining)} of live job files, "
+                f"over its {humanbytes(self.quota)} quota"
+            )
+        return removed, reclaimed
+
+    async def _report(self, client, when: str, removed: int, reclaimed: int) -> None:
+        if not removed:
+            return
+        logger.info(f"Janitor ({when}) removed {removed} orphaned entries, reclaimed {humanbytes(reclaimed)}")
+        if Config.LOG_CHANNEL:
+            try:
+                await client.send_message(
+                    Config.LOG_CHANNEL,
+                    f"🧹 **Scratch Cleanup** ({when})\n\n"
+                    f"**Removed:** `{removed}` orphaned entries\n"
+                    f"**Reclaimed:** `{humanbytes(reclaimed)}`\n\n"
+                    f"*\"Even the remains of a failed attempt deserve a proper burial.\"*"
+                )
+            except Exception as e:
+                logger.warning(f"Could not send janitor report to log channel: {e}")
+
+    async def _run(self, client) -> None:
+        # Nothing runs before startup, so every leftover entry is an orphan
+        removed, reclaimed = await self.sweep(grace=0)
+        await self._report(client, "startup", removed, reclaimed)
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                removed, reclaimed = await self.sweep()
+                await self._report(client, "periodic", removed, reclaimed)
+            except Exception as e:
+                logger.error(f"Janitor sweep failed: {e}")
+
+    def start(self, client) -> None:
+        """Run a startup sweep, then sweep every ``interval`` seconds"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(client))
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+# Global janitor instance
+janitor = Janitor(
+    SCRATCH_DIR,
+    grace=Config.JANITOR_GRACE,
+    quota=Config.SCRATCH_QUOTA_MB * 1024 * 1024,
+    interval=Config.JANITOR_INTERVAL,
+    partial_dir=PARTIAL_DIR,
+    partial_keep=Config.PARTIAL_KEEP_HOURS * 3600
+)
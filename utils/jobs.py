@@ -0,0 +1,356 @@
+# utils/jobs.py - Rename Job Registry, Cancellation Tokens, Scheduler Slots and Disk Admission
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import time
+from typing import Optional, Dict, Set, List
+from Bot.config import Config
+from utils.helpers import remove_path, humanbytes, run_fs, pending_deletes
+from utils.scratch import SCRATCH_DIR
+
+logger = logging.getLogger(__name__)
+
+# Queued jobs re-check free space this often, since other processes use the volume too
+DISK_RECHECK_SECONDS = 5
+
+class JobCancelled(Exception):
+    """Raised inside a job once its cancellation token has fired"""
+    pass
+
+class DiskSpaceError(Exception):
+    """Raised when a job needs more scratch space than the volume can offer"""
+    pass
+
+class CancellationToken:
+    """Cooperative cancellation flag shared by every stage of a job"""
+    
+    def __init__(self):
+        self._event = asyncio.Event()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def cancel(self) -> None:
+        self._event.set()
+    
+    async def wait(self) -> None:
+        await self._event.wait()
+    
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise JobCancelled()
+
+class RenameJob:
+    """A single rename run: its token, child tasks and temporary files"""
+    
+    def __init__(self, job_id: int, client, user_id: int, chat_id: int, progress_message=None):
+        self.job_id = job_id
+        self.client = client
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.progress_message = progress_message
+        self.token = CancellationToken()
+        self.stage = "queued"
+        self.created = time.time()
+        self.paths: Set[str] = set()
+        self.tasks: Set[asyncio.Task] = set()
+        self.hashes: Dict[str, str] = {}
+        self.has_slot = False
+        self.disk_reserved = 0
+        # (chat_id, message_id) of every message whose Cancel button stops this job
+        self.messages: Set[tuple] = set()
+        # Journal entry that lets the job resume after a restart, if any
+        self.journal_id: Optional[str] = None
+    
+    @property
+    def cancelled(self) -> bool:
+        return self.token.cancelled
+    
+    def set_stage(self, stage: str) -> None:
+        self.stage = stage
+        logger.debug(f"Job {self.job_id} -> {stage}")
+    
+    def track_path(self, *paths: Optional[str]) -> None:
+        """Register temporary files to delete when the job ends"""
+        for path in paths:
+            if path:
+                self.paths.add(path)
+    
+    def untrack_path(self, *paths: Optional[str]) -> None:
+        for path in paths:
+            self.paths.discard(path)
+    
+    def run_task(self, coro) -> asyncio.Task:
+        """Run a child coroutine that is cancelled together with the job"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        
+        if self.cancelled:
+            task.cancel()
+        return task
+    
+    async def run(self, coro):
+        """Await a child coroutine, turning job cancellation into JobCancelled"""
+        task = self.run_task(coro)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise JobCancelled()
+            raise
+    
+    def check_transfer(self) -> None:
+        """Called from Pyrogram progress callbacks; aborts the transfer if cancelled"""
+        if self.cancelled:
+            self.client.stop_transmission()
+
+def _paths_disk_usage(paths: List[str]) -> int:
+    """Bytes a job's tracked files take up, counting files inside tracked directories once"""
+    directories = [path for path in paths if os.path.isdir(path)]
+    return sum(
+        _disk_usage(path) for path in paths
+        if not any(path.startswith(directory + os.sep) for directory in directories)
+    )
+
+def _disk_usage(path: str) -> int:
+    """Bytes a tracked file (or directory tree) currently takes up"""
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    except OSError:
+        return 0
+
+class DiskAdmission:
+    """
+    Byte reservations against the scratch volume's free space
+    
+    A job reserves what it will write at most (``file_size`` times the
+    number of copies alive at once) before it starts. The part of a
+    reservation not yet written is treated as already used, so jobs that
+    together would fill the volume wait instead of failing halfway through
+    their transfers. Jobs shrink their reservation as their copies go away.
+    """
+    
+    def __init__(self, path: str, margin: int):
+        self.path = path
+        self.margin = margin
+        self._holders: Dict[int, RenameJob] = {}
+        self._changed = asyncio.Event()
+    
+    def _measure(self, holders: List[tuple]) -> int:
+        os.makedirs(self.path, exist_ok=True)
+        # Reserved bytes not yet written to disk
+        outstanding = sum(max(reserved - _paths_disk_usage(paths), 0) for reserved, paths in holders)
+        return shutil.disk_usage(self.path).free - outstanding - self.margin
+    
+    async def available(self) -> int:
+        """Free bytes not promised to any running job (measured off the event loop)"""
+        holders = [(job.disk_reserved, list(job.paths)) for job in self._holders.values()]
+        return await run_fs(self._measure, holders)
+    
+    async def fits(self, nbytes: int) -> bool:
+        return nbytes <= 0 or nbytes <= await self.available()
+    
+    async def reserve(self, job: RenameJob, nbytes: int) -> None:
+        """
+        Wait until ``nbytes`` of scratch space can be promised to the job
+        
+        Raises:
+            DiskSpaceError: Nothing else holds or is freeing space and it still does not fit
+            JobCancelled: The job was cancelled while waiting
+        """
+        while True:
+            job.token.raise_if_cancelled()
+            if await self.fits(nbytes):
+                break
+            # Files renamed aside by remove_path still fill the volume until
+            # their background delete finishes
+            deletes = pending_deletes()
+            if not self._holders and not deletes:
+                raise DiskSpaceError(
+                    f"Needs {humanbytes(nbytes)} of scratch space, only {humanbytes(max(await self.available(), 0))} free"
+                )
+            
+            job.set_stage("waiting for disk")
+            changed = asyncio.ensure_future(self._changed.wait())
+            cancelled = asyncio.ensure_future(job.token.wait())
+            try:
+                await asyncio.wait({changed, cancelled, *deletes}, timeout=DISK_RECHECK_SECONDS,
+                                   return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+                cancelled.cancel()
+        
+        if nbytes > 0:
+            job.disk_reserved = nbytes
+            self._holders[job.job_id] = job
+            logger.debug(f"Job {job.job_id} reserved {humanbytes(nbytes)} of scratch space")
+    
+    def release(self, job: RenameJob, keep: int = 0) -> None:
+        """Shrink the job's reservation to ``keep`` bytes, waking queued jobs"""
+        if job.job_id not in self._holders or job.disk_reserved <= keep:
+            return
+        
+        job.disk_reserved = max(keep, 0)
+        if not job.disk_reserved:
+            self._holders.pop(job.job_id, None)
+        
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+class JobRegistry:
+    """Registry of running jobs plus the global concurrency slots"""
+    
+    def __init__(self, max_concurrent: int = 4):
+        self._jobs: Dict[int, RenameJob] = {}
+        self._by_message: Dict[tuple, int] = {}
+        self._ids = itertools.count(1)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.disk = DiskAdmission(SCRATCH_DIR, Config.DISK_FREE_MARGIN_MB * 1024 * 1024)
+    
+    def create(self, client, user_id: int, chat_id: int, progress_message=None) -> RenameJob:
+        """Register a new job, optionally bound to a progress message"""
+        job = RenameJob(next(self._ids), client, user_id, chat_id, progress_message)
+        self._jobs[job.job_id] = job
+        
+        if progress_message is not None:
+            self.bind_message(job, progress_message)
+        
+        return job
+    
+    def bind_message(self, job: RenameJob, message) -> None:
+        """Let the Cancel button of another progress message (e.g. part uploads) stop the job"""
+        key = (message.chat.id, message.id)
+        job.messages.add(key)
+        self._by_message[key] = job.job_id
+    
+    def get(self, job_id: int) -> Optional[RenameJob]:
+        return self._jobs.get(job_id)
+    
+    def find_by_message(self, chat_id: int, message_id: int) -> Optional[RenameJob]:
+        return self._jobs.get(self._by_message.get((chat_id, message_id)))
+    
+    def user_jobs(self, user_id: int) -> List[RenameJob]:
+        return [job for job in self._jobs.values() if job.user_id == user_id]
+    
+    def active_jobs(self) -> List[RenameJob]:
+        return list(self._jobs.values())
+    
+    def active_paths(self) -> Set[str]:
+        """Every temporary file owned by a live job"""
+        paths = set()
+        for job in self._jobs.values():
+            paths.update(job.paths)
+        return paths
+    
+    def has_free_slot(self) -> bool:
+        return not self._slots.locked()
+    
+    async def can_start(self, disk_bytes: int = 0) -> bool:
+        """Whether a job needing ``disk_bytes`` of scratch space would start right away"""
+        return self.has_free_slot() and await self.disk.fits(disk_bytes)
+    
+    async def acquire(self, job: RenameJob, disk_bytes: int = 0) -> None:
+        """
+        Wait for a free scheduler slot, then for ``disk_bytes`` of scratch space
+        
+        Raises:
+            JobCancelled: The job was cancelled while queued
+            DiskSpaceError: The volume cannot hold the job even when idle
+        """
+        job.token.raise_if_cancelled()
+        
+        acquire_task = asyncio.ensure_future(self._slots.acquire())
+        cancel_task = asyncio.ensure_future(job.token.wait())
+        
+        try:
+            await asyncio.wait({acquire_task, cancel_task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            cancel_task.cancel()
+            if not acquire_task.done():
+                acquire_task.cancel()
+        
+        if acquire_task.done() and not acquire_task.cancelled():
+            job.has_slot = True
+        
+        if job.cancelled:
+            self._release_slot(job)
+            raise JobCancelled()
+        
+        # Space is only freed by running jobs, so waiting for it while
+        # holding a slot cannot deadlock
+        try:
+            await self.disk.reserve(job, disk_bytes)
+        except (JobCancelled, DiskSpaceError):
+            self._release_slot(job)
+            raise
+        
+        job.set_stage("started")
+    
+    def release_slot(self, job: RenameJob) -> None:
+        """Give the job's slot back early, e.g. while it only waits on other jobs"""
+        self._release_slot(job)
+    
+    def release_disk(self, job: RenameJob, keep: int = 0) -> None:
+        """Give back scratch space the job no longer needs, keeping ``keep`` bytes"""
+        self.disk.release(job, keep)
+    
+    def _release_slot(self, job: RenameJob) -> None:
+        if job.has_slot:
+            job.has_slot = False
+            self._slots.release()
+    
+    def cancel(self, job: RenameJob) -> bool:
+        """Fire the job's token, kill its child tasks and free its slot at once"""
+        if job.cancelled:
+            return False
+        
+        job.token.cancel()
+        for task in list(job.tasks):
+            task.cancel()
+        
+        # Transfers notice the token on their next progress tick; the slot
+        # does not have to wait for that
+        self._release_slot(job)
+        logger.info(f"Job {job.job_id} of user {job.user_id} cancelled during {job.stage}")
+        return True
+    
+    def cancel_by_message(self, chat_id: int, message_id: int) -> bool:
+        job = self.find_by_message(chat_id, message_id)
+        return self.cancel(job) if job else False
+    
+    async def finish(self, job: RenameJob, keep_files: bool = False) -> None:
+        """
+        Release the job's slot and delete every temporary file it still owns
+        
+        Args:
+            keep_files (bool): Leave the files for a resumed run (shutdown)
+        """
+        for task in list(job.tasks):
+            task.cancel()
+        
+        self._release_slot(job)
+        self._jobs.pop(job.job_id, None)
+        for key in job.messages:
+            self._by_message.pop(key, None)
+        job.messages.clear()
+        
+        if job.paths and not keep_files:
+            await remove_path(*job.paths)
+        job.paths.clear()
+        self.disk.release(job)
+
+# Global registry instance
+job_registry = JobRegistry(Config.MAX_CONCURRENT_JOBS)
@@ -0,0 +1,65 @@
+# utils/journal.py - Crash-Safe Rename Job Journal
+import uuid
+import logging
+from datetime import datetime
+from typing import List, Dict, Any
+from utils.database import db
+from utils.jobs import RenameJob
+
+logger = logging.getLogger(__name__)
+
+# Stages a journaled job passes through; "done" jobs are dropped from the journal
+JOURNAL_STAGES = ("queued", "downloading", "processing", "uploading", "done")
+
+class JobJournal:
+    """
+    Persists each rename job's stage and artifacts so a restart can resume it
+
+    A job is written when it starts, again when it enters each stage (with
+    the paths and hashes the next stage needs), and deleted when it ends,
+    successfully or not. Entries still present at startup belong to jobs a
+    crash or deploy interrupted. During shutdown the journal is suspended:
+    interrupted jobs keep both their entry and their files.
+    """
+
+    def __init__(self):
+        self.suspended = False
+
+    async def open(self, job: RenameJob, session, upload_format: str, progress_msg) -> None:
+        """Journal a new job (resumed jobs already carry their entry)"""
+        if job.journal_id:
+            return
+        job.journal_id = uuid.uuid4().hex
+        await db.save_job(job.journal_id, {
+            "user_id": session.user_id,
+            "chat_id": session.chat_id,
+            "message_id": session.file_message.id,
+            "new_filename": session.new_filename,
+            "upload_format": upload_format,
+            "progress_message_id": progress_msg.id if progress_msg else None,
+            "stage": "queued",
+            "created": datetime.now()
+        })
+
+    async def record(self, job: RenameJob, stage: str, **artifacts: Any) -> None:
+        """Note that a job reached ``stage``, along with what it produced so far"""
+        if job.journal_id and not self.suspended:
+            await db.save_job(job.journal_id, dict(artifacts, stage=stage))
+
+    async def close(self, job: RenameJob) -> None:
+        """Forget a job that ended, unless the bot is shutting down under it"""
+        if job.journal_id and not self.suspended:
+            await db.delete_job(job.journal_id)
+
+    async def discard(self, journal_id: str) -> None:
+        await db.delete_job(journal_id)
+
+    def suspend(self) -> None:
+        """Stop closing entries: jobs torn down from here on are resumed at next start"""
+        self.suspended = True
+
+    async def unfinished(self) -> List[Dict[str, Any]]:
+        return await db.get_unfinished_jobs()
+
+# Global journal instance
+job_journal = JobJournal()
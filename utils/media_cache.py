@@ -0,0 +1,134 @@
+# utils/media_cache.py - Shared Media Info Cache Keyed by Telegram file_unique_id
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+from Bot.config import Config
+from utils.database import db
+from utils.ffmpeg import ffmpeg_handler
+
+logger = logging.getLogger(__name__)
+
+# Probe fields that survive our stream-copy edits (size/bitrate do not)
+CACHED_FIELDS = (
+    'duration', 'width', 'height', 'fps', 'codec', 'audio_codec',
+    'format', 'has_video', 'has_audio'
+)
+
+# Attributes Telegram already reports for videos/audio
+TELEGRAM_FIELDS = ('duration', 'width', 'height')
+
+class MediaInfoCache:
+    """
+    In-process LRU in front of the Mongo ``media_info`` collection
+
+    Entries are ``{'info': {...}, 'probed': bool}``. Telegram's own
+    attributes populate an entry as a partial record; a full FFprobe run
+    marks it probed, after which every job reuses it instead of probing
+    the same forwarded file again.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._max_entries = max_entries
+
+    def _remember(self, file_unique_id: str, entry: Dict[str, Any]) -> None:
+        self._entries[file_unique_id] = entry
+        self._entries.move_to_end(file_unique_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, file_unique_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Cached entry from memory, falling back to Mongo"""
+        if not file_unique_id:
+            return None
+
+        entry = self._entries.get(file_unique_id)
+        if entry is not None:
+            self._entries.move_to_end(file_unique_id)
+            return entry
+
+        document = await db.get_media_info(file_unique_id)
+        if document:
+            entry = {'info': document.get('info', {}), 'probed': document.get('probed', False)}
+            self._remember(file_unique_id, entry)
+        return entry
+
+    async def update(self, file_unique_id: Optional[str], info: Dict[str, Any],
+                     probed: bool = False) -> None:
+        """
+        Merge (partial) probe results into the cache
+
+        Args:
+            file_unique_id (str): Telegram file_unique_id of the source file
+            info (dict): Media info fields; unknown and empty fields are ignored
+            probed (bool): True when ``info`` comes from a full FFprobe run
+        """
+        if not file_unique_id:
+            return
+
+        fields = {key: value for key, value in info.items() if key in CACHED_FIELDS and value is not None}
+        entry = await self.get(file_unique_id) or {'info': {}, 'probed': False}
+
+        # A full probe is authoritative; partial data only fills gaps before it
+        if entry['probed'] and not probed:
+            return
+        if not probed:
+            fields = {key: value for key, value in fields.items() if key not in entry['info']}
+        if not fields and entry['probed'] == probed:
+            return
+
+        entry = {'info': {**entry['info'], **fields}, 'probed': entry['probed'] or probed}
+        self._remember(file_unique_id, entry)
+        await db.update_media_info(file_unique_id, fields, probed)
+
+    async def lookup(self, file) -> Dict[str, Any]:
+        """
+        Best known media attributes for a Telegram file without probing
+
+        Also records Telegram's attributes as a partial entry.
+
+        Args:
+            file: Pyrogram Video/Audio/Document object
+
+        Returns:
+            Dict of known fields (possibly empty)
+        """
+        telegram = {key: getattr(file, key, 0) for key in TELEGRAM_FIELDS if getattr(file, key, 0)}
+        file_unique_id = getattr(file, 'file_unique_id', None)
+
+        try:
+            await self.update(file_unique_id, telegram)
+            entry = await self.get(file_unique_id)
+        except Exception as e:
+            logger.debug(f"Media cache lookup failed: {e}")
+            entry = None
+
+        if not entry:
+            return telegram
+        if entry['probed']:
+            return {**telegram, **entry['info']}
+        return {**entry['info'], **telegram}
+
+    async def get_info(self, file_unique_id: Optional[str], file_path: str) -> Dict[str, Any]:
+        """
+        Full media info for a downloaded file, probing only on a cache miss
+
+        Args:
+            file_unique_id (str): Telegram file_unique_id of the source file
+            file_path (str): Local copy to probe if needed
+
+        Returns:
+            Dict containing media information (empty if probing failed)
+        """
+        entry = await self.get(file_unique_id)
+        if entry and entry['probed']:
+            logger.debug(f"Media info cache hit for {file_unique_id}")
+            return dict(entry['info'])
+
+        info = await ffmpeg_handler.get_media_info(file_path)
+        if info:
+            await self.update(file_unique_id, info, probed=True)
+        return info
+
+# Global cache instance
+media_cache = MediaInfoCache(Config.MEDIA_CACHE_SIZE)
@@ -0,0 +1,412 @@
+# utils/pdf.py - PDF Metadata Writer (Incremental Update)
+import os
+import re
+import zlib
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Tuple
+from utils.helpers import run_fs
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the end of the file to find startxref
+TAIL_SIZE = 4096
+
+# Bytes read at a time while scanning a classic xref section
+SECTION_CHUNK_SIZE = 64 * 1024
+
+# /Prev links followed while looking up the old Info dictionary
+MAX_XREF_SECTIONS = 32
+
+WHITESPACE = b'\x00\t\n\x0c\r '
+DELIMITERS = b'()<>[]{}/%'
+
+class PDFWriteError(Exception):
+    """Raised when a PDF cannot be updated incrementally"""
+    pass
+
+def is_pdf(file_path: str) -> bool:
+    """Check for the %PDF- header (allowed anywhere in the first 1 KB)"""
+    try:
+        with open(file_path, 'rb') as f:
+            return b'%PDF-' in f.read(1024)
+    except OSError:
+        return False
+
+# Minimal object parser: values are kept as raw bytes so they can be
+# copied verbatim into the update
+
+def _skip_whitespace(data: bytes, pos: int) -> int:
+    while pos < len(data):
+        if data[pos] in WHITESPACE:
+            pos += 1
+        elif data[pos:pos + 1] == b'%':
+            while pos < len(data) and data[pos] not in b'\r\n':
+                pos += 1
+        else:
+            break
+    return pos
+
+def _token_end(data: bytes, pos: int) -> int:
+    while pos < len(data) and data[pos] not in WHITESPACE and data[pos] not in DELIMITERS:
+        pos += 1
+    return pos
+
+def _skip_value(data: bytes, pos: int) -> int:
+    """Return the position just past the object starting at ``pos``"""
+    pos = _skip_whitespace(data, pos)
+    if pos >= len(data):
+        raise PDFWriteError("Unexpected end of PDF object")
+
+    if data.startswith(b'<<', pos):
+        return _parse_dict(data, pos)[1]
+
+    char = data[pos:pos + 1]
+    if char == b'<':
+        end = data.find(b'>', pos)
+        if end < 0:
+            raise PDFWriteError("Unterminated hex string")
+        return end + 1
+
+    if char == b'(':
+        depth = 0
+        while pos < len(data):
+            if data[pos:pos + 1] == b'\\':
+                pos += 2
+                continue
+            if data[pos:pos + 1] == b'(':
+                depth += 1
+            elif data[pos:pos + 1] == b')':
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            pos += 1
+        raise PDFWriteError("Unterminated literal string")
+
+    if char == b'[':
+        pos += 1
+        while True:
+            pos = _skip_whitespace(data, pos)
+            if data[pos:pos + 1] == b']':
+                return pos + 1
+            pos = _skip_value(data, pos)
+
+    if char == b'/':
+        return _token_end(data, pos + 1)
+
+    end = _token_end(data, pos)
+    if end == pos:
+        raise PDFWriteError(f"Unexpected byte {data[pos:pos + 1]!r} in PDF object")
+
+    # "12 0 R" is a single value
+    match = re.compile(rb'\s+\d+\s+R(?![^\x00\t\n\x0c\r ()<>\[\]{}/%])').match(data, end)
+    if data[pos:end].isdigit() and match:
+        return match.end()
+    return end
+
+def _parse_dict(data: bytes, pos: int) -> Tuple[Dict[bytes, bytes], int]:
+    """Parse ``<< ... >>`` at ``pos`` into {name: raw value}"""
+    pos = _skip_whitespace(data, pos)
+    if not data.startswith(b'<<', pos):
+        raise PDFWriteError("Expected a dictionary")
+
+    entries = {}
+    pos += 2
+    while True:
+        pos = _skip_whitespace(data, pos)
+        if data.startswith(b'>>', pos):
+            return entries, pos + 2
+        if data[pos:pos + 1] != b'/':
+            raise PDFWriteError("Expected a name key")
+
+        key_end = _token_end(data, pos + 1)
+        value_start = _skip_whitespace(data, key_end)
+        value_end = _skip_value(data, value_start)
+        entries[data[pos + 1:key_end]] = data[value_start:value_end]
+        pos = value_end
+
+def _ref_number(value: Optional[bytes]) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    match = re.fullmatch(rb'(\d+)\s+(\d+)\s+R', value.strip())
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+def _encode_text(text: str) -> bytes:
+    """Encode a PDF text string: literal if plain ASCII, UTF-16BE hex otherwise"""
+    if all(32 <= ord(c) < 127 for c in text):
+        escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+        return b'(' + escaped.encode('ascii') + b')'
+    return b'<FEFF' + text.encode('utf-16-be').hex().upper().encode('ascii') + b'>'
+
+# Cross-reference lookup
+
+def _find_startxref(f, file_size: int) -> int:
+    f.seek(max(file_size - TAIL_SIZE, 0))
+    tail = f.read()
+    index = tail.rfind(b'startxref')
+    if index < 0:
+        raise PDFWriteError("startxref not found")
+
+    match = re.match(rb'startxref\s+(\d+)', tail[index:])
+    if not match:
+        raise PDFWriteError("Malformed startxref")
+    return int(match.group(1))
+
+def _read_classic_section(f, offset: int) -> Tuple[Dict[int, Tuple[int, int]], Dict[bytes, bytes]]:
+    """Read an ``xref`` table and its trailer: ({obj: (offset, gen)}, trailer)"""
+    f.seek(offset)
+    data = b''
+    while True:
+        chunk = f.read(SECTION_CHUNK_SIZE)
+        data += chunk
+        index = data.find(b'trailer')
+        if index >= 0 and b'>>' in data[index:]:
+            try:
+                trailer, _ = _parse_dict(data, index + len(b'trailer'))
+                break
+            except PDFWriteError:
+                if not chunk:
+                    raise
+        elif not chunk:
+            raise PDFWriteError("Trailer not found")
+
+    tokens = data[:index].split()
+    if not tokens or tokens[0] != b'xref':
+        raise PDFWriteError("Expected an xref table")
+
+    entries = {}
+    pos = 1
+    while pos + 1 < len(tokens):
+        start, count = int(tokens[pos]), int(tokens[pos + 1])
+        pos += 2
+        for i in range(count):
+            obj_offset, gen, kind = tokens[pos:pos + 3]
+            if kind == b'n':
+                entries.setdefault(start + i, (int(obj_offset), int(gen)))
+            pos += 3
+
+    return entries, trailer
+
+def _read_object(f, offset: int, size: int = 8192) -> Tuple[Dict[bytes, bytes], bytes, int]:
+    """Read ``n g obj << ... >>`` at an offset: (dict, raw bytes, end of dict)"""
+    f.seek(offset)
+    data = f.read(size)
+    match = re.match(rb'\s*\d+\s+\d+\s+obj', data)
+    if not match:
+        raise PDFWriteError(f"No object at offset {offset}")
+
+    entries, end = _parse_dict(data, match.end())
+    return entries, data, end
+
+def _png_unpredict(data: bytes, columns: int) -> bytes:
+    """Undo the PNG row predictors used by xref streams"""
+    rows = []
+    previous = bytearray(columns)
+    for pos in range(0, len(data), columns + 1):
+        kind, row = data[pos], bytearray(data[pos + 1:pos + 1 + columns])
+        if kind == 1:
+            for i in range(1, len(row)):
+                row[i] = (row[i] + row[i - 1]) & 0xFF
+        elif kind == 2:
+            for i in range(len(row)):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif kind != 0:
+            raise PDFWriteError(f"Unsupported PNG predictor {kind}")
+        rows.append(bytes(row))
+        previous = row
+    return b''.join(rows)
+
+def _read_xref_stream(f, offset: int) -> Tuple[Dict[int, Tuple[int, int]], Dict[bytes, bytes]]:
+    """Decode a cross-reference stream: ({obj: (offset, gen)}, stream dict)"""
+    entries_dict, data, end = _read_object(f, offset)
+    length = entries_dict.get(b'Length', b'').strip()
+    if not length.isdigit():
+        raise PDFWriteError("Indirect xref stream length")
+
+    match = re.compile(rb'\s*stream\r?\n').match(data, end)
+    if not match:
+        raise PDFWriteError("xref stream body not found")
+    f.seek(offset + match.end())
+    raw = f.read(int(length))
+
+    filters = entries_dict.get(b'Filter', b'')
+    if filters and b'FlateDecode' not in filters:
+        raise PDFWriteError(f"Unsupported xref stream filter {filters!r}")
+    if filters:
+        raw = zlib.decompress(raw)
+
+    widths = [int(w) for w in re.findall(rb'\d+', entries_dict.get(b'W', b''))]
+    if len(widths) != 3:
+        raise PDFWriteError("Malformed /W in xref stream")
+
+    params = entries_dict.get(b'DecodeParms', b'')
+    predictor = re.search(rb'/Predictor\s+(\d+)', params)
+    if predictor and int(predictor.group(1)) >= 10:
+        raw = _png_unpredict(raw, sum(widths))
+
+    size = int(entries_dict.get(b'Size', b'0'))
+    index = [int(n) for n in re.findall(rb'\d+', entries_dict.get(b'Index', b''))] or [0, size]
+
+    entries = {}
+    pos = 0
+    row_size = sum(widths)
+    for start, count in zip(index[::2], index[1::2]):
+        for obj in range(start, start + count):
+            row = raw[pos:pos + row_size]
+            pos += row_size
+            fields = []
+            field_pos = 0
+            for width in widths:
+                fields.append(int.from_bytes(row[field_pos:field_pos + width], 'big') if width else None)
+                field_pos += width
+            kind = 1 if fields[0] is None else fields[0]
+            if kind == 1:
+                entries.setdefault(obj, (fields[1], fields[2] or 0))
+
+    return entries, entries_dict
+
+def _read_section(f, offset: int) -> Tuple[Dict[int, Tuple[int, int]], Dict[bytes, bytes], bool]:
+    f.seek(offset)
+    is_stream = not f.read(16).lstrip().startswith(b'xref')
+    if is_stream:
+        return (*_read_xref_stream(f, offset), True)
+    return (*_read_classic_section(f, offset), False)
+
+def _find_info(f, startxref: int, info_ref: Tuple[int, int]) -> Dict[bytes, bytes]:
+    """Follow /Prev links until the Info object's offset is known, then parse it"""
+    offset = startxref
+    for _ in range(MAX_XREF_SECTIONS):
+        entries, trailer, _ = _read_section(f, offset)
+        if info_ref[0] in entries:
+            return _read_object(f, entries[info_ref[0]][0])[0]
+        prev = trailer.get(b'Prev', b'').strip()
+        if not prev.isdigit():
+            break
+        offset = int(prev)
+    return {}
+
+# Writer
+
+def write_pdf_info(file_path: str, title: Optional[str] = None, author: Optional[str] = None) -> int:
+    """
+    Append an incremental update carrying a new Info dictionary
+
+    The original bytes are never touched: a new Info object, a one-entry
+    cross-reference section (table or stream, matching the file) and a
+    trailer pointing back at the previous section are appended. Existing
+    Info entries (CreationDate, Producer, ...) are carried over.
+
+    Args:
+        file_path (str): PDF file, updated in place
+        title (str): New /Title
+        author (str): New /Author
+
+    Returns:
+        int: Number of bytes appended
+
+    Raises:
+        PDFWriteError: If the file is encrypted or its structure is not understood
+    """
+    file_size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as f:
+        startxref = _find_startxref(f, file_size)
+        _, trailer, uses_stream = _read_section(f, startxref)
+
+        if b'Encrypt' in trailer:
+            raise PDFWriteError("Encrypted PDF")
+        if b'Root' not in trailer or not trailer.get(b'Size', b'').strip().isdigit():
+            raise PDFWriteError("Trailer lacks /Root or /Size")
+
+        size = int(trailer[b'Size'])
+        info_ref = _ref_number(trailer.get(b'Info'))
+        info = {}
+        if info_ref:
+            try:
+                info = _find_info(f, startxref, info_ref)
+            except (PDFWriteError, ValueError, zlib.error) as e:
+                logger.debug(f"Old Info dictionary not readable, starting fresh: {e}")
+
+        f.seek(file_size - 1)
+        needs_newline = f.read(1) not in b'\r\n'
+
+    # Reuse the Info object number so the old one is superseded
+    info_number, info_gen = info_ref or (size, 0)
+    if not info_ref:
+        size += 1
+
+    if title:
+        info[b'Title'] = _encode_text(title)
+    if author:
+        info[b'Author'] = _encode_text(author)
+    info[b'ModDate'] = _encode_text(datetime.now().strftime('D:%Y%m%d%H%M%S'))
+
+    info_dict = b'<<' + b''.join(b'/' + key + b' ' + value + b' ' for key, value in info.items()) + b'>>'
+
+    update = b'\n' if needs_newline else b''
+    info_offset = file_size + len(update)
+    update += b'%d %d obj\n' % (info_number, info_gen) + info_dict + b'\nendobj\n'
+    xref_offset = file_size + len(update)
+
+    carried = b''
+    for key in (b'Root', b'ID'):
+        if key in trailer:
+            carried += b'/' + key + b' ' + trailer[key] + b' '
+
+    if uses_stream:
+        # A stream section needs an object of its own
+        xref_number = size
+        size += 1
+        width = 4 if xref_offset < 1 << 32 else 8
+        rows = b''.join(
+            b'\x01' + offset.to_bytes(width, 'big') + gen.to_bytes(2, 'big')
+            for offset, gen in ((info_offset, info_gen), (xref_offset, 0))
+        )
+        update += (
+            b'%d 0 obj\n<</Type /XRef /Size %d /W [1 %d 2] /Index [%d 1 %d 1] '
+            % (xref_number, size, width, info_number, xref_number)
+            + carried
+            + b'/Info %d %d R /Prev %d /Length %d>>\nstream\n'
+            % (info_number, info_gen, startxref, len(rows))
+            + rows + b'\nendstream\nendobj\n'
+        )
+    else:
+        update += (
+            b'xref\n%d 1\n%010d %05d n\r\n' % (info_number, info_offset, info_gen)
+            + b'trailer\n<</Size %d ' % size + carried
+            + b'/Info %d %d R /Prev %d>>\n' % (info_number, info_gen, startxref)
+        )
+
+    update += b'startxref\n%d\n%%%%EOF\n' % xref_offset
+
+    with open(file_path, 'ab') as f:
+        f.write(update)
+
+    return len(update)
+
+async def write_pdf_metadata(file_path: str, title: Optional[str] = None,
+                             author: Optional[str] = None) -> bool:
+    """
+    Set a PDF's Title/Author without rewriting the file
+
+    Args:
+        file_path (str): PDF file, updated in place
+        title (str): Document title
+        author (str): Document author
+
+    Returns:
+        bool: Success status
+    """
+    if not await run_fs(is_pdf, file_path):
+        return False
+
+    try:
+        appended = await run_fs(write_pdf_info, file_path, title, author)
+        logger.info(f"PDF metadata appended to {file_path} ({appended} bytes)")
+        return True
+    except PDFWriteError as e:
+        logger.warning(f"PDF metadata update not possible for {file_path}: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"PDF metadata update failed for {file_path}: {e}")
+        return False
@@ -0,0 +1,62 @@
+# utils/pipeline.py - Ordered Stage Pipeline for Batch Renames
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Stages a rename passes through, in order
+PIPELINE_STAGES = ("download", "process", "upload")
+
+class PipelineTicket:
+    """
+    One file's place in an ordered pipeline
+
+    Every stage holds a single file at a time and files pass through each
+    stage in submission order, so file N+1 downloads while file N is being
+    processed and file N-1 uploads, and uploads still arrive in order.
+    """
+
+    def __init__(self, index: int, previous: Optional["PipelineTicket"] = None):
+        self.index = index
+        self._previous = previous
+        self._left = {stage: asyncio.Event() for stage in PIPELINE_STAGES}
+        self.stage: Optional[str] = None
+
+    def _leave_before(self, stage: Optional[str]) -> None:
+        """Free every stage earlier than ``stage`` (all of them for None)"""
+        for name in PIPELINE_STAGES:
+            if name == stage:
+                break
+            self._left[name].set()
+
+    async def enter(self, stage: str) -> None:
+        """
+        Move to ``stage``, waiting until the previous file has left it
+
+        Stages a file has no work for are still entered, so skipping one
+        never lets a later file overtake it.
+        """
+        self._leave_before(stage)
+        if self._previous is not None:
+            await self._previous._left[stage].wait()
+        self.stage = stage
+        logger.debug(f"Pipeline item {self.index} -> {stage}")
+
+    def finish(self) -> None:
+        """Leave the pipeline (done, failed or cancelled), unblocking the next file"""
+        self._leave_before(None)
+        self._previous = None
+        self.stage = None
+
+class OrderedPipeline:
+    """Hands out tickets in submission order"""
+
+    def __init__(self):
+        self._last: Optional[PipelineTicket] = None
+        self._count = 0
+
+    def ticket(self) -> PipelineTicket:
+        self._count += 1
+        self._last = PipelineTicket(self._count, self._last)
+        return self._last
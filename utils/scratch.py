@@ -0,0 +1,114 @@
+# utils/scratch.py - Tiered Scratch Storage: Memory Buffers for Small Files, Job Workspaces for Large
+import errno
+import io
+import os
+import logging
+from typing import Optional
+from Bot.config import Config
+from utils.helpers import run_fs
+
+logger = logging.getLogger(__name__)
+
+# Volume (ideally tmpfs/NVMe) holding every job's temporary files
+SCRATCH_DIR = Config.SCRATCH_DIR
+
+# Incomplete downloads, kept across failures and restarts so they can resume
+PARTIAL_DIR = os.path.join(SCRATCH_DIR, "partial")
+
+class MemoryBudget:
+    """
+    Global cap on bytes held in in-memory scratch buffers
+
+    Reservations never wait: a file that does not fit the remaining budget
+    simply takes the disk tier instead.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def try_reserve(self, nbytes: int) -> bool:
+        if nbytes <= 0 or self.used + nbytes > self.limit:
+            return False
+        self.used += nbytes
+        return True
+
+    def release(self, nbytes: int) -> None:
+        self.used = max(self.used - nbytes, 0)
+
+# Global budget instance
+memory_budget = MemoryBudget(Config.MEMORY_BUDGET_MB * 1024 * 1024)
+
+def memory_buffer(file_size: int, name: str) -> Optional[io.BytesIO]:
+    """
+    In-memory scratch file for a small download, or None if it belongs on disk
+
+    The buffer's ``name`` is what Pyrogram uploads it as. Callers must give
+    the reservation back with ``release_buffer`` once it is sent.
+    """
+    if file_size > Config.MEMORY_FILE_THRESHOLD or not memory_budget.try_reserve(file_size):
+        return None
+    buffer = io.BytesIO()
+    buffer.name = name
+    buffer.reserved = file_size
+    return buffer
+
+def release_buffer(buffer: Optional[io.BytesIO]) -> None:
+    if buffer is not None:
+        memory_budget.release(getattr(buffer, 'reserved', 0))
+        buffer.close()
+
+def workspace_path(job) -> str:
+    """Directory job_workspace creates; journaled jobs keep theirs across restarts"""
+    return os.path.join(SCRATCH_DIR, f"job_{job.journal_id or job.job_id}")
+
+async def job_workspace(job) -> str:
+    """
+    Per-job directory on the scratch volume, removed when the job finishes
+
+    Args:
+        job (RenameJob): Job the directory belongs to
+
+    Returns:
+        str: Directory path
+    """
+    path = workspace_path(job)
+    await run_fs(os.makedirs, path, 0o777, True)
+    job.track_path(path)
+    return path
+
+async def partial_path(user_id: int, file_unique_id: str) -> str:
+    """
+    Stable download path for a user's file, outside any job workspace
+
+    The same file sent again by the same user maps to the same path, so a
+    download that failed (or was cut off by a restart) picks up where it
+    stopped instead of starting over.
+
+    Args:
+        user_id (int): Requesting user
+        file_unique_id (str): Telegram's unique ID of the file
+
+    Returns:
+        str: File path inside PARTIAL_DIR
+    """
+    await run_fs(os.makedirs, PARTIAL_DIR, 0o777, True)
+    return os.path.join(PARTIAL_DIR, f"{user_id}_{file_unique_id}")
+
+def preallocate(file_obj, size: int) -> None:
+    """
+    Reserve ``size`` bytes for a file about to be written sequentially
+
+    Allocating up front keeps a large download in few extents and makes a
+    full volume fail at the start instead of halfway through. The writer
+    truncates to what it actually wrote when it is done.
+    """
+    if size <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(file_obj.fileno(), 0, size)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise
+        # Not every filesystem supports it; writing still works without
+        logger.debug(f"Preallocating {size} bytes failed: {e}")
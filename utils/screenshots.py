@@ -0,0 +1,194 @@
+# utils/screenshots.py - Screenshot, Contact Sheet and Sample Clip Engine
+import asyncio
+import os
+import logging
+from typing import List, Optional
+from Bot.config import Config
+from utils.ffmpeg import ffmpeg_handler
+from utils.helpers import run_fs
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+    logger.warning("Pillow not installed. Contact sheets will be unavailable.")
+
+# Telegram rejects thumbnails larger than 320px on either side
+THUMBNAIL_MAX_SIZE = 320
+
+def _format_timestamp(seconds: float) -> str:
+    """Format seconds as HH:MM:SS for sheet labels"""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+def screenshot_offsets(duration: float, count: int) -> List[float]:
+    """Evenly spaced offsets that avoid the very first and last frames"""
+    if duration <= 0 or count <= 0:
+        return []
+    step = duration / (count + 1)
+    return [round(step * (i + 1), 3) for i in range(count)]
+
+async def take_screenshots(video_path: str, output_dir: str, count: int,
+                           duration: Optional[float] = None) -> List[str]:
+    """
+    Grab ``count`` evenly spaced frames concurrently
+    
+    Each frame is a separate keyframe-seeking FFmpeg run, so a frame deep
+    into a long video costs the same as the first one.
+    
+    Args:
+        video_path (str): Input video path
+        output_dir (str): Directory for the JPEG files
+        count (int): Number of screenshots
+        duration (float): Known duration; probed when omitted
+    
+    Returns:
+        List of screenshot paths in timeline order (failed frames skipped)
+    """
+    if duration is None:
+        duration = (await ffmpeg_handler.get_media_info(video_path)).get('duration', 0)
+    
+    offsets = screenshot_offsets(duration, count)
+    if not offsets:
+        return []
+    
+    await run_fs(os.makedirs, output_dir, 0o777, True)
+    base = os.path.splitext(os.path.basename(video_path))[0]
+    semaphore = asyncio.Semaphore(Config.SCREENSHOT_CONCURRENCY)
+    
+    async def grab(index: int, offset: float) -> Optional[str]:
+        output_path = os.path.join(output_dir, f"{base}_shot{index + 1:02d}.jpg")
+        async with semaphore:
+            if await ffmpeg_handler.extract_thumbnail(video_path, output_path, f"{offset:.3f}"):
+                return output_path
+        return None
+    
+    results = await asyncio.gather(*(grab(i, offset) for i, offset in enumerate(offsets)))
+    return [path for path in results if path]
+
+def _build_contact_sheet(image_paths: List[str], output_path: str, columns: int,
+                         labels: List[str], tile_width: int) -> bool:
+    """Blocking Pillow work for build_contact_sheet"""
+    tiles = []
+    for path in image_paths:
+        with Image.open(path) as image:
+            ratio = tile_width / image.width
+            tiles.append(image.convert('RGB').resize((tile_width, max(int(image.height * ratio), 1))))
+    
+    if not tiles:
+        return False
+    
+    padding = 8
+    tile_height = max(tile.height for tile in tiles)
+    rows = (len(tiles) + columns - 1) // columns
+    sheet = Image.new(
+        'RGB',
+        (columns * tile_width + (columns + 1) * padding, rows * tile_height + (rows + 1) * padding),
+        (16, 16, 16)
+    )
+    draw = ImageDraw.Draw(sheet)
+    
+    for index, tile in enumerate(tiles):
+        x = padding + (index % columns) * (tile_width + padding)
+        y = padding + (index // columns) * (tile_height + padding)
+        sheet.paste(tile, (x, y))
+        
+        if index < len(labels):
+            draw.rectangle([x, y, x + 70, y + 16], fill=(0, 0, 0))
+            draw.text((x + 4, y + 2), labels[index], fill=(255, 255, 255))
+        tile.close()
+    
+    sheet.save(output_path, 'JPEG', quality=85)
+    return True
+
+async def build_contact_sheet(image_paths: List[str], output_path: str, columns: int = 3,
+                              labels: Optional[List[str]] = None, tile_width: int = 480) -> bool:
+    """
+    Tile screenshots into a single mosaic image
+    
+    Args:
+        image_paths (list): Screenshot paths in display order
+        output_path (str): Output JPEG path
+        columns (int): Tiles per row
+        labels (list): Optional timestamp label per tile
+        tile_width (int): Width each screenshot is scaled to
+    
+    Returns:
+        bool: Success status
+    """
+    if Image is None or not image_paths:
+        return False
+    
+    try:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, _build_contact_sheet, image_paths, output_path, columns, labels or [], tile_width
+        )
+    except Exception as e:
+        logger.error(f"Contact sheet creation failed: {e}")
+        return False
+
+async def generate_screenshot_set(video_path: str, output_dir: str, count: int,
+                                  with_sheet: bool = True, duration: Optional[float] = None) -> dict:
+    """
+    Produce screenshots plus an optional contact sheet for a video
+    
+    Returns:
+        Dict with 'screenshots' (list of paths) and 'sheet' (path or None)
+    """
+    if not duration:
+        duration = (await ffmpeg_handler.get_media_info(video_path)).get('duration', 0)
+    
+    screenshots = await take_screenshots(video_path, output_dir, count, duration)
+    sheet = None
+    
+    if with_sheet and screenshots:
+        base = os.path.splitext(os.path.basename(video_path))[0]
+        sheet_path = os.path.join(output_dir, f"{base}_sheet.jpg")
+        labels = [_format_timestamp(offset) for offset in screenshot_offsets(duration, count)]
+        columns = 3 if len(screenshots) > 4 else 2
+        
+        # Labels only line up when every frame succeeded
+        if await build_contact_sheet(screenshots, sheet_path, columns,
+                                     labels if len(labels) == len(screenshots) else None):
+            sheet = sheet_path
+    
+    return {'screenshots': screenshots, 'sheet': sheet}
+
+async def create_sample_clip(video_path: str, output_path: str, length: float = 30) -> bool:
+    """
+    Cut a stream-copied sample from the middle of a video
+    
+    Args:
+        video_path (str): Input video path
+        output_path (str): Output clip path
+        length (float): Sample length in seconds
+    
+    Returns:
+        bool: Success status
+    """
+    duration = (await ffmpeg_handler.get_media_info(video_path)).get('duration', 0)
+    if duration <= 0:
+        return False
+    
+    length = min(length, duration)
+    start = max((duration - length) / 2, 0)
+    return await ffmpeg_handler.extract_clip(video_path, output_path, start, length)
+
+async def auto_thumbnail(video_path: str, output_path: str,
+                         duration: Optional[float] = None) -> Optional[str]:
+    """
+    Generate a Telegram-sized thumbnail from a frame 10% into the video
+    
+    Returns:
+        Thumbnail path, or None if no frame could be extracted
+    """
+    if duration is None:
+        duration = (await ffmpeg_handler.get_media_info(video_path)).get('duration', 0)
+    
+    offset = f"{duration * 0.1:.3f}" if duration else "0"
+    if await ffmpeg_handler.extract_thumbnail(video_path, output_path, offset, THUMBNAIL_MAX_SIZE):
+        return output_path
+    return None
@@ -0,0 +1,224 @@
+# utils/splitter.py - Splitting Oversized Files into Uploadable Parts While Downloading
+import asyncio
+import os
+import logging
+from typing import Optional, Callable, Awaitable, AsyncIterator, List
+from pyrogram import Client
+from pyrogram.types import Message
+from utils.ffmpeg import MP4_EXTENSIONS
+from utils.helpers import run_fs, remove_path
+
+logger = logging.getLogger(__name__)
+
+# Containers FFmpeg can demux from a pipe without seeking
+PIPEABLE_EXTENSIONS = ('.mkv', '.webm', '.ts', '.m2ts', '.mts', '.flv')
+
+# Containers parts are cut into; anything else becomes Matroska
+SEGMENT_EXTENSIONS = ('.mkv', '.mp4', '.m4v', '.mov', '.webm', '.ts')
+
+# Segment durations aim below the size limit since keyframes rarely fall exactly on it
+SEGMENT_SIZE_MARGIN = 0.9
+
+# Read size when cutting a file on disk into raw pieces
+COPY_SIZE = 1024 * 1024
+
+def part_name(filename: str, index: int) -> str:
+    """Name of a raw part: movie.mkv -> movie.mkv.001"""
+    return f"{filename}.{index:03d}"
+
+def segment_name(filename: str, index: int, extension: str) -> str:
+    """Name of a playable part: movie.mkv -> movie.part01.mkv"""
+    return f"{os.path.splitext(filename)[0]}.part{index:02d}{extension}"
+
+def segment_extension(filename: str) -> str:
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if extension in SEGMENT_EXTENSIONS else '.mkv'
+
+def segment_seconds(duration: float, file_size: int, part_size: int) -> float:
+    """Part duration that keeps parts under ``part_size`` at the file's average bitrate"""
+    return max(duration * part_size / file_size * SEGMENT_SIZE_MARGIN, 1.0)
+
+def split_file(file_path: str, part_size: int) -> List[str]:
+    """
+    Cut a file on disk into raw pieces of ``part_size`` bytes next to it
+
+    Blocking; run it through run_fs. The original is removed once cut.
+
+    Returns:
+        list: Piece paths (file.001, file.002, ...) in order
+    """
+    pieces = []
+    with open(file_path, 'rb') as src:
+        while True:
+            data = src.read(min(part_size, COPY_SIZE))
+            if not data:
+                break
+            piece_path = part_name(file_path, len(pieces) + 1)
+            with open(piece_path, 'wb') as dst:
+                written = 0
+                while data:
+                    dst.write(data)
+                    written += len(data)
+                    data = src.read(min(part_size - written, COPY_SIZE))
+            pieces.append(piece_path)
+    os.remove(file_path)
+    return pieces
+
+def moov_first(head: bytes) -> bool:
+    """Whether an MP4's top-level boxes put moov before mdat, judged from its first bytes"""
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset:offset + 4], 'big')
+        box_type = head[offset + 4:offset + 8]
+        if box_type == b'moov':
+            return True
+        if box_type == b'mdat':
+            return False
+        if size == 1 and offset + 16 <= len(head):
+            size = int.from_bytes(head[offset + 8:offset + 16], 'big')
+        if size < 8:
+            break
+        offset += size
+    return False
+
+def can_pipe(filename: str, head: bytes) -> bool:
+    """Whether FFmpeg can segment this file from a pipe as it downloads"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in PIPEABLE_EXTENSIONS:
+        return True
+    return extension in MP4_EXTENSIONS and moov_first(head)
+
+class PartUploader:
+    """
+    Uploads finished parts one at a time, in order, while more are produced
+
+    ``max_pending`` bounds how many finished parts may wait on disk; ``put``
+    then blocks, which slows the producer down to the upload speed. After a
+    failed upload remaining parts are deleted instead of sent and the error
+    is raised from ``put``/``close``.
+    """
+
+    def __init__(self, upload: Callable[[str, int], Awaitable[None]], max_pending: int = 0):
+        self._upload = upload
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task = asyncio.create_task(self._worker())
+        self.error: Optional[BaseException] = None
+        self.uploaded = 0
+        self._cleanup: Optional[asyncio.Future] = None
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+
+            path, index = item
+            try:
+                if self.error is None:
+                    await self._upload(path, index)
+                    self.uploaded += 1
+            except Exception as e:
+                logger.error(f"Uploading part {index} failed: {e}")
+                self.error = e
+            finally:
+                await remove_path(path)
+
+    async def put(self, path: str, index: int) -> None:
+        """Queue a finished part for upload"""
+        if self.error:
+            raise self.error
+        await self._queue.put((path, index))
+
+    async def close(self) -> int:
+        """Wait for every queued part to be uploaded; returns the number uploaded"""
+        await self._queue.put(None)
+        await self._task
+        if self.error:
+            raise self.error
+        return self.uploaded
+
+    def cancel(self) -> None:
+        """Stop uploading; queued parts are deleted and blocked producers released"""
+        self._task.cancel()
+        self.error = self.error or asyncio.CancelledError()
+        paths = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item:
+                paths.append(item[0])
+        if paths:
+            # Called synchronously from cleanup code, so delete off the loop in the background
+            self._cleanup = asyncio.ensure_future(remove_path(*paths))
+
+async def stream_chunks(client: Client, message: Message, progress: Optional[Callable] = None,
+                        progress_args: tuple = ()) -> AsyncIterator[bytes]:
+    """Chunks of a message's media as they download, reporting progress"""
+    media = message.document or message.video or message.audio
+    total = getattr(media, 'file_size', 0) or 0
+    received = 0
+
+    async for chunk in client.stream_media(message):
+        received += len(chunk)
+        if progress:
+            await progress(received, total, *progress_args)
+        yield chunk
+
+async def prepend(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Put back a chunk that was read ahead"""
+    yield head
+    async for chunk in chunks:
+        yield chunk
+
+async def write_stream(chunks: AsyncIterator[bytes], file_path: str) -> None:
+    """Write a byte stream to a file"""
+    f = await run_fs(open, file_path, 'wb')
+    try:
+        async for chunk in chunks:
+            await run_fs(f.write, chunk)
+    finally:
+        await run_fs(f.close)
+
+async def split_stream(chunks: AsyncIterator[bytes], output_dir: str, part_size: int,
+                       on_part: Callable[[str, int], Awaitable[None]]) -> int:
+    """
+    Write a byte stream into numbered parts of ``part_size`` bytes
+
+    Each part is handed to ``on_part`` as soon as it is complete, while the
+    stream continues into the next one.
+
+    Returns:
+        int: Number of parts written
+    """
+    index = 0
+    part = None
+    written = 0
+
+    try:
+        async for chunk in chunks:
+            view = memoryview(chunk)
+            while view:
+                if part is None:
+                    index += 1
+                    part_path = os.path.join(output_dir, f"part{index:03d}")
+                    part = await run_fs(open, part_path, 'wb')
+                    written = 0
+
+                piece = view[:part_size - written]
+                view = view[len(piece):]
+                await run_fs(part.write, piece)
+                written += len(piece)
+
+                if written == part_size:
+                    await run_fs(part.close)
+                    part = None
+                    await on_part(part_path, index)
+
+        if part is not None:
+            await run_fs(part.close)
+            part = None
+            await on_part(part_path, index)
+    finally:
+        if part is not None:
+            await run_fs(part.close)
+
+    return index
@@ -0,0 +1,566 @@
+# utils/tags.py - Native In-Place Audio Tag Writer (ID3v2, FLAC, M4A)
+import os
+import shutil
+import struct
+import logging
+from typing import Optional, Dict, List, Tuple
+from utils.helpers import run_fs
+
+logger = logging.getLogger(__name__)
+
+# Padding left behind after a full rewrite so the next edit fits in place
+TAG_PADDING = 4096
+
+# Read size when the audio payload has to be copied
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# ID3v2 header flags the writer cannot preserve (unsynchronisation, extended header, footer)
+ID3_UNSUPPORTED_FLAGS = 0x80 | 0x40 | 0x10
+
+# FLAC metadata block types
+FLAC_PADDING = 1
+FLAC_VORBIS_COMMENT = 4
+FLAC_PICTURE = 6
+
+# MP4 boxes walked to reach the sample tables
+MP4_TABLE_CONTAINERS = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+class TagWriteError(Exception):
+    """Raised when a file's tag layout is not supported by the native writer"""
+    pass
+
+def _is_mpeg_audio_frame(frame: bytes) -> bool:
+    """MPEG-1/2/2.5 audio frame header (MP3 and friends), as opposed to ADTS AAC"""
+    if len(frame) < 3 or frame[0] != 0xFF or frame[1] & 0xE0 != 0xE0:
+        return False
+    version = (frame[1] >> 3) & 0x03
+    layer = (frame[1] >> 1) & 0x03
+    bitrate = frame[2] >> 4
+    sample_rate = (frame[2] >> 2) & 0x03
+    # ADTS shares the sync word but always has layer 00
+    return version != 1 and layer != 0 and bitrate != 0x0F and sample_rate != 0x03
+
+def _is_adts(frame: bytes) -> bool:
+    return len(frame) >= 2 and frame[0] == 0xFF and frame[1] & 0xF6 == 0xF0
+
+def detect_tag_format(file_path: str) -> Optional[str]:
+    """
+    Identify the tag container from the file's magic bytes
+
+    Returns:
+        'id3', 'flac', 'mp4' or None if the native writer cannot handle the file
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(12)
+            if header[:3] == b'ID3' and len(header) >= 10:
+                # Look past the tag at the first audio frame
+                size = 0
+                for byte in header[6:10]:
+                    size = (size << 7) | (byte & 0x7F)
+                f.seek(10 + size + (10 if header[5] & 0x10 else 0))
+                frame = f.read(4)
+            else:
+                frame = header[:4]
+    except OSError:
+        return None
+
+    if header[:4] == b'fLaC':
+        return 'flac'
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    if header[:3] == b'ID3':
+        # FLAC files with a stray ID3 prefix and tagged raw AAC are left to FFmpeg
+        if file_path.lower().endswith('.flac') or _is_adts(frame):
+            return None
+        return 'id3'
+    if _is_mpeg_audio_frame(frame):
+        return 'id3'
+    return None
+
+def _image_mime(image: bytes) -> str:
+    return 'image/png' if image[:8] == b'\x89PNG\r\n\x1a\n' else 'image/jpeg'
+
+def _rewrite(file_path: str, header: bytes, data_offset: int) -> None:
+    """Replace everything before ``data_offset`` with ``header``, copying the rest"""
+    temp_path = f"{file_path}.tagtmp"
+    try:
+        with open(file_path, 'rb') as src, open(temp_path, 'wb') as dst:
+            dst.write(header)
+            src.seek(data_offset)
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _splice(file_path: str, offset: int, old_length: int, data: bytes) -> None:
+    """Replace ``old_length`` bytes at ``offset`` with ``data``, copying the whole file"""
+    temp_path = f"{file_path}.tagtmp"
+    try:
+        with open(file_path, 'rb') as src, open(temp_path, 'wb') as dst:
+            remaining = offset
+            while remaining:
+                chunk = src.read(min(COPY_BUFFER_SIZE, remaining))
+                if not chunk:
+                    break
+                dst.write(chunk)
+                remaining -= len(chunk)
+
+            dst.write(data)
+            src.seek(offset + old_length)
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+# ID3v2 (MP3)
+
+def _syncsafe_to_int(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def _int_to_syncsafe(value: int) -> bytes:
+    return bytes([(value >> 21) & 0x7F, (value >> 14) & 0x7F, (value >> 7) & 0x7F, value & 0x7F])
+
+def _id3_frames(body: bytes, version: int) -> List[Tuple[str, bytes]]:
+    """Split a tag body into (frame_id, raw frame) pairs, stopping at padding"""
+    frames = []
+    pos = 0
+
+    while pos + 10 <= len(body) and body[pos] != 0:
+        size_bytes = body[pos + 4:pos + 8]
+        size = _syncsafe_to_int(size_bytes) if version == 4 else struct.unpack('>I', size_bytes)[0]
+        end = pos + 10 + size
+        if end > len(body):
+            raise TagWriteError("Truncated ID3 frame")
+
+        frames.append((body[pos:pos + 4].decode('latin-1'), body[pos:end]))
+        pos = end
+
+    return frames
+
+def _id3_frame(frame_id: str, payload: bytes, version: int) -> bytes:
+    size = _int_to_syncsafe(len(payload)) if version == 4 else struct.pack('>I', len(payload))
+    return frame_id.encode('latin-1') + size + b'\x00\x00' + payload
+
+def _id3_text_frame(frame_id: str, text: str, version: int) -> bytes:
+    # ID3v2.3 has no UTF-8; UTF-16 with BOM is the portable choice there
+    if version == 4:
+        payload = b'\x03' + text.encode('utf-8')
+    else:
+        payload = b'\x01' + text.encode('utf-16')
+    return _id3_frame(frame_id, payload, version)
+
+def _id3_picture_frame(image: bytes, version: int) -> bytes:
+    # Latin-1 description, picture type 3 (front cover), empty description
+    payload = b'\x00' + _image_mime(image).encode('latin-1') + b'\x00' + b'\x03' + b'\x00' + image
+    return _id3_frame('APIC', payload, version)
+
+def write_id3(file_path: str, fields: Dict[str, str], cover: Optional[bytes] = None) -> bool:
+    """
+    Write ID3v2 text frames (and an APIC cover) at the start of an MP3
+
+    Args:
+        file_path (str): MP3 file
+        fields (dict): Frame id to text, e.g. {'TIT2': 'Title', 'TPE1': 'Artist'}
+        cover (bytes): Optional JPEG/PNG cover art
+
+    Returns:
+        bool: True if the tag fit in the existing padding, False if the file was rewritten
+    """
+    with open(file_path, 'rb') as f:
+        header = f.read(10)
+        if header[:3] == b'ID3':
+            version, flags = header[3], header[5]
+            if version not in (3, 4) or flags & ID3_UNSUPPORTED_FLAGS:
+                raise TagWriteError(f"Unsupported ID3v2.{version} tag layout")
+            old_size = _syncsafe_to_int(header[6:10])
+            frames = _id3_frames(f.read(old_size), version)
+        else:
+            version, flags, old_size, frames = 3, 0, 0, []
+
+    replaced = set(fields)
+    if cover:
+        replaced.add('APIC')
+
+    body = b''.join(raw for frame_id, raw in frames if frame_id not in replaced)
+    for frame_id, text in fields.items():
+        body += _id3_text_frame(frame_id, text, version)
+    if cover:
+        body += _id3_picture_frame(cover, version)
+
+    if old_size and len(body) <= old_size:
+        with open(file_path, 'r+b') as f:
+            f.write(b'ID3' + bytes([version, 0, flags]) + _int_to_syncsafe(old_size))
+            f.write(body + b'\x00' * (old_size - len(body)))
+        return True
+
+    new_size = len(body) + TAG_PADDING
+    tag = b'ID3' + bytes([version, 0, flags]) + _int_to_syncsafe(new_size) + body + b'\x00' * TAG_PADDING
+    _rewrite(file_path, tag, 10 + old_size if old_size else 0)
+    return False
+
+# FLAC
+
+def _vorbis_comment(data: bytes, fields: Dict[str, str]) -> bytes:
+    """Rebuild a VORBIS_COMMENT block body with ``fields`` replaced"""
+    vendor = b'Dazai Rename Bot'
+    comments = []
+
+    if data:
+        pos = 4 + struct.unpack('<I', data[:4])[0]
+        vendor = data[4:pos]
+        count = struct.unpack('<I', data[pos:pos + 4])[0]
+        pos += 4
+        for _ in range(count):
+            length = struct.unpack('<I', data[pos:pos + 4])[0]
+            comments.append(data[pos + 4:pos + 4 + length])
+            pos += 4 + length
+
+    keys = {key.upper() for key in fields}
+    comments = [c for c in comments if c.split(b'=', 1)[0].decode('ascii', 'replace').upper() not in keys]
+    comments.extend(f"{key}={value}".encode('utf-8') for key, value in fields.items())
+
+    out = struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(comments))
+    for comment in comments:
+        out += struct.pack('<I', len(comment)) + comment
+    return out
+
+def _flac_picture(image: bytes) -> bytes:
+    mime = _image_mime(image).encode('ascii')
+    # Type 3 (front cover); dimensions/depth left at 0, which readers take from the image
+    return (struct.pack('>II', 3, len(mime)) + mime + struct.pack('>I', 0)
+            + struct.pack('>IIII', 0, 0, 0, 0) + struct.pack('>I', len(image)) + image)
+
+def _flac_block(block_type: int, data: bytes, last: bool) -> bytes:
+    if len(data) >= 1 << 24:
+        raise TagWriteError("FLAC metadata block too large")
+    return bytes([block_type | (0x80 if last else 0)]) + len(data).to_bytes(3, 'big') + data
+
+def write_flac(file_path: str, fields: Dict[str, str], cover: Optional[bytes] = None) -> bool:
+    """
+    Update the VORBIS_COMMENT block (and front-cover PICTURE) of a FLAC file
+
+    Args:
+        file_path (str): FLAC file
+        fields (dict): Vorbis comment keys to values, e.g. {'TITLE': ..., 'ARTIST': ...}
+        cover (bytes): Optional JPEG/PNG cover art
+
+    Returns:
+        bool: True if the blocks fit in the existing metadata region, False if rewritten
+    """
+    blocks = []
+    with open(file_path, 'rb') as f:
+        if f.read(4) != b'fLaC':
+            raise TagWriteError("Not a FLAC file")
+
+        while True:
+            header = f.read(4)
+            if len(header) < 4:
+                raise TagWriteError("Truncated FLAC metadata")
+            block_type = header[0] & 0x7F
+            length = int.from_bytes(header[1:4], 'big')
+
+            if block_type == FLAC_PADDING:
+                f.seek(length, os.SEEK_CUR)
+                data = b''
+            else:
+                data = f.read(length)
+                if len(data) < length:
+                    raise TagWriteError("Truncated FLAC metadata")
+            blocks.append((block_type, data))
+
+            if header[0] & 0x80:
+                break
+        audio_offset = f.tell()
+
+    new_blocks = []
+    comment_written = False
+    for block_type, data in blocks:
+        if block_type == FLAC_PADDING:
+            continue
+        if block_type == FLAC_PICTURE and cover and struct.unpack('>I', data[:4])[0] == 3:
+            continue
+        if block_type == FLAC_VORBIS_COMMENT:
+            data = _vorbis_comment(data, fields)
+            comment_written = True
+        new_blocks.append((block_type, data))
+
+    # STREAMINFO must stay first
+    if not comment_written:
+        new_blocks.insert(1, (FLAC_VORBIS_COMMENT, _vorbis_comment(b'', fields)))
+    if cover:
+        new_blocks.append((FLAC_PICTURE, _flac_picture(cover)))
+
+    available = audio_offset - 4
+    needed = sum(4 + len(data) for _, data in new_blocks)
+
+    if needed == available:
+        padding = None
+    elif needed + 4 <= available:
+        padding = available - needed - 4
+    else:
+        padding = TAG_PADDING
+
+    metadata = b''
+    for index, (block_type, data) in enumerate(new_blocks):
+        metadata += _flac_block(block_type, data, padding is None and index == len(new_blocks) - 1)
+    if padding is not None:
+        metadata += _flac_block(FLAC_PADDING, b'\x00' * padding, True)
+
+    if len(metadata) == available:
+        with open(file_path, 'r+b') as f:
+            f.seek(4)
+            f.write(metadata)
+        return True
+
+    _rewrite(file_path, b'fLaC' + metadata, audio_offset)
+    return False
+
+# MP4 / M4A
+
+def _mp4_atom(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I4s', len(payload) + 8, kind) + payload
+
+def _mp4_children(payload: bytes) -> List[Tuple[bytes, bytes]]:
+    """Split a container payload into (kind, full atom) pairs"""
+    children = []
+    pos = 0
+
+    while pos + 8 <= len(payload):
+        size, kind = struct.unpack('>I4s', payload[pos:pos + 8])
+        if size == 1:
+            size = struct.unpack('>Q', payload[pos + 8:pos + 16])[0]
+        elif size == 0:
+            size = len(payload) - pos
+        if size < 8 or pos + size > len(payload):
+            raise TagWriteError(f"Corrupt MP4 atom {kind!r}")
+
+        children.append((kind, payload[pos:pos + size]))
+        pos += size
+
+    return children
+
+def _mp4_payload(atom: bytes) -> bytes:
+    return atom[16:] if struct.unpack('>I', atom[:4])[0] == 1 else atom[8:]
+
+def _mp4_replace_child(payload: bytes, kind: bytes, atom: bytes) -> bytes:
+    """Replace the first child of ``kind`` (or append one) in a container payload"""
+    children = _mp4_children(payload)
+    for index, (child_kind, _) in enumerate(children):
+        if child_kind == kind:
+            children[index] = (kind, atom)
+            break
+    else:
+        children.append((kind, atom))
+    return b''.join(raw for _, raw in children)
+
+def _mp4_find_child(payload: bytes, kind: bytes) -> Optional[bytes]:
+    for child_kind, raw in _mp4_children(payload):
+        if child_kind == kind:
+            return _mp4_payload(raw)
+    return None
+
+def _mp4_item(kind: bytes, data_type: int, value: bytes) -> bytes:
+    return _mp4_atom(kind, _mp4_atom(b'data', struct.pack('>II', data_type, 0) + value))
+
+def _mp4_set_ilst(moov_payload: bytes, items: Dict[bytes, bytes]) -> bytes:
+    """Return a moov payload whose udta/meta/ilst carries ``items``"""
+    udta = _mp4_find_child(moov_payload, b'udta') or b''
+    meta = _mp4_find_child(udta, b'meta')
+
+    if meta is None:
+        version_flags = b'\x00' * 4
+        hdlr = b'\x00' * 8 + b'mdirappl' + b'\x00' * 9
+        meta_children = _mp4_atom(b'hdlr', hdlr)
+    else:
+        # QuickTime-style meta boxes lack the version/flags field
+        if meta[4:8] == b'hdlr':
+            raise TagWriteError("QuickTime-style meta atom")
+        version_flags, meta_children = meta[:4], meta[4:]
+
+    ilst = _mp4_find_child(meta_children, b'ilst') or b''
+    kept = [raw for kind, raw in _mp4_children(ilst) if kind not in items]
+    ilst = b''.join(kept) + b''.join(items.values())
+
+    # Padding inside meta is folded into the top-level free atom instead
+    meta_children = b''.join(raw for kind, raw in _mp4_children(meta_children) if kind != b'free')
+    meta_children = _mp4_replace_child(meta_children, b'ilst', _mp4_atom(b'ilst', ilst))
+
+    udta = _mp4_replace_child(udta, b'meta', _mp4_atom(b'meta', version_flags + meta_children))
+    return _mp4_replace_child(moov_payload, b'udta', _mp4_atom(b'udta', udta))
+
+def _mp4_patch_chunk_offsets(moov: bytearray, start: int, end: int, after: int, shift: int) -> None:
+    """Shift every stco/co64 entry pointing at or past ``after`` by ``shift`` bytes"""
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack('>I4s', moov[pos:pos + 8])
+        if size < 8:
+            raise TagWriteError("Corrupt MP4 sample table")
+
+        if kind in MP4_TABLE_CONTAINERS:
+            _mp4_patch_chunk_offsets(moov, pos + 8, pos + size, after, shift)
+        elif kind in (b'stco', b'co64'):
+            count = struct.unpack('>I', moov[pos + 12:pos + 16])[0]
+            entry_format, entry_size = ('>I', 4) if kind == b'stco' else ('>Q', 8)
+            limit = 0xFFFFFFFF if kind == b'stco' else 0xFFFFFFFFFFFFFFFF
+
+            for i in range(count):
+                entry = pos + 16 + i * entry_size
+                offset = struct.unpack(entry_format, moov[entry:entry + entry_size])[0]
+                if offset >= after:
+                    offset += shift
+                    if offset > limit:
+                        raise TagWriteError("Chunk offset overflow in stco")
+                    moov[entry:entry + entry_size] = struct.pack(entry_format, offset)
+
+        pos += size
+
+def _mp4_top_level(file_path: str) -> List[Tuple[bytes, int, int]]:
+    """List top-level atoms as (kind, offset, size)"""
+    atoms = []
+    file_size = os.path.getsize(file_path)
+
+    with open(file_path, 'rb') as f:
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            size, kind = struct.unpack('>I4s', header[:8])
+            if size == 1:
+                size = struct.unpack('>Q', header[8:16])[0]
+            elif size == 0:
+                size = file_size - pos
+            if size < 8 or pos + size > file_size:
+                raise TagWriteError(f"Corrupt top-level atom {kind!r}")
+
+            atoms.append((kind, pos, size))
+            pos += size
+
+    return atoms
+
+def write_mp4(file_path: str, fields: Dict[bytes, str], cover: Optional[bytes] = None) -> bool:
+    """
+    Write iTunes-style ilst items (and cover art) into an MP4/M4A file
+
+    The new moov is written in place when it fits in the old moov plus any
+    free atoms right after it. Otherwise a moov at the end of the file is
+    rewritten on its own, and a moov in front of the media data is
+    rewritten with fresh padding and its chunk offsets shifted.
+
+    Args:
+        file_path (str): MP4/M4A file
+        fields (dict): ilst item atom to text, e.g. {b'\\xa9nam': 'Title'}
+        cover (bytes): Optional JPEG/PNG cover art
+
+    Returns:
+        bool: True if written in place, False if part of the file was rewritten
+    """
+    atoms = _mp4_top_level(file_path)
+    kinds = [kind for kind, _, _ in atoms]
+    if b'moov' not in kinds or b'moof' in kinds:
+        raise TagWriteError("Missing moov or fragmented MP4")
+
+    index = kinds.index(b'moov')
+    _, moov_offset, moov_size = atoms[index]
+
+    # Free atoms right behind moov are usable padding
+    region_size = moov_size
+    for kind, _, size in atoms[index + 1:]:
+        if kind not in (b'free', b'skip'):
+            break
+        region_size += size
+    region_end = moov_offset + region_size
+
+    with open(file_path, 'rb') as f:
+        f.seek(moov_offset)
+        moov = f.read(moov_size)
+
+    items = {kind: _mp4_item(kind, 1, text.encode('utf-8')) for kind, text in fields.items()}
+    if cover:
+        items[b'covr'] = _mp4_item(b'covr', 14 if _image_mime(cover) == 'image/png' else 13, cover)
+    new_moov = _mp4_atom(b'moov', _mp4_set_ilst(_mp4_payload(moov), items))
+
+    if len(new_moov) == region_size or len(new_moov) + 8 <= region_size:
+        padding = region_size - len(new_moov)
+        with open(file_path, 'r+b') as f:
+            f.seek(moov_offset)
+            f.write(new_moov + (_mp4_atom(b'free', b'\x00' * (padding - 8)) if padding else b''))
+        return True
+
+    region = bytearray(new_moov + _mp4_atom(b'free', b'\x00' * TAG_PADDING))
+
+    if not any(kind == b'mdat' and offset > moov_offset for kind, offset, _ in atoms):
+        # moov trails the media: nothing it points at moves
+        with open(file_path, 'r+b') as f:
+            f.seek(region_end)
+            tail = f.read()
+            f.seek(moov_offset)
+            f.write(bytes(region) + tail)
+            f.truncate()
+        return False
+
+    _mp4_patch_chunk_offsets(region, 8, len(new_moov), region_end, len(region) - region_size)
+    _splice(file_path, moov_offset, region_size, bytes(region))
+    return False
+
+def write_tags(file_path: str, title: Optional[str] = None, artist: Optional[str] = None,
+               cover_path: Optional[str] = None) -> bool:
+    """
+    Blocking tag write for any supported format
+
+    Returns:
+        bool: True if written in place, False if the header region was rewritten
+
+    Raises:
+        TagWriteError: If the format or tag layout is not supported
+    """
+    tag_format = detect_tag_format(file_path)
+    if tag_format is None:
+        raise TagWriteError("Unsupported audio container")
+
+    cover = None
+    if cover_path and os.path.exists(cover_path):
+        with open(cover_path, 'rb') as f:
+            cover = f.read()
+
+    if tag_format == 'id3':
+        fields = {'TIT2': title, 'TPE1': artist}
+        return write_id3(file_path, {k: v for k, v in fields.items() if v}, cover)
+    if tag_format == 'flac':
+        fields = {'TITLE': title, 'ARTIST': artist}
+        return write_flac(file_path, {k: v for k, v in fields.items() if v}, cover)
+
+    fields = {b'\xa9nam': title, b'\xa9ART': artist}
+    return write_mp4(file_path, {k: v for k, v in fields.items() if v}, cover)
+
+async def write_audio_tags(file_path: str, title: Optional[str] = None, artist: Optional[str] = None,
+                           cover_path: Optional[str] = None) -> bool:
+    """
+    Write title/artist tags and cover art without an FFmpeg remux
+
+    Args:
+        file_path (str): MP3, FLAC or M4A file, modified in place
+        title (str): Title tag
+        artist (str): Artist/author tag
+        cover_path (str): Optional JPEG/PNG to embed as front cover
+
+    Returns:
+        bool: Success status; False means the caller should fall back to FFmpeg
+    """
+    if await run_fs(detect_tag_format, file_path) is None:
+        return False
+
+    try:
+        in_place = await run_fs(write_tags, file_path, title, artist, cover_path)
+        logger.info(f"Tags written to {file_path} ({'in place' if in_place else 'header rewritten'})")
+        return True
+    except TagWriteError as e:
+        logger.warning(f"Native tag write not possible for {file_path}: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Tag write failed for {file_path}: {e}")
+        return False
@@ -0,0 +1,297 @@
+# utils/transcode.py - Segment-Parallel Video Transcoding
+import asyncio
+import csv
+import os
+import signal
+import subprocess
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, List, Tuple
+from Bot.config import Config
+from utils.ffmpeg import (
+    ffmpeg_handler, ProgressCallback, MP4_EXTENSIONS, _limit_child_resources, _write_concat_list,
+    _UsageSampler
+)
+from utils.helpers import run_fs, path_exists, remove_path
+
+logger = logging.getLogger(__name__)
+
+# Encoder settings per target codec
+VIDEO_CODECS = {
+    'h264': {'encoder': 'libx264', 'crf': 23, 'tag': None},
+    'hevc': {'encoder': 'libx265', 'crf': 28, 'tag': 'hvc1'}
+}
+
+# Audio in the final mux; AAC sources are copied as-is
+AUDIO_BITRATE_KBPS = 128
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def get_worker_count() -> int:
+    return Config.TRANSCODE_WORKERS or os.cpu_count() or 1
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Lazily start the shared encoder process pool"""
+    global _pool
+    if _pool is None:
+        # Forking the bot would copy its event loop, sockets and threads
+        # into every worker; start them from a clean interpreter instead
+        method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        _pool = ProcessPoolExecutor(
+            max_workers=get_worker_count(),
+            mp_context=multiprocessing.get_context(method)
+        )
+    return _pool
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _encode_segment(cmd: List[str], pid_file: str, timeout: Optional[float]) -> Tuple[bool, str]:
+    """
+    Pool worker: run one segment encode
+    
+    The FFmpeg child gets the same sandbox as DazaiFFmpeg._run. Its pid is
+    written next to the segment so the event loop side can kill it if the
+    job is cancelled while the worker is busy.
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        preexec_fn=_limit_child_resources,
+        start_new_session=True
+    )
+    
+    with open(pid_file, 'w') as f:
+        f.write(str(process.pid))
+    
+    # Poll so the memory limit is enforced on RSS while the encode runs
+    sampler = _UsageSampler(process.pid)
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while True:
+            try:
+                _, stderr = process.communicate(timeout=_UsageSampler.INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                sampler.sample()
+                if sampler.over_memory:
+                    process.communicate()
+                    return False, f"Segment encode went over {Config.FFMPEG_MAX_MEMORY_MB} MB of memory"
+                if deadline and time.monotonic() > deadline:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    process.communicate()
+                    return False, "Segment encode timed out"
+    finally:
+        try:
+            os.remove(pid_file)
+        except OSError:
+            pass
+    
+    tail = stderr.decode(errors='replace').strip().splitlines()[-5:]
+    return process.returncode == 0, '\n'.join(tail)
+
+def _kill_workers(workdir: str) -> None:
+    """Kill every segment encoder that is still running for a workdir"""
+    for name in os.listdir(workdir):
+        if not name.endswith('.pid'):
+            continue
+        try:
+            with open(os.path.join(workdir, name)) as f:
+                os.killpg(int(f.read().strip()), signal.SIGKILL)
+        except (OSError, ValueError):
+            pass
+
+def _read_segment_list(list_path: str) -> List[Tuple[str, float]]:
+    """Parse the segment muxer's CSV list into (filename, duration) pairs"""
+    segments = []
+    with open(list_path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) >= 3:
+                segments.append((row[0], max(float(row[2]) - float(row[1]), 0)))
+    return segments
+
+def video_bitrate_for_size(target_bytes: int, duration: float, audio_kbps: int) -> int:
+    """Video bitrate in kbps that lands the output near ``target_bytes``"""
+    total_kbps = target_bytes * 8 / 1000 / duration
+    # Leave ~3% for container overhead
+    return max(int(total_kbps * 0.97) - audio_kbps, 100)
+
+async def transcode_video(input_file: str, output_file: str, codec: str = 'h264',
+                          target_size: Optional[int] = None,
+                          media_info: Optional[Dict[str, Any]] = None,
+                          progress: Optional[ProgressCallback] = None) -> bool:
+    """
+    Re-encode a video by splitting it at keyframes and encoding the pieces in parallel
+    
+    1. The video stream is stream-copied into segments with the segment
+       muxer, which only cuts at keyframes.
+    2. Segments are encoded concurrently in a process pool, one FFmpeg
+       per worker.
+    3. The encoded segments are joined losslessly with the concat demuxer
+       and muxed with the original audio (and subtitles for MKV).
+    
+    Args:
+        input_file (str): Source video
+        output_file (str): Destination (.mp4 or .mkv)
+        codec (str): 'h264' or 'hevc'
+        target_size (int): Optional output size in bytes; CRF is used otherwise
+        media_info (dict): Result of get_media_info if already probed
+        progress (callable): Async callback receiving (done_seconds, total_seconds)
+    
+    Returns:
+        bool: Success status
+    """
+    if not ffmpeg_handler.is_available() or codec not in VIDEO_CODECS:
+        return False
+    
+    info = media_info or await ffmpeg_handler.get_media_info(input_file)
+    duration = info.get('duration', 0)
+    if not info.get('has_video') or duration <= 0:
+        logger.error(f"Cannot transcode {input_file}: no video stream or unknown duration")
+        return False
+    
+    settings = VIDEO_CODECS[codec]
+    workers = get_worker_count()
+    workdir = f"{output_file}.segments"
+    await run_fs(os.makedirs, workdir, 0o777, True)
+    
+    try:
+        # 1. Keyframe-aligned split; two segments per worker keeps the pool busy
+        segment_time = max(duration / (workers * 2), Config.TRANSCODE_MIN_SEGMENT)
+        list_path = os.path.join(workdir, 'segments.csv')
+        split = await ffmpeg_handler._run([
+            ffmpeg_handler.ffmpeg_path,
+            '-i', input_file,
+            '-map', '0:v:0',
+            '-c', 'copy',
+            '-f', 'segment',
+            '-segment_time', f'{segment_time:.3f}',
+            '-segment_list', list_path,
+            '-segment_list_type', 'csv',
+            '-reset_timestamps', '1',
+            '-y', os.path.join(workdir, 'src_%05d.mkv')
+        ], Config.FFMPEG_TIMEOUT)
+        
+        if not split.ok:
+            logger.error(f"Segment split failed: {split.stderr.decode(errors='replace')}")
+            return False
+        
+        segments = await run_fs(_read_segment_list, list_path)
+        if not segments:
+            return False
+        
+        # 2. Parallel encode
+        rate_args = ['-crf', str(settings['crf'])]
+        if target_size:
+            video_kbps = video_bitrate_for_size(target_size, duration, AUDIO_BITRATE_KBPS)
+            rate_args = ['-b:v', f'{video_kbps}k', '-maxrate', f'{int(video_kbps * 1.5)}k',
+                         '-bufsize', f'{video_kbps * 2}k']
+        
+        threads = max((os.cpu_count() or 1) // workers, 1)
+        loop = asyncio.get_event_loop()
+        pool = _get_pool()
+        done_seconds = 0.0
+        encoded = []
+        
+        async def encode(name: str, seconds: float) -> None:
+            nonlocal done_seconds
+            source = os.path.join(workdir, name)
+            target = os.path.join(workdir, f"enc_{name}")
+            cmd = [
+                ffmpeg_handler.ffmpeg_path, '-v', 'error',
+                '-i', source,
+                '-c:v', settings['encoder'],
+                '-preset', Config.TRANSCODE_PRESET,
+                '-threads', str(threads),
+                *rate_args,
+                '-pix_fmt', 'yuv420p',
+                '-an', '-sn',
+                '-y', target
+            ]
+            
+            ok, error = await loop.run_in_executor(
+                pool, _encode_segment, cmd, f"{target}.pid", Config.FFMPEG_TIMEOUT
+            )
+            if not ok:
+                raise RuntimeError(f"Segment {name} failed: {error}")
+            
+            done_seconds += seconds
+            if progress:
+                # The final mux is quick; keep the last few percent for it
+                await progress(done_seconds * 0.95, duration)
+        
+        for name, _ in segments:
+            encoded.append(f"enc_{name}")
+        
+        tasks = [asyncio.ensure_future(encode(name, seconds)) for name, seconds in segments]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Drop segments still queued in the pool
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        # 3. Lossless concat + original audio/subtitles
+        concat_path = os.path.join(workdir, 'concat.txt')
+        await run_fs(_write_concat_list, concat_path, [os.path.join(workdir, name) for name in encoded])
+        
+        # Decide per track: -map 1:a? takes every audio stream, and only
+        # the AAC ones can be copied as-is
+        probe = await ffmpeg_handler._probe(input_file)
+        audio_codecs = [
+            stream.get('codec_name') for stream in probe.get('streams', [])
+            if stream.get('codec_type') == 'audio'
+        ]
+        is_mp4 = os.path.splitext(output_file)[1].lower() in MP4_EXTENSIONS
+        cmd = [
+            ffmpeg_handler.ffmpeg_path,
+            '-f', 'concat', '-safe', '0', '-i', concat_path,
+            '-i', input_file,
+            '-map', '0:v:0',
+            '-map', '1:a?',
+            '-c:v', 'copy'
+        ]
+        cmd.extend(['-c:a', 'aac', '-b:a', f'{AUDIO_BITRATE_KBPS}k'])
+        for index, audio_codec in enumerate(audio_codecs):
+            if audio_codec == 'aac':
+                cmd.extend([f'-c:a:{index}', 'copy'])
+        
+        if is_mp4:
+            if settings['tag']:
+                cmd.extend(['-tag:v', settings['tag']])
+            cmd.extend(['-movflags', '+faststart'])
+        else:
+            cmd.extend(['-map', '1:s?', '-c:s', 'copy'])
+        
+        cmd.extend(['-y', output_file])
+        mux = await ffmpeg_handler._run(cmd, Config.FFMPEG_TIMEOUT)
+        
+        if not mux.ok:
+            logger.error(f"Segment concat failed: {mux.stderr.decode(errors='replace')}")
+            return False
+        
+        if progress:
+            await progress(duration, duration)
+        
+        return await path_exists(output_file)
+    
+    except asyncio.CancelledError:
+        await run_fs(_kill_workers, workdir)
+        await remove_path(output_file)
+        raise
+    
+    except Exception as e:
+        logger.error(f"Transcode failed: {e}")
+        await run_fs(_kill_workers, workdir)
+        return False
+    
+    finally:
+        await remove_path(workdir)
@@ -0,0 +1,425 @@
+# utils/transfer.py - Resumable Streaming Downloads with Incremental Hashing
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import zlib
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Iterable, List, Tuple, Callable, Union, BinaryIO
+from pyrogram import Client, StopTransmission
+from pyrogram.errors import FloodWait
+from pyrogram.types import Message
+from Bot.config import Config
+from utils.captions import compile_caption, CaptionError
+from utils.helpers import humanbytes, run_fs
+from utils.scratch import preallocate
+
+logger = logging.getLogger(__name__)
+
+# Digests offered as caption variables
+HASH_ALGORITHMS = ('md5', 'sha1', 'sha256', 'crc32')
+
+# Chunks handed to the hashing thread before the download waits for it
+MAX_PENDING_CHUNKS = 8
+
+# Read size when hashing a file already on disk
+HASH_READ_SIZE = 1024 * 1024
+
+# Pyrogram streams media in chunks of this size; its offset and limit count chunks
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Chunks written between saves of a resumable download's bitmap
+BITMAP_SAVE_INTERVAL = 16
+
+# Suffix of the bitmap sidecar next to a partial download
+PARTS_SUFFIX = ".parts"
+
+def caption_hash_algorithms(template: Optional[str]) -> List[str]:
+    """Hash algorithms a caption template actually uses"""
+    if not template:
+        return []
+    try:
+        used = compile_caption(template).variables
+    except CaptionError:
+        return []
+    return [name for name in HASH_ALGORITHMS if name in used]
+
+class ChunkHasher:
+    """Feeds each chunk to every requested digest, writing it to ``file_obj`` if given"""
+
+    def __init__(self, file_obj, algorithms: Iterable[str]):
+        self.file = file_obj
+        self._hashes = {name: hashlib.new(name) for name in algorithms if name != 'crc32'}
+        self._crc = 0 if 'crc32' in algorithms else None
+
+    def consume(self, chunk: bytes) -> None:
+        # hashlib releases the GIL on large buffers, so this overlaps with the network
+        if self.file is not None:
+            self.file.write(chunk)
+        for digest in self._hashes.values():
+            digest.update(chunk)
+        if self._crc is not None:
+            self._crc = zlib.crc32(chunk, self._crc)
+
+    def digests(self) -> Dict[str, str]:
+        result = {name: digest.hexdigest() for name, digest in self._hashes.items()}
+        if self._crc is not None:
+            result['crc32'] = f"{self._crc:08X}"
+        return result
+
+class DownloadError(Exception):
+    """Raised when a download cannot be completed after retrying"""
+    pass
+
+def parts_path(file_path: str) -> str:
+    """Sidecar holding the chunk bitmap of a resumable download"""
+    return file_path + PARTS_SUFFIX
+
+class ChunkMap:
+    """
+    Which fixed-size chunks of a transfer are done, persisted next to the file
+
+    Downloads track STREAM_CHUNK_SIZE chunks written to disk; uploads track
+    parts Telegram acknowledged. The bitmap (plus a small ``meta`` dict) is
+    saved every BITMAP_SAVE_INTERVAL chunks and whenever a transfer stops,
+    written to a temporary file and renamed into place so a crash never
+    leaves it half written. Chunks are only marked once done, so a saved
+    bitmap never claims work that did not happen.
+    """
+
+    def __init__(self, file_path: str, total: int, chunk_size: int = STREAM_CHUNK_SIZE,
+                 suffix: str = PARTS_SUFFIX):
+        self.path = file_path + suffix
+        self.total = total
+        self.chunk_size = chunk_size
+        self.count = -(-total // chunk_size)
+        self.bits = bytearray(-(-self.count // 8))
+        self.meta = {}
+        self.done = 0
+        self._unsaved = 0
+
+    def load(self, file_path: str) -> bool:
+        """Restore a saved bitmap; False if there is none or it does not match the file"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            bits = base64.b64decode(state['bitmap'])
+            valid = (
+                state['size'] == self.total
+                and state['chunk_size'] == self.chunk_size
+                and len(bits) == len(self.bits)
+                and os.path.getsize(file_path) == self.total
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        if not valid:
+            return False
+
+        self.bits = bytearray(bits)
+        self.meta = state.get('meta') or {}
+        self.done = sum(self.has(index) for index in range(self.count))
+        return True
+
+    def has(self, index: int) -> bool:
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def mark(self, index: int) -> bool:
+        """Record a finished chunk; True when the bitmap is due to be saved"""
+        if not self.has(index):
+            self.bits[index >> 3] |= 1 << (index & 7)
+            self.done += 1
+            self._unsaved += 1
+        return self._unsaved >= BITMAP_SAVE_INTERVAL
+
+    def save(self) -> None:
+        # Snapshot first: uploads keep marking parts on the event loop meanwhile
+        state = {
+            'size': self.total,
+            'chunk_size': self.chunk_size,
+            'bitmap': base64.b64encode(bytes(self.bits)).decode(),
+            'meta': dict(self.meta)
+        }
+        self._unsaved = 0
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def discard(self) -> None:
+        for path in (self.path, self.path + ".tmp"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @property
+    def complete(self) -> bool:
+        return self.done == self.count
+
+    @property
+    def done_bytes(self) -> int:
+        return min(self.done * self.chunk_size, self.total)
+
+    def first_missing(self) -> int:
+        return next((index for index in range(self.count) if not self.has(index)), self.count)
+
+    def missing_runs(self) -> List[Tuple[int, int]]:
+        """(first chunk, chunk count) of every gap, in file order"""
+        runs = []
+        index = self.first_missing()
+        while index < self.count:
+            end = index
+            while end < self.count and not self.has(end):
+                end += 1
+            runs.append((index, end - index))
+            index = end
+            while index < self.count and self.has(index):
+                index += 1
+        return runs
+
+def _open_sparse(file_path: str, total: int, resumed: bool) -> BinaryIO:
+    """Open a download file for random writes, sizing a new one to ``total`` bytes"""
+    f = open(file_path, 'r+b' if resumed else 'w+b', buffering=0)
+    if not resumed:
+        try:
+            # Sparse until written; preallocated where the filesystem supports it
+            f.truncate(total)
+            preallocate(f, total)
+        except Exception:
+            f.close()
+            raise
+    return f
+
+def _hash_prefix(f: BinaryIO, hasher: ChunkHasher, length: int) -> None:
+    """Feed the first ``length`` bytes already on disk to the hasher"""
+    f.seek(0)
+    while length > 0:
+        chunk = f.read(min(HASH_READ_SIZE, length))
+        if not chunk:
+            break
+        hasher.consume(chunk)
+        length -= len(chunk)
+
+async def refresh_message(client: Client, message: Message) -> Message:
+    """
+    Fetch a message again, which renews the file reference of its media
+
+    Telegram's file references expire; a download that stalls on an
+    expired one only needs the message re-read to continue.
+    """
+    fresh = await client.get_messages(message.chat.id, message.id)
+    if not fresh or fresh.empty or not (fresh.document or fresh.video or fresh.audio):
+        raise DownloadError("The source message is no longer available")
+    return fresh
+
+async def _download_sequential(client: Client, message: Message, file_obj: BinaryIO,
+                               algorithms: List[str], progress: Optional[Callable],
+                               progress_args: tuple) -> Optional[Dict[str, str]]:
+    """Stream into an in-memory buffer (or a file of unknown size) from the start"""
+    media = message.document or message.video or message.audio
+    total = getattr(media, 'file_size', 0) or 0
+    loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hasher")
+    pending = deque()
+    received = 0
+    hasher = ChunkHasher(file_obj, algorithms)
+
+    try:
+        async for chunk in client.stream_media(message):
+            pending.append(loop.run_in_executor(executor, hasher.consume, chunk))
+            if len(pending) >= MAX_PENDING_CHUNKS:
+                await pending.popleft()
+
+            received += len(chunk)
+            if progress:
+                await progress(received, total, *progress_args)
+
+        while pending:
+            await pending.popleft()
+        return hasher.digests()
+
+    except StopTransmission:
+        return None
+
+    finally:
+        # Never hand back the buffer under a write still running in the worker
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        executor.shutdown(wait=False)
+
+async def _download_resumable(client: Client, message: Message, file_path: str,
+                              algorithms: List[str], progress: Optional[Callable],
+                              progress_args: tuple) -> Optional[Dict[str, str]]:
+    """Fetch the chunks a file on disk is missing, retrying until it is complete"""
+    media = message.document or message.video or message.audio
+    total = media.file_size
+    loop = asyncio.get_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="hasher")
+    pending = deque()
+
+    chunk_map = ChunkMap(file_path, total)
+    resumed = await run_fs(chunk_map.load, file_path)
+    f = await run_fs(_open_sparse, file_path, total, resumed)
+    hasher = ChunkHasher(None, algorithms)
+
+    # Digests are computed on the fly for as long as chunks arrive in file order
+    hashed = 0
+    in_order = True
+
+    def store(index: int, chunk: bytes, feed: bool) -> None:
+        os.pwrite(f.fileno(), chunk, index * STREAM_CHUNK_SIZE)
+        if feed:
+            hasher.consume(chunk)
+        if chunk_map.mark(index):
+            chunk_map.save()
+
+    async def drain() -> None:
+        results = await asyncio.gather(*pending, return_exceptions=True)
+        pending.clear()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    try:
+        if resumed:
+            logger.info(
+                f"Resuming download of {file_path}: "
+                f"{humanbytes(chunk_map.done_bytes)} of {humanbytes(total)} already on disk"
+            )
+            if algorithms:
+                hashed = min(chunk_map.first_missing() * STREAM_CHUNK_SIZE, total)
+                await loop.run_in_executor(executor, _hash_prefix, f, hasher, hashed)
+
+        failures = 0
+        while not chunk_map.complete:
+            start, count = chunk_map.missing_runs()[0]
+            before = chunk_map.done
+            received = chunk_map.done_bytes
+            index = start
+
+            try:
+                async for chunk in client.stream_media(message, limit=count, offset=start):
+                    feed = in_order and index * STREAM_CHUNK_SIZE == hashed
+                    if feed:
+                        hashed += len(chunk)
+                    else:
+                        in_order = False
+                    pending.append(loop.run_in_executor(executor, store, index, chunk, feed))
+                    if len(pending) >= MAX_PENDING_CHUNKS:
+                        await pending.popleft()
+
+                    index += 1
+                    received += len(chunk)
+                    if progress:
+                        await progress(min(received, total), total, *progress_args)
+                await drain()
+
+            except StopTransmission:
+                raise
+            except FloodWait as e:
+                await drain()
+                logger.warning(f"Download of {file_path} rate limited, waiting {e.value}s")
+                await asyncio.sleep(e.value)
+            except (OSError, DownloadError):
+                # Local disk trouble is not fixed by downloading again
+                raise
+            except Exception as e:
+                await drain()
+                logger.warning(f"Download of {file_path} interrupted at {humanbytes(chunk_map.done_bytes)}: {e}")
+
+            # Pyrogram ends the stream early (rather than raising) on most
+            # errors, an expired file reference included
+            if index - start >= count or chunk_map.complete:
+                continue
+
+            failures = 0 if chunk_map.done > before else failures + 1
+            if failures > Config.DOWNLOAD_RETRIES:
+                raise DownloadError(
+                    f"Download stopped at {humanbytes(chunk_map.done_bytes)} of {humanbytes(total)} "
+                    f"after {Config.DOWNLOAD_RETRIES} retries"
+                )
+            await run_fs(chunk_map.save)
+            await asyncio.sleep(min(2 ** failures, 30))
+            try:
+                message = await refresh_message(client, message)
+            except DownloadError:
+                raise
+            except Exception as e:
+                logger.warning(f"Could not refresh source message of {file_path}: {e}")
+
+        digests = hasher.digests()
+        if algorithms and not in_order:
+            # Chunks were filled in out of order; hash the finished file instead
+            digests = await loop.run_in_executor(executor, _hash_file, file_path, algorithms)
+        await run_fs(chunk_map.discard)
+        return digests
+
+    except StopTransmission:
+        return None
+
+    finally:
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if not chunk_map.complete:
+            try:
+                await run_fs(chunk_map.save)
+            except OSError as e:
+                logger.error(f"Could not save resume state of {file_path}: {e}")
+        f.close()
+        executor.shutdown(wait=False)
+
+async def download_with_hashes(client: Client, message: Message, file_path: Union[str, BinaryIO],
+                               algorithms: Iterable[str], progress: Optional[Callable] = None,
+                               progress_args: tuple = ()) -> Optional[Dict[str, str]]:
+    """
+    Download a message's media while hashing it on the fly
+
+    Chunks from ``stream_media`` are written and hashed in a dedicated
+    worker thread, in order, while the next chunk is being fetched, so no
+    second read of the file is needed afterwards.
+
+    Downloads to a path are resumable: the file is sized up front and a
+    chunk bitmap (see ChunkMap) records what has been written. Interrupted
+    streams are retried for the missing ranges only, re-reading the source
+    message for a fresh file reference in between; if the download still
+    fails, the file and bitmap stay behind and calling this again with the
+    same path (even after a restart) continues from them.
+
+    Args:
+        client (Client): Pyrogram client
+        message (Message): Message carrying the document/video/audio
+        file_path (str | file object): Destination path, or an in-memory buffer
+        algorithms (iterable): Any of HASH_ALGORITHMS (may be empty)
+        progress (callable): Pyrogram-style async progress callback
+        progress_args (tuple): Extra arguments for the progress callback
+
+    Returns:
+        Dict of hex digests, or None if the transfer was stopped
+
+    Raises:
+        DownloadError: If the download made no progress after DOWNLOAD_RETRIES attempts
+    """
+    media = message.document or message.video or message.audio
+    algorithms = list(algorithms)
+
+    if isinstance(file_path, str) and getattr(media, 'file_size', 0):
+        return await _download_resumable(client, message, file_path, algorithms, progress, progress_args)
+
+    if isinstance(file_path, str):
+        with open(file_path, 'wb') as f:
+            return await _download_sequential(client, message, f, algorithms, progress, progress_args)
+    return await _download_sequential(client, message, file_path, algorithms, progress, progress_args)
+
+def _hash_file(file_path: str, algorithms: List[str]) -> Dict[str, str]:
+    hasher = ChunkHasher(None, algorithms)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_READ_SIZE), b''):
+            hasher.consume(chunk)
+    return hasher.digests()
+
+async def hash_file(file_path: str, algorithms: Iterable[str]) -> Dict[str, str]:
+    """Hash a file on disk on the filesystem pool (used when a file changed after download)"""
+    return await run_fs(_hash_file, file_path, list(algorithms))
@@ -0,0 +1,190 @@
+# utils/uploads.py - Resumable Uploads That Retry Only the Failed Parts
+import asyncio
+import os
+import time
+import logging
+from typing import Optional, Callable, Awaitable, BinaryIO
+from pyrogram import raw
+from pyrogram.errors import FloodWait, InternalServerError, ServiceUnavailable, FilePartMissing
+from pyrogram.session import Session
+from Bot.config import Config
+from utils.helpers import run_fs, get_file_size
+from utils.transfer import ChunkMap
+
+logger = logging.getLogger(__name__)
+
+# Telegram's upload part size (512 KB, the largest it accepts)
+UPLOAD_PART_SIZE = 512 * 1024
+
+# Files above this go up as SaveBigFilePart; smaller ones need an MD5 and use Pyrogram's path
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+# Suffix of the acknowledged-parts sidecar next to a file being uploaded
+UPLOAD_STATE_SUFFIX = ".upload"
+
+# Failures a retry can fix; anything else (bad file id, no rights, file too big) is raised at once
+TRANSIENT_ERRORS = (
+    FloodWait, InternalServerError, ServiceUnavailable, FilePartMissing, TimeoutError, ConnectionError
+)
+
+class UploadError(Exception):
+    """Raised when an upload part keeps failing after retrying"""
+    pass
+
+def _load_state(file_path: str, size: int, mtime: int) -> ChunkMap:
+    """Saved upload state for this exact file, or a fresh one"""
+    parts = ChunkMap(file_path, size, chunk_size=UPLOAD_PART_SIZE, suffix=UPLOAD_STATE_SUFFIX)
+    if parts.load(file_path):
+        # Telegram forgets uploaded parts after a while, and a changed file needs a new upload
+        fresh = time.time() - parts.meta.get('started', 0) < Config.PARTIAL_KEEP_HOURS * 3600
+        if parts.meta.get('mtime') == mtime and 'file_id' in parts.meta and fresh:
+            return parts
+    return ChunkMap(file_path, size, chunk_size=UPLOAD_PART_SIZE, suffix=UPLOAD_STATE_SUFFIX)
+
+async def upload_big_file(client, file_path: str, progress: Optional[Callable] = None,
+                          progress_args: tuple = ()) -> raw.types.InputFileBig:
+    """
+    Upload a large file part by part, retrying and persisting each part
+
+    The upload's file_id and the indices of the SaveBigFilePart calls
+    Telegram acknowledged are kept in a ``<file>.upload`` sidecar (see
+    ChunkMap). Failed parts are put back in the queue and retried with
+    backoff while the others continue; calling this again for the same,
+    unchanged file (a retried send, or the job re-run after a restart)
+    only uploads the parts that are still missing.
+
+    Args:
+        client (Client): Pyrogram client
+        file_path (str): File to upload
+        progress (callable): Pyrogram-style async progress callback
+        progress_args (tuple): Extra arguments for the progress callback
+
+    Returns:
+        InputFileBig: Uploaded file, ready for a send_* call
+
+    Raises:
+        UploadError: If a part failed UPLOAD_RETRIES times
+        Exception: Any non-transient error, on its first occurrence
+        StopTransmission: If the progress callback stopped the upload
+    """
+    stat = await run_fs(os.stat, file_path)
+    parts = await run_fs(_load_state, file_path, stat.st_size, stat.st_mtime_ns)
+    if parts.meta:
+        logger.info(f"Resuming upload of {file_path}: {parts.done} of {parts.count} parts already acknowledged")
+    else:
+        parts.meta = {'file_id': client.rnd_id(), 'mtime': stat.st_mtime_ns, 'started': time.time()}
+    file_id = parts.meta['file_id']
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(parts.count):
+        if not parts.has(index):
+            queue.put_nowait(index)
+
+    attempts = {}
+    save_lock = asyncio.Lock()
+    error: Optional[BaseException] = None
+    f: BinaryIO = await run_fs(open, file_path, 'rb')
+    session = Session(
+        client, await client.storage.dc_id(), await client.storage.auth_key(),
+        await client.storage.test_mode(), is_media=True
+    )
+
+    async def upload_part(index: int) -> None:
+        nonlocal error
+        chunk = await run_fs(os.pread, f.fileno(), UPLOAD_PART_SIZE, index * UPLOAD_PART_SIZE)
+        try:
+            await session.invoke(raw.functions.upload.SaveBigFilePart(
+                file_id=file_id, file_part=index, file_total_parts=parts.count, bytes=chunk
+            ))
+        except FloodWait as e:
+            await asyncio.sleep(e.value)
+            queue.put_nowait(index)
+            return
+        except TRANSIENT_ERRORS as e:
+            attempts[index] = attempts.get(index, 0) + 1
+            if attempts[index] > Config.UPLOAD_RETRIES:
+                error = UploadError(f"Part {index} of {os.path.basename(file_path)} failed {attempts[index]} times: {e}")
+                return
+            logger.warning(f"Upload part {index} of {file_path} failed (attempt {attempts[index]}): {e}")
+            await asyncio.sleep(min(2 ** attempts[index], 30))
+            queue.put_nowait(index)
+            return
+
+        if parts.mark(index):
+            async with save_lock:
+                await run_fs(parts.save)
+        if progress:
+            await progress(parts.done_bytes, parts.total, *progress_args)
+
+    async def worker() -> None:
+        nonlocal error
+        while error is None:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await upload_part(index)
+            except Exception as e:
+                error = error or e
+                return
+
+    try:
+        if queue.qsize():
+            await session.start()
+            try:
+                # A part put back for a retry may land after its worker saw an
+                # empty queue, so keep going until nothing is left
+                while not queue.empty() and error is None:
+                    await asyncio.gather(*(worker() for _ in range(Config.UPLOAD_WORKERS)))
+            finally:
+                await session.stop()
+
+        if error is not None:
+            raise error
+        return raw.types.InputFileBig(id=file_id, parts=parts.count, name=os.path.basename(file_path))
+
+    finally:
+        f.close()
+        try:
+            async with save_lock:
+                await run_fs(parts.save)
+        except OSError as e:
+            logger.error(f"Could not save upload state of {file_path}: {e}")
+
+async def send_with_retry(send: Callable[[], Awaitable], cancelled: Callable[[], bool] = lambda: False):
+    """
+    Run a send_* call, retrying transient failures with backoff
+
+    Since large files go through upload_big_file, a retry only uploads the
+    parts Telegram has not acknowledged yet before sending again. Errors
+    outside TRANSIENT_ERRORS are raised on the first attempt.
+
+    Args:
+        send (callable): Returns a new send_* coroutine per attempt
+        cancelled (callable): Stops retrying when True
+
+    Returns:
+        Whatever the send call returned (None if the upload was stopped)
+    """
+    for attempt in range(Config.UPLOAD_RETRIES + 1):
+        try:
+            return await send()
+        except TRANSIENT_ERRORS as e:
+            if cancelled() or attempt == Config.UPLOAD_RETRIES:
+                raise
+            delay = e.value if isinstance(e, FloodWait) else min(2 ** attempt, 30)
+            logger.warning(f"Upload failed (attempt {attempt + 1}), retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+
+class ResumableUploadMixin:
+    """Client mixin sending large files from disk through upload_big_file"""
+
+    async def save_file(self, path, file_id: int = None, file_part: int = 0,
+                        progress: Callable = None, progress_args: tuple = ()):
+        # Pyrogram passes file_id to re-send a single part Telegram reported missing
+        if isinstance(path, str) and file_id is None and await get_file_size(path) > BIG_FILE_SIZE:
+            return await upload_big_file(self, path, progress, progress_args)
+        return await super().save_file(
+            path, file_id=file_id, file_part=file_part, progress=progress, progress_args=progress_args
+        )